@@ -0,0 +1,59 @@
+"""serialize_entities' dispatch table against the isinstance chain it replaced.
+
+Times both on the entity types the old chain handled, so they build the
+same records. Wall-clock comparisons are too noisy for the test suite.
+
+    python -m benchmarks.entities
+    python -m benchmarks.entities --number 10000
+"""
+import timeit
+
+import click
+from telethon.tl import types
+
+
+def isinstance_chain(entities):
+    """serialize_entities before the dispatch table"""
+    if not entities:
+        return []
+    result = []
+    for entity in entities:
+        if isinstance(entity, types.MessageEntityBold):
+            result.append({"type": "bold", "offset": entity.offset, "length": entity.length})
+        elif isinstance(entity, types.MessageEntityItalic):
+            result.append({"type": "italic", "offset": entity.offset, "length": entity.length})
+        elif isinstance(entity, types.MessageEntityCode):
+            result.append({"type": "code", "offset": entity.offset, "length": entity.length})
+        elif isinstance(entity, types.MessageEntityPre):
+            result.append({"type": "pre", "offset": entity.offset, "length": entity.length})
+        elif isinstance(entity, types.MessageEntityTextUrl):
+            result.append({"type": "text_url", "offset": entity.offset, "length": entity.length, "url": entity.url})
+    return result
+
+
+# Only types both cover, so both build the same output
+ENTITIES = [types.MessageEntityBold(0, 4), types.MessageEntityItalic(5, 4), types.MessageEntityCode(10, 3),
+            types.MessageEntityPre(14, 20, language=""),
+            types.MessageEntityTextUrl(35, 4, url="https://example.com")] * 4
+
+
+@click.command()
+@click.option('--number', type=int, default=2000, show_default=True, help='Calls per timing run')
+@click.option('--repeat', type=int, default=7, show_default=True, help='Timing runs; the best is reported')
+def main(number: int, repeat: int):
+    """Time entity serialization by dispatch table and by isinstance chain"""
+    from tg_export.cli import serialize_entities
+
+    if serialize_entities(ENTITIES) != isinstance_chain(ENTITIES):
+        raise click.ClickException("The two serializers disagree")
+
+    timings = {}
+    for label, function in (("dispatch table", serialize_entities), ("isinstance chain", isinstance_chain)):
+        best = min(timeit.repeat(lambda: function(ENTITIES), number=number, repeat=repeat))
+        timings[label] = best / number / len(ENTITIES) * 1e9
+        click.echo(f"{label:<18} {timings[label]:8.1f} ns per entity")
+    click.echo(f"Dispatch table: {timings['isinstance chain'] / timings['dispatch table']:.2f}x the chain's speed")
+
+
+if __name__ == "__main__":
+    main()
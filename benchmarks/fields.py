@@ -0,0 +1,78 @@
+"""Where scanning for fields stops beating a full parse in ExportReader.fields.
+
+For JSON exports, fields() finds up to reader.SCAN_FIELDS keys with one
+regex each and parses the whole line only past that. This times both
+paths on a synthetic export for 1..7 of clean's fields, so SCAN_FIELDS
+can be checked against the crossover on a given machine.
+
+    python -m benchmarks.fields
+    python -m benchmarks.fields --messages 50000 --format compact
+"""
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import click
+
+from .synthetic import SyntheticClient
+
+# clean's fields, in the order the timings add them
+FIELDS = ('msg_id', 'ts', 'sender_id', 'sender_username', 'reply_to', 'text', 'media_type')
+
+
+def make_export(path: Path, messages: int, record_format: str):
+    from tg_export import cli
+
+    cli.MIN_DELAY = cli.MAX_DELAY = 0
+    client = SyntheticClient(messages)
+    asyncio.run(cli.dump_messages(client, client.peer, path, reverse=True, record_format=record_format))
+
+
+def time_fields(path: Path, names: tuple, scan: bool, repeat: int) -> float:
+    """Best time in seconds to read names from every record, by scanning or by parsing"""
+    from tg_export import reader as reader_module
+
+    with reader_module.ExportReader(path) as reader:
+        raws = [raw for offset, raw in reader]
+        best = float("inf")
+        with patch.object(reader_module, "SCAN_FIELDS", len(FIELDS) if scan else 0):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for raw in raws:
+                    reader.fields(raw, names)
+                best = min(best, time.perf_counter() - start)
+        del raws
+    return best
+
+
+@click.command()
+@click.option('--messages', type=int, default=20000, show_default=True, help='Records in the synthetic export')
+@click.option('--format', 'record_format', type=click.Choice(['jsonl', 'compact']), default='jsonl', show_default=True)
+@click.option('--repeat', type=int, default=5, show_default=True, help='Runs per case; the best is reported')
+def main(messages: int, record_format: str, repeat: int):
+    """Time field scanning against full parsing for 1..7 fields"""
+    from tg_export.reader import SCAN_FIELDS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / f"export.{record_format}"
+        with patch("click.echo"):
+            make_export(path, messages, record_format)
+
+        click.echo(f"{'fields':>6} {'scan µs':>9} {'parse µs':>9}  faster")
+        crossover = None
+        for n in range(1, len(FIELDS) + 1):
+            names = FIELDS[:n]
+            scan = time_fields(path, names, True, repeat) / messages * 1e6
+            parse = time_fields(path, names, False, repeat) / messages * 1e6
+            if crossover is None and scan >= parse:
+                crossover = n
+            click.echo(f"{n:>6} {scan:>9.2f} {parse:>9.2f}  {'scan' if scan < parse else 'parse'}")
+
+    click.echo(f"Scanning stops paying off at {crossover or 'more than ' + str(len(FIELDS))} fields; "
+               f"SCAN_FIELDS is {SCAN_FIELDS}")
+
+
+if __name__ == "__main__":
+    main()
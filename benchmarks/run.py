@@ -0,0 +1,235 @@
+"""Offline scale benchmarks for the export pipeline.
+
+Each scenario runs in its own subprocess against a SyntheticClient so peak
+RSS is measured per run. Results are compared with benchmarks/baseline.json.
+
+    python -m benchmarks.run --sizes 10k,100k
+    python -m benchmarks.run --scenarios dump,clean --sizes 1M --flood-every 50000
+    python -m benchmarks.run --save-baseline
+"""
+import asyncio
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import click
+from telethon.errors import FloodWaitError
+
+from .synthetic import SyntheticClient
+
+SCENARIOS = ["dump", "quick", "clean", "web"]
+BASELINE_FILE = Path(__file__).parent / "baseline.json"
+CHAT_URL = "https://t.me/c/1234567890"
+
+
+def parse_size(value: str) -> int:
+    """Parse sizes like 10k or 1M"""
+    value = value.strip().lower()
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    if value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+async def _dump_all(client, output_file: Path):
+    """Full ascending dump, resuming after injected flood waits like 'dump' does"""
+    from tg_export import cli
+
+    last_id = None
+    while True:
+        try:
+            await cli.dump_messages(client, client.peer, output_file, min_id=last_id, reverse=True)
+            return
+        except FloodWaitError as e:
+            await asyncio.sleep(e.seconds)
+            last_id = cli.get_last_message_id(output_file)
+
+
+def _no_throttle():
+    from tg_export import cli, quick_export
+    cli.MIN_DELAY = cli.MAX_DELAY = 0
+    quick_export.BATCH_DELAY = 0
+
+
+def bench_dump(size: int, workdir: Path, **client_options) -> dict:
+    _no_throttle()
+    client = SyntheticClient(size, **client_options)
+    output_file = workdir / "dump.jsonl"
+
+    start = time.perf_counter()
+    asyncio.run(_dump_all(client, output_file))
+    return {"seconds": time.perf_counter() - start, "bytes_written": output_file.stat().st_size}
+
+
+def bench_clean(size: int, workdir: Path, **client_options) -> dict:
+    from tg_export.clean_export import convert_to_clean_format
+
+    _no_throttle()
+    input_file = workdir / "dump.jsonl"
+    asyncio.run(_dump_all(SyntheticClient(size, **client_options), input_file))
+    output_file = workdir / "clean.txt"
+
+    start = time.perf_counter()
+    convert_to_clean_format(input_file, output_file, filter_bots=True)
+    return {"seconds": time.perf_counter() - start, "bytes_written": output_file.stat().st_size}
+
+
+def _quick_environment(size: int, workdir: Path, client_options: dict):
+    """Point quick_export at a SyntheticClient inside workdir"""
+    from tg_export import quick_export
+    from tg_export.sessions import DEFAULT_SESSION
+
+    _no_throttle()
+    os.chdir(workdir)
+    DEFAULT_SESSION.write_text("")
+    client = SyntheticClient(size, **client_options)
+    hours = math.ceil(size * client.interval / 3600) + 1
+    env = patch.dict(os.environ, {"TELEGRAM_API_ID": "1", "TELEGRAM_API_HASH": "synthetic"})
+    factory = patch.object(quick_export, "TelegramClient", lambda *args, **kwargs: client)
+    return env, factory, hours
+
+
+def _exported_bytes(workdir: Path) -> int:
+    return sum(p.stat().st_size for p in (workdir / "exports").rglob("*") if p.is_file())
+
+
+def bench_quick(size: int, workdir: Path, **client_options) -> dict:
+    from tg_export import quick_export
+
+    env, factory, hours = _quick_environment(size, workdir, client_options)
+    with env, factory:
+        start = time.perf_counter()
+        asyncio.run(quick_export.quick_export(CHAT_URL, hours, clean=True))
+        elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "bytes_written": _exported_bytes(workdir)}
+
+
+def bench_web(size: int, workdir: Path, **client_options) -> dict:
+    from tg_export import quick_export
+
+    env, factory, hours = _quick_environment(size, workdir, client_options)
+    with env, factory:
+        client = quick_export.app.test_client()
+        start = time.perf_counter()
+        response = client.post("/export", json={"chat_url": CHAT_URL, "hours": hours, "clean": True})
+        assert response.status_code == 200, response.get_json()
+        # The export thread resets the status when it starts, so wait for a result
+        while True:
+            status = client.get("/status").get_json()
+            if not status["running"] and (status.get("file_path") or status.get("error")):
+                break
+            time.sleep(0.01)
+        if status.get("error"):
+            raise RuntimeError(status["error"])
+        download = client.get(f"/download/{Path(status['file_path']).name}")
+        assert download.status_code == 200, download.status
+        downloaded = len(download.get_data())
+        elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "bytes_written": downloaded}
+
+
+def bench_replay(size: int, workdir: Path, cassette: str, chat_url: str) -> dict:
+    """Dump from a recorded cassette; size is ignored, the recording decides"""
+    from tg_export.cassette import ReplayClient
+    from tg_export.cli import run_export
+
+    output_file = workdir / "replay.jsonl"
+    start = time.perf_counter()
+    asyncio.run(run_export(lambda: ReplayClient(Path(cassette)), chat_url, output_file, None, None, delays=(0, 0)))
+    elapsed = time.perf_counter() - start
+    with open(output_file, 'rb') as f:
+        messages = sum(1 for _ in f)
+    return {"seconds": elapsed, "bytes_written": output_file.stat().st_size, "messages": messages}
+
+
+BENCHMARKS = {"dump": bench_dump, "quick": bench_quick, "clean": bench_clean, "web": bench_web, "replay": bench_replay}
+
+
+def run_worker(scenario: str, size: int, options: dict) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        result = BENCHMARKS[scenario](size, Path(tmp), **options)
+    result.setdefault("messages", size)
+    result.update({
+        "scenario": scenario,
+        "msgs_per_sec": result["messages"] / result["seconds"] if result["seconds"] else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    return result
+
+
+def run_isolated(scenario: str, size: int, options: dict) -> dict:
+    """Run one benchmark in a fresh interpreter so peak RSS is its own"""
+    cmd = [sys.executable, "-m", "benchmarks.run", "--worker", scenario, "--sizes", str(size),
+           "--options", json.dumps(options)]
+    proc = subprocess.run(cmd, cwd=Path(__file__).parent.parent, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise click.ClickException(f"{scenario} @ {size} failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(result: dict, baseline: dict) -> str:
+    base = baseline.get(f"{result['scenario']}:{result['messages']}")
+    if not base or not base.get("msgs_per_sec"):
+        return "-"
+    return f"{result['msgs_per_sec'] / base['msgs_per_sec']:.2f}x"
+
+
+@click.command()
+@click.option('--scenarios', default=",".join(SCENARIOS), help='Comma-separated scenarios to run')
+@click.option('--sizes', default="10k,100k", help='Comma-separated message counts (e.g. 10k,1M)')
+@click.option('--flood-every', type=int, help='Inject a FloodWaitError after every N messages')
+@click.option('--page-latency', type=float, default=0.0, help='Simulated seconds per API page')
+@click.option('--baseline', 'baseline_path', type=click.Path(), default=str(BASELINE_FILE), help='Baseline results file')
+@click.option('--save-baseline', is_flag=True, help='Store these results as the new baseline')
+@click.option('--cassette', type=click.Path(exists=True), help='Also benchmark a dump replayed from this recording')
+@click.option('--chat-url', default=CHAT_URL, help='Chat URL the cassette was recorded with')
+@click.option('--worker', hidden=True)
+@click.option('--options', 'worker_options', hidden=True, default="{}")
+def main(scenarios, sizes, flood_every, page_latency, baseline_path, save_baseline, cassette, chat_url, worker, worker_options):
+    """Benchmark dump, quick, clean and the web endpoints on synthetic chats"""
+    if worker:
+        click.echo(json.dumps(run_worker(worker, parse_size(sizes), json.loads(worker_options))))
+        return
+
+    options = {"flood_every": flood_every, "page_latency": page_latency}
+    baseline_file = Path(baseline_path)
+    baseline = json.loads(baseline_file.read_text()) if baseline_file.exists() else {}
+
+    runs = [(scenario, parse_size(size), options) for size in sizes.split(",") for scenario in scenarios.split(",")]
+    if cassette:
+        runs.append(("replay", 0, {"cassette": str(Path(cassette).resolve()), "chat_url": chat_url}))
+
+    results = []
+    click.echo(f"{'scenario':<8} {'messages':>10} {'msgs/sec':>12} {'peak RSS':>10} {'written':>12} {'vs base':>8}")
+    for scenario, size, run_options in runs:
+        result = run_isolated(scenario, size, run_options)
+        results.append(result)
+        click.echo(f"{scenario:<8} {result['messages']:>10} {result['msgs_per_sec']:>12.0f} "
+                   f"{result['peak_rss_mb']:>8.1f}MB {result['bytes_written'] / 1024 / 1024:>10.2f}MB "
+                   f"{compare(result, baseline):>8}")
+
+    if save_baseline:
+        for result in results:
+            baseline[f"{result['scenario']}:{result['messages']}"] = {
+                key: result[key] for key in ("msgs_per_sec", "peak_rss_mb", "bytes_written")
+            }
+        baseline_file.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        click.echo(f"\nBaseline saved to {baseline_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Startup time of the tg_export console entry point.
+
+Cron jobs and shell pipelines run small commands like `tg_export clean`
+many times a day, so interpreter start plus imports dominate. Each case
+is timed over several fresh interpreters and its imports are listed with
+-X importtime to catch heavy modules creeping back in.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 20 --max-ms 150
+"""
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import click
+
+ROOT = Path(__file__).parent.parent
+CASES = {
+    "--help": ["--help"],
+    "clean --help": ["clean", "--help"],
+    "dump --help": ["dump", "--help"],
+}
+# Commands that must start without loading these
+LIGHT_CASES = {"--help", "clean --help"}
+HEAVY_MODULES = ("telethon", "flask", "dotenv")
+
+
+def command(args):
+    return [sys.executable, "-m", "tg_export.main", *args]
+
+
+def time_startup(args, runs: int) -> float:
+    """Median wall time in milliseconds over fresh interpreters"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command(args), cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def time_python(runs: int) -> float:
+    """Median bare interpreter start, for reference"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def imported_modules(args) -> set:
+    """Top-level package names imported while running a command"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *command(args)[1:]], cwd=ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[1].strip()
+            modules.add(name.split(".")[0])
+    return modules
+
+
+@click.command()
+@click.option('--runs', type=int, default=10, help='Interpreter starts per case')
+@click.option('--max-ms', type=float, help='Fail if a light command takes longer than this')
+def main(runs, max_ms):
+    """Time tg_export startup for --help, clean and dump"""
+    python_ms = time_python(runs)
+    click.echo(f"{'case':<14} {'median':>9} {'imports':>8}  heavy modules")
+    click.echo(f"{'(python)':<14} {python_ms:>7.1f}ms")
+
+    failed = []
+    for name, args in CASES.items():
+        elapsed = time_startup(args, runs)
+        modules = imported_modules(args)
+        heavy = sorted(m for m in HEAVY_MODULES if m in modules)
+        click.echo(f"{name:<14} {elapsed:>7.1f}ms {len(modules):>8}  {', '.join(heavy) or '-'}")
+        if name in LIGHT_CASES and (heavy or (max_ms and elapsed > max_ms)):
+            failed.append(name)
+
+    if failed:
+        raise click.ClickException(f"Startup regressed for: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Synthetic stand-in for TelegramClient that generates realistic message streams.
+
+Messages are derived from their id and a seed, so streams of any length
+are reproducible without holding them in memory.
+"""
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import (
+    MessageEntityBold, MessageEntityCode, MessageEntityHashtag, MessageEntityItalic, MessageEntityMention,
+    MessageEntityPre, MessageEntityTextUrl, MessageEntityUrl, PeerChannel,
+)
+
+WORDS = (
+    "the a gm ser wen launch token chart pump dump lol ok based ngmi wagmi alpha fren "
+    "привет мир 你好 🚀 🔥 check this out deploy fix bug merge release update today"
+).split()
+
+# Entity constructors weighted roughly by how often they show up in group chats
+ENTITY_TYPES = [
+    (MessageEntityBold, 3), (MessageEntityItalic, 2), (MessageEntityCode, 2), (MessageEntityUrl, 3),
+    (MessageEntityMention, 3), (MessageEntityHashtag, 1), (MessageEntityTextUrl, 2), (MessageEntityPre, 1),
+]
+
+TEMPLATES = 4096  # Distinct message bodies cycled through the stream
+
+
+class SyntheticSender:
+    __slots__ = ("id", "username")
+
+    def __init__(self, user_id, username):
+        self.id = user_id
+        self.username = username
+
+
+class SyntheticMedia:
+    __slots__ = ("id",)
+
+    def __init__(self, media_id):
+        self.id = media_id
+
+
+class SyntheticReply:
+    __slots__ = ("reply_to_msg_id",)
+
+    def __init__(self, msg_id):
+        self.reply_to_msg_id = msg_id
+
+
+class SyntheticMessage:
+    """Carries the attributes of telethon's Message that the exporters read"""
+    __slots__ = ("id", "date", "peer_id", "sender", "sender_id", "reply_to", "text", "entities",
+                 "photo", "video", "document")
+
+
+def _make_entity(cls, offset, length):
+    if cls is MessageEntityTextUrl:
+        return cls(offset, length, url="https://example.com/x")
+    if cls is MessageEntityPre:
+        return cls(offset, length, language="python")
+    return cls(offset, length)
+
+
+class SyntheticClient:
+    """Drop-in replacement for the TelegramClient calls made by the exporters.
+
+    messages:      total messages in the chat (ids 1..messages)
+    entity_ratio:  share of messages carrying formatting entities
+    media_ratio:   share of messages with a photo, video or document
+    reply_ratio:   share of messages replying to an earlier one
+    bot_ratio:     share of messages sent by bot accounts
+    flood_every:   raise FloodWaitError after every N messages served
+    page_latency:  simulated network time per page of page_size messages
+    """
+
+    def __init__(self, messages: int = 10_000, entity_ratio: float = 0.2, media_ratio: float = 0.1,
+                 reply_ratio: float = 0.3, bot_ratio: float = 0.05, users: int = 200,
+                 flood_every: Optional[int] = None, flood_seconds: int = 0, page_latency: float = 0.0,
+                 page_size: int = 100, chat_id: int = 1234567890, interval: float = 15.0,
+                 end: Optional[datetime] = None, seed: int = 0):
+        self.total = messages
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+        self.page_latency = page_latency
+        self.page_size = page_size
+        self.interval = interval
+        self.end = end or datetime.now(timezone.utc).replace(microsecond=0)  # Telegram dates are whole seconds
+        self.peer = PeerChannel(chat_id)
+        self.requests = 0
+        self.served = 0
+        self.floods = 0
+
+        rng = random.Random(seed)
+        weighted = [cls for cls, weight in ENTITY_TYPES for _ in range(weight)]
+        self.senders = []
+        for i in range(users):
+            name = f"user{i}_bot" if rng.random() < bot_ratio else (f"user{i}" if rng.random() < 0.9 else None)
+            self.senders.append(SyntheticSender(1000 + i, name))
+
+        self.templates = []
+        for _ in range(TEMPLATES):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 40)))
+            entities = None
+            if rng.random() < entity_ratio:
+                entities = []
+                for _ in range(rng.randint(1, 4)):
+                    offset = rng.randint(0, max(0, len(text) - 1))
+                    entities.append(_make_entity(rng.choice(weighted), offset, rng.randint(1, max(1, len(text) - offset))))
+            media = None
+            if rng.random() < media_ratio:
+                media = rng.choice(("photo", "video", "document"))
+                if rng.random() < 0.5:
+                    text = ""
+            self.templates.append((text, entities, media, rng.random() < reply_ratio))
+
+    def message(self, msg_id: int) -> SyntheticMessage:
+        text, entities, media, is_reply = self.templates[(msg_id * 2654435761) % TEMPLATES]
+        sender = self.senders[(msg_id * 40503) % len(self.senders)]
+        m = SyntheticMessage()
+        m.id = msg_id
+        m.date = self.end - timedelta(seconds=(self.total - msg_id) * self.interval)
+        m.peer_id = self.peer
+        m.sender = sender
+        m.sender_id = sender.id
+        m.reply_to = SyntheticReply(max(1, msg_id - 1 - msg_id % 17)) if is_reply and msg_id > 1 else None
+        m.text = text
+        m.entities = entities
+        m.photo = SyntheticMedia(msg_id) if media == "photo" else None
+        m.video = SyntheticMedia(msg_id) if media == "video" else None
+        m.document = SyntheticMedia(msg_id) if media in ("video", "document") else None
+        return m
+
+    async def start(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def get_entity(self, identifier):
+        return self.peer
+
+    async def get_messages(self, chat, limit=1, offset_date=None, ids=None):
+        if ids is not None:
+            return [self.message(i) if 1 <= i <= self.total else None for i in ids]
+        newest = self.total
+        if offset_date is not None:
+            behind = (self.end - offset_date).total_seconds() / self.interval
+            newest = min(self.total, max(0, self.total - int(behind) - 1))
+        return [self.message(i) for i in range(newest, max(0, newest - limit), -1)]
+
+    async def iter_messages(self, chat, limit=None, min_id=0, max_id=0, reverse=False, offset_date=None, wait_time=None):
+        min_id = min_id or 0
+        high = min(self.total, max_id - 1) if max_id else self.total
+        if offset_date is not None:
+            older = await self.get_messages(chat, offset_date=offset_date)
+            high = min(high, older[0].id if older else 0)
+        ids = range(min_id + 1, high + 1) if reverse else range(high, min_id, -1)
+        if limit is not None:
+            ids = ids[:limit]
+
+        for n, msg_id in enumerate(ids):
+            if n % self.page_size == 0:
+                self.requests += 1
+                if self.page_latency:
+                    await asyncio.sleep(self.page_latency)
+            if self.flood_every and self.served and self.served % self.flood_every == 0 and self.floods < self.served // self.flood_every:
+                self.floods += 1
+                raise FloodWaitError(None, capture=self.flood_seconds)
+            self.served += 1
+            yield self.message(msg_id)
@@ -0,0 +1,90 @@
+"""Minimal stand-ins for Telethon clients and messages used by the tests"""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import PeerChannel
+
+
+def make_message(msg_id, chat_id=1234, username="alice", text=None, date=None, reply_to=None, entities=None):
+    if date is None:
+        date = datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=msg_id)
+    return SimpleNamespace(
+        id=msg_id,
+        date=date,
+        peer_id=PeerChannel(chat_id),
+        sender=SimpleNamespace(username=username) if username else None,
+        sender_id=msg_id % 7 + 1,
+        reply_to=SimpleNamespace(reply_to_msg_id=reply_to) if reply_to else None,
+        text=f"message {msg_id}" if text is None else text,
+        entities=entities,
+        photo=None,
+        video=None,
+        document=None,
+    )
+
+
+class FakeTakeout:
+    """Mimics the proxy returned by TelegramClient.takeout()"""
+
+    def __init__(self, client):
+        self.client = client
+        self.success = None
+
+    async def __aenter__(self):
+        self.client.takeout_started = True
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.success is None:
+            self.success = exc_type is None
+        self.client.takeout_finished = self.success
+
+    def iter_messages(self, *args, **kwargs):
+        return self.client.iter_messages(*args, **kwargs)
+
+
+class FakeClient:
+    """Serves a fixed list of messages like TelegramClient.iter_messages does.
+
+    flood_after raises a FloodWaitError once that many messages have been
+    served, mimicking an account hitting its rate limit mid-export.
+    """
+
+    def __init__(self, messages, flood_after=None, flood_seconds=0):
+        self.messages = sorted(messages, key=lambda m: m.id)
+        self.flood_after = flood_after
+        self.flood_seconds = flood_seconds
+        self.served = 0
+        self.requests = []
+        self.disconnected = False
+        self.takeout_started = False
+        self.takeout_finished = None
+
+    def takeout(self, finalize=True, **kwargs):
+        return FakeTakeout(self)
+
+    async def get_entity(self, identifier):
+        return identifier
+
+    async def get_messages(self, chat, limit=None, offset_date=None, ids=None):
+        if ids is not None:
+            by_id = {m.id: m for m in self.messages}
+            return [by_id.get(i) for i in ids]
+        newest = [m for m in reversed(self.messages) if offset_date is None or m.date < offset_date]
+        return newest[:limit]
+
+    async def iter_messages(self, chat, limit=None, min_id=0, max_id=0, reverse=False, offset_date=None, wait_time=None):
+        self.requests.append({"min_id": min_id, "max_id": max_id, "reverse": reverse, "wait_time": wait_time})
+        selected = [m for m in self.messages if m.id > min_id and (not max_id or m.id < max_id)]
+        if not reverse:
+            selected.reverse()
+        for message in selected[:limit]:
+            if self.flood_after is not None and self.served >= self.flood_after:
+                self.flood_after = None
+                raise FloodWaitError(None, capture=self.flood_seconds)
+            self.served += 1
+            yield message
+
+    async def disconnect(self):
+        self.disconnected = True
@@ -0,0 +1,120 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+from click.testing import CliRunner
+from telethon.errors import FloodWaitError
+from telethon.extensions import markdown
+from telethon.tl import types
+
+from tg_export import cassette as cassette_module, quick_export
+from tg_export.cassette import RecordingClient, ReplayClient, ReplayError, recording_started
+from tg_export.cli import dump_messages
+from tg_export.main import cli
+
+CHANNEL = types.Channel(id=77, title="test", photo=types.ChatPhotoEmpty(), date=None, access_hash=1)
+USERS = {10: types.User(id=10, username="alice", access_hash=2), 11: types.User(id=11, username="bob", access_hash=3)}
+
+
+class TLClient:
+    """Serves real TL messages, like TelegramClient does after a network fetch"""
+
+    parse_mode = markdown
+    _self_id = None
+
+    class _mb_entity_cache:
+        @staticmethod
+        def get(peer_id):
+            return None
+
+    def __init__(self, count, flood_after=None):
+        self.count = count
+        self.flood_after = flood_after
+
+    async def get_entity(self, identifier):
+        return CHANNEL
+
+    async def iter_messages(self, chat, **kwargs):
+        for i in range(self.count, 0, -1):
+            if self.flood_after is not None and self.count - i == self.flood_after:
+                raise FloodWaitError(None, capture=42)
+            message = types.Message(
+                id=i,
+                peer_id=types.PeerChannel(77),
+                date=datetime(2025, 1, 1, 12, i, tzinfo=timezone.utc),
+                message=f"hello {i}",
+                from_id=types.PeerUser(10 + i % 2),
+                entities=[types.MessageEntityBold(0, 5)],
+                reply_to=types.MessageReplyHeader(reply_to_msg_id=i - 1) if i > 1 else None,
+            )
+            message._finish_init(self, USERS, None)
+            yield message
+
+    async def disconnect(self):
+        pass
+
+
+async def export(client, output_file):
+    chat = await client.get_entity("somegroup")
+    count = await dump_messages(client, chat, output_file, delays=(0, 0))
+    await client.disconnect()
+    return count
+
+
+def test_replay_reproduces_export(tmp_path):
+    cassette = tmp_path / "chat.cassette"
+    recorded = tmp_path / "recorded.jsonl"
+    replayed = tmp_path / "replayed.jsonl"
+
+    assert asyncio.run(export(RecordingClient(TLClient(30), cassette), recorded)) == 30
+    assert asyncio.run(export(ReplayClient(cassette), replayed)) == 30
+    assert replayed.read_text() == recorded.read_text()
+    assert '"sender_username": "bob"' in replayed.read_text()
+
+
+def test_replay_raises_recorded_flood_wait(tmp_path):
+    cassette = tmp_path / "chat.cassette"
+
+    async def record_then_close():
+        recorder = RecordingClient(TLClient(30, flood_after=5), cassette)
+        try:
+            await export(recorder, tmp_path / "a.jsonl")
+        finally:
+            await recorder.disconnect()
+
+    with pytest.raises(FloodWaitError):
+        asyncio.run(record_then_close())
+
+    with pytest.raises(FloodWaitError) as e:
+        asyncio.run(export(ReplayClient(cassette), tmp_path / "b.jsonl"))
+    assert e.value.seconds == 42
+    assert len((tmp_path / "b.jsonl").read_text().splitlines()) == 5
+
+
+def test_replay_unknown_call(tmp_path):
+    cassette = tmp_path / "chat.cassette"
+    asyncio.run(export(RecordingClient(TLClient(3), cassette), tmp_path / "a.jsonl"))
+    with pytest.raises(ReplayError):
+        asyncio.run(ReplayClient(cassette).get_entity("othergroup"))
+
+
+def test_replay_keeps_recorded_time_window(tmp_path, monkeypatch):
+    # Recorded at 13:15 on the day of the messages (12:01-12:30), long before now
+    recorded_at = datetime(2025, 1, 1, 13, 15)
+    monkeypatch.setattr(cassette_module.time, "time", lambda: recorded_at.timestamp())
+    cassette = tmp_path / "chat.cassette"
+    asyncio.run(export(RecordingClient(TLClient(30), cassette), tmp_path / "recorded.jsonl"))
+    monkeypatch.undo()
+    assert recording_started(cassette) == recorded_at == ReplayClient(cassette).started
+
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(cli, ["quick", "--chat-url", "https://t.me/somegroup", "--hours", "1",
+                                      "--replay", str(cassette), "--raw"])
+    assert result.exit_code == 0, result.output
+    # The hour before 13:15 holds messages 15-30
+    assert "Exported 16 messages" in result.output
+
+    monkeypatch.setattr(quick_export, "EXPORTS_DIR", tmp_path / "web")
+    raw = asyncio.run(quick_export.quick_export("https://t.me/somegroup", 1, clean=False, replay=str(cassette)))
+    assert [json.loads(line)["msg_id"] for line in raw.read_text().splitlines()] == list(range(30, 14, -1))
@@ -0,0 +1,141 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+from telethon.tl import types
+
+from tg_export.changes import append_changes, changes_path, delete_change, edit_change, load_changes
+from tg_export.clean_export import convert_to_clean_format, find_exports
+from tg_export.cli import dump_messages, reconcile_archive
+from tg_export.reader import ExportReader, read_records
+from tg_export.search import SearchIndex
+from tg_export.stats import export_stats
+
+from .fakes import FakeClient, make_message
+
+
+def archive_of(tmp_path, client, record_format="jsonl"):
+    export = tmp_path / "export.jsonl"
+    asyncio.run(dump_messages(client, "chat", export, delays=(0, 0), record_format=record_format))
+    return export
+
+
+def search_ids(index, *words):
+    offsets = index.search(words)
+    return sorted(msg_id for (msg_id,) in index.db.execute(
+        f"SELECT msg_id FROM messages WHERE offset IN ({','.join(map(str, offsets)) or 'NULL'})"))
+
+
+def test_latest_change_wins(tmp_path):
+    export = tmp_path / "export.jsonl"
+    append_changes(export, [edit_change(1, 10, "first", []), edit_change(1, 20, "second", [{"type": "bold", "offset": 0, "length": 3}]),
+                            delete_change(2, 30), edit_change(3, 40, "gone", []), delete_change(3, 50)])
+
+    changes = load_changes(export)
+    assert changes[1] == {"text": "second", "entities": [{"type": "bold", "offset": 0, "length": 3}]}
+    assert changes[2] is None and changes[3] is None
+    assert json.loads(changes_path(export).read_text().splitlines()[1])["ent"] == [["b", 0, 3]]
+
+
+def test_reader_overlays_changes(tmp_path):
+    export = archive_of(tmp_path, FakeClient([make_message(i) for i in range(1, 6)]), record_format="binary")
+    append_changes(export, [edit_change(2, 0, "edited", []), delete_change(4, 0)])
+
+    with ExportReader(export) as reader:
+        current = [reader.current(raw, ("text",)) for offset, raw in reader]
+        original = [reader.fields(raw, ("text",)) for offset, raw in reader]
+    assert current == [{"text": "message 5"}, None, {"text": "message 3"}, {"text": "edited"}, {"text": "message 1"}]
+    assert original[1] == {"text": "message 4"}
+    assert [r["msg_id"] for r in read_records(export)] == [5, 3, 2, 1]
+    assert export_stats(export).total == 4
+
+
+def test_reconcile_recent_window(tmp_path):
+    client = FakeClient([make_message(i) for i in range(1, 21)])
+    export = archive_of(tmp_path, client)
+    with SearchIndex(export) as index:
+        index.update()
+
+    client.messages = [m for m in client.messages if m.id != 19]
+    client.messages[17].text = "edited *text*"
+
+    stats = asyncio.run(reconcile_archive(client, "chat", export, recent=5, delays=(0, 0)))
+
+    assert stats == {"checked": 6, "edited": 1, "deleted": 1}
+    assert [c["op"] for c in map(json.loads, changes_path(export).read_text().splitlines())] == ["edit", "del"]
+    with SearchIndex(export) as index:
+        assert index.update() == 0
+        assert search_ids(index, "edited") == [18]
+        assert search_ids(index, "message", "18") == []
+        assert search_ids(index, "message", "19") == []
+        assert len(index) == 19
+
+    # Already recorded changes are not recorded again
+    stats = asyncio.run(reconcile_archive(client, "chat", export, recent=5, delays=(0, 0)))
+    assert stats == {"checked": 5, "edited": 0, "deleted": 0}
+
+    output = tmp_path / "clean.txt"
+    convert_to_clean_format(export, output, filter_bots=False)
+    text = output.read_text()
+    assert "edited *text*" in text and "message 19" not in text
+
+
+@pytest.mark.parametrize("record_format", ["jsonl", "compact", "binary"])
+def test_reconcile_unchanged_archive_has_no_edits(tmp_path, record_format):
+    entities = [types.MessageEntityBold(0, 4), types.MessageEntityPre(5, 3, "python"),
+                types.MessageEntityTextUrl(9, 2, "https://example.com"), types.MessageEntityBlockquote(0, 11, collapsed=True),
+                types.MessageEntityCustomEmoji(0, 1, 5368324170671202286), types.MessageEntityMentionName(5, 3, 42)]
+    if hasattr(types, "MessageEntityFormattedDate"):
+        entities.append(types.MessageEntityFormattedDate(0, 4, date=datetime(2025, 1, 1, tzinfo=timezone.utc)))
+    client = FakeClient([make_message(i, text="bold pre my link", entities=entities if i % 2 else None) for i in range(1, 11)])
+    export = archive_of(tmp_path, client, record_format)
+
+    stats = asyncio.run(reconcile_archive(client, "chat", export, recent=10, delays=(0, 0)))
+
+    assert stats == {"checked": 10, "edited": 0, "deleted": 0}
+    assert not changes_path(export).exists()
+
+
+def test_reconcile_ignores_entity_serialization(tmp_path):
+    client = FakeClient([make_message(1, text="hello world", entities=[types.MessageEntityBold(0, 5)])])
+    export = archive_of(tmp_path, client)
+    # An archive dumped before this entity type had a name of its own
+    export.write_text(export.read_text().replace('"bold"', '"unknown"'))
+
+    stats = asyncio.run(reconcile_archive(client, "chat", export, recent=10, delays=(0, 0)))
+    assert stats["edited"] == 0
+
+    client.messages[0].entities = [types.MessageEntityBold(6, 5)]
+    stats = asyncio.run(reconcile_archive(client, "chat", export, recent=10, delays=(0, 0)))
+    assert stats["edited"] == 1
+
+
+def test_reconcile_ids(tmp_path):
+    client = FakeClient([make_message(i) for i in range(1, 11)])
+    export = archive_of(tmp_path, client)
+    client.messages = [m for m in client.messages if m.id != 3]
+
+    stats = asyncio.run(reconcile_archive(client, "chat", export, recent=0, ids=[3, 4, 99], delays=(0, 0)))
+
+    assert stats == {"checked": 2, "edited": 0, "deleted": 1}
+    assert load_changes(export) == {3: None}
+
+
+def test_index_rebuilt_when_changes_are_discarded(tmp_path):
+    export = archive_of(tmp_path, FakeClient([make_message(i) for i in range(1, 6)]))
+    append_changes(export, [delete_change(2, 0), delete_change(3, 0)])
+    with SearchIndex(export) as index:
+        index.update()
+        assert len(index) == 3
+
+        changes_path(export).unlink()
+        append_changes(export, [delete_change(5, 0)])
+        index.update()
+        assert len(index) == 4
+
+
+def test_change_logs_are_not_exports(tmp_path):
+    export = archive_of(tmp_path, FakeClient([make_message(1)]))
+    append_changes(export, [delete_change(1, 0)])
+    assert find_exports([str(tmp_path)]) == [export]
@@ -0,0 +1,138 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from click.testing import CliRunner
+
+from tg_export import chunks
+from tg_export.chunks import MANIFEST, Chunker, chunk_export, estimate_tokens
+from tg_export.clean_export import convert_to_clean_format
+from tg_export.cli import dump_messages
+from tg_export.main import cli
+
+from .fakes import FakeClient, make_message
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def line(n, width=40):
+    return f"{n:04d} ".ljust(width - 1, "x") + "\n"   # 10 tokens
+
+
+def run(chunker, entries):
+    """entries: (minute, is_reply) -> chunks as lists of line numbers"""
+    out = []
+    for n, (minute, is_reply) in enumerate(entries):
+        out.extend(chunker.add(line(n), minute, is_reply))
+    out.extend(chunker.finish())
+    return [[int(l[:4]) for l in chunk.lines] for chunk in out]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("abc") == 1
+    assert estimate_tokens("привет") == 3   # 12 bytes
+
+
+def test_chunks_stay_under_budget():
+    chunker = Chunker(100)
+    result = run(chunker, [(n, False) for n in range(95)])
+    assert [len(c) for c in result] == [10] * 9 + [5]
+    assert sum(result, []) == list(range(95))
+
+
+def test_cut_at_silence():
+    # A long pause before line 7 is preferred over filling the chunk
+    entries = [(n, False) for n in range(7)] + [(100 + n, False) for n in range(20)]
+    assert run(Chunker(100, gap_minutes=30), entries)[0] == list(range(7))
+
+
+def test_silence_too_early_is_ignored():
+    entries = [(0, False), (0, False)] + [(100 + n, False) for n in range(20)]
+    assert len(run(Chunker(100), entries)[0]) == 10
+
+
+def test_threads_kept_together():
+    # Lines 8-12 reply in a thread started by line 7; the chunk ends before line 7
+    entries = [(n, n in range(8, 13)) for n in range(20)]
+    assert run(Chunker(100), entries)[0] == list(range(7))
+
+
+def test_overlap_repeats_tail():
+    result = run(Chunker(100, overlap=20), [(n, False) for n in range(30)])
+    assert result[0] == list(range(10))
+    assert result[1][:2] == [8, 9]
+    assert all(len(c) <= 10 for c in result)
+    assert sorted(set(sum(result, []))) == list(range(30))
+
+
+def test_long_message_gets_own_chunk():
+    chunker = Chunker(20)
+    out = list(chunker.add("a" * 40, 0, False)) + list(chunker.add("b" * 200, 0, False)) + list(chunker.add("c" * 40, 0, False))
+    out += list(chunker.finish())
+    assert [chunk.tokens for chunk in out] == [10, 50, 10]
+
+
+def make_export(tmp_path, count=300):
+    messages = [make_message(i, text=f"message number {i} " + "word " * (i % 13),
+                             date=START + timedelta(minutes=i + 120 * (i // 50)), username=f"user{i % 5}")
+                for i in range(1, count + 1)]
+    export = tmp_path / "export.jsonl"
+    asyncio.run(dump_messages(FakeClient(messages), "chat", export, reverse=True, delays=(0, 0)))
+    return export
+
+
+def read_chunks(output_dir):
+    manifest = json.loads((output_dir / MANIFEST).read_text())
+    texts = [(output_dir / entry["file"]).read_text() for entry in manifest["chunks"]]
+    return manifest, texts
+
+
+def test_chunk_export_matches_clean_output(tmp_path):
+    export = make_export(tmp_path)
+    clean_file = tmp_path / "clean.txt"
+    convert_to_clean_format(export, clean_file, filter_bots=False)
+
+    stats = chunk_export(export, tmp_path / "chunks", max_tokens=500, filter_bots=False)
+    manifest, texts = read_chunks(tmp_path / "chunks")
+
+    assert stats['chunks'] == len(texts) > 1
+    assert "".join(texts) == clean_file.read_text()
+    assert manifest["messages"] == 300
+    assert all(entry["tokens"] <= 500 for entry in manifest["chunks"])
+    assert manifest["chunks"][0]["first"] == "2025-01-01 00:01"
+    # Every 50 messages there is a two hour silence, and chunks end there
+    assert any(entry["last"] == "2025-01-01 00:49" for entry in manifest["chunks"])
+
+
+def test_parallel_chunking(tmp_path, monkeypatch):
+    export = make_export(tmp_path)
+    chunk_export(export, tmp_path / "serial", max_tokens=500, filter_bots=False)
+    monkeypatch.setattr(chunks, "PARALLEL_MIN_BYTES", 0)
+    stats = chunk_export(export, tmp_path / "parallel", max_tokens=500, filter_bots=False, workers=3)
+
+    serial = read_chunks(tmp_path / "serial")[1]
+    manifest, parallel = read_chunks(tmp_path / "parallel")
+    assert "".join(parallel) == "".join(serial)
+    assert stats['kept'] == 300
+    assert [entry["file"] for entry in manifest["chunks"]] == [f"chunk_{n:04d}.txt" for n in range(1, len(parallel) + 1)]
+    assert not list((tmp_path / "parallel").glob("part*"))
+
+
+def test_clean_command_chunks(tmp_path):
+    export = make_export(tmp_path, 100)
+    output_dir = tmp_path / "out"
+    result = CliRunner().invoke(cli, ["clean", "-i", str(export), "-o", str(output_dir), "--max-tokens", "300",
+                                      "--overlap", "50", "--keep-bots", "--format", "jsonl"])
+    assert result.exit_code == 0, result.output
+    manifest, texts = read_chunks(output_dir)
+    assert manifest["overlap_tokens"] == 50
+    assert all(json.loads(line) for text in texts for line in text.splitlines())
+    assert manifest["chunks"][1]["overlap_messages"] > 0
+
+
+def test_overlap_must_fit_budget(tmp_path):
+    export = make_export(tmp_path, 10)
+    result = CliRunner().invoke(cli, ["clean", "-i", str(export), "--max-tokens", "100", "--overlap", "80"])
+    assert result.exit_code != 0
+    assert "at most half" in result.output
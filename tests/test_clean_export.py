@@ -0,0 +1,47 @@
+import asyncio
+import os
+
+from click.testing import CliRunner
+
+from tg_export.clean_export import clean, clean_output_path, find_exports
+from tg_export.cli import dump_messages
+
+from .fakes import FakeClient, make_message
+
+
+def make_exports(directory, count):
+    directory.mkdir()
+    client = FakeClient([make_message(i) for i in range(1, 11)])
+    for n in range(count):
+        fmt = "binary" if n % 2 else "jsonl"
+        name = f"chat{n}.tgx" if fmt == "binary" else f"chat{n}.jsonl"
+        asyncio.run(dump_messages(client, "chat", directory / name, delays=(0, 0), record_format=fmt))
+    (directory / "notes.txt").write_text("not an export\n")
+    return directory
+
+
+def test_find_exports(tmp_path):
+    exports = make_exports(tmp_path / "exports", 3)
+    (exports / "chat0_clean.jsonl").write_text("{}\n")
+    assert [p.name for p in find_exports([str(exports)])] == ["chat0.jsonl", "chat1.tgx", "chat2.jsonl"]
+    assert [p.name for p in find_exports([str(exports / "*.jsonl"), str(exports / "chat0.jsonl")])] == ["chat0.jsonl", "chat0_clean.jsonl", "chat2.jsonl"]
+
+
+def test_clean_directory_in_parallel(tmp_path):
+    exports = make_exports(tmp_path / "exports", 4)
+    out = tmp_path / "clean"
+
+    result = CliRunner().invoke(clean, ["-i", str(exports), "-o", str(out), "--jobs", "2"])
+    assert result.exit_code == 0, result.output
+    assert "Files cleaned: 4" in result.output
+    assert "Kept: 40" in result.output
+    assert sorted(p.name for p in out.iterdir()) == [f"chat{n}_clean.txt" for n in range(4)]
+
+    # Only the export that changed since the last run is cleaned again
+    touched = exports / "chat1.tgx"
+    later = clean_output_path(touched, "txt", out).stat().st_mtime + 10
+    os.utime(touched, (later, later))
+    result = CliRunner().invoke(clean, ["-i", str(exports), "-o", str(out), "--jobs", "2"])
+    assert "Files cleaned: 1" in result.output
+    assert "Files up to date: 3" in result.output
+    assert "Kept: 10" in result.output
@@ -1,11 +1,17 @@
 import pytest
+import asyncio
 import json
 from pathlib import Path
 from unittest.mock import Mock, patch, AsyncMock
-from datetime import datetime
+from datetime import datetime, timezone
 from click.testing import CliRunner
+from telethon.errors import FloodWaitError
+from telethon.tl import types
 
-from tg_export.cli import cli, parse_chat_url, get_last_message_id, serialize_entities
+from tg_export import metrics, records
+from tg_export.cli import BATCH_SIZE, ENTITY_KINDS, NEWER_ENTITY_KINDS, cli, parse_chat_url, get_last_message_id, serialize_entities, dump_messages, dump_with_takeout, prefetch_messages
+
+from .fakes import FakeClient, make_message
 
 
 class TestChatUrlParsing:
@@ -60,11 +66,55 @@ class TestSerializeEntities:
         result = serialize_entities([entity])
         assert result == [{"type": "bold", "offset": 0, "length": 4}]
 
+    def test_every_entity_type_is_kept(self):
+        entities = [
+            types.MessageEntityMention(0, 6),
+            types.MessageEntityHashtag(7, 4),
+            types.MessageEntityUrl(12, 10),
+            types.MessageEntitySpoiler(23, 3),
+            types.MessageEntityPre(27, 5, language=""),
+            types.MessageEntityPre(33, 5, language="python"),
+            types.MessageEntityMentionName(39, 3, user_id=42),
+            types.MessageEntityCustomEmoji(43, 2, document_id=5368324170671202286),
+            types.MessageEntityBlockquote(46, 8, collapsed=True),
+            types.MessageEntityBlockquote(55, 8),
+        ]
+        expected = [
+            {"type": "mention", "offset": 0, "length": 6},
+            {"type": "hashtag", "offset": 7, "length": 4},
+            {"type": "url", "offset": 12, "length": 10},
+            {"type": "spoiler", "offset": 23, "length": 3},
+            {"type": "pre", "offset": 27, "length": 5},
+            {"type": "pre", "offset": 33, "length": 5, "language": "python"},
+            {"type": "mention_name", "offset": 39, "length": 3, "user_id": 42},
+            {"type": "custom_emoji", "offset": 43, "length": 2, "document_id": 5368324170671202286},
+            {"type": "blockquote", "offset": 46, "length": 8, "collapsed": True},
+            {"type": "blockquote", "offset": 55, "length": 8},
+        ]
+        if hasattr(types, "MessageEntityFormattedDate"):
+            entities.append(types.MessageEntityFormattedDate(64, 5, date=datetime(2025, 1, 1, 12, tzinfo=timezone.utc)))
+            expected.append({"type": "formatted_date", "offset": 64, "length": 5, "date": 1735732800})
+        assert serialize_entities(entities) == expected
+
+    def test_table_covers_telethon(self):
+        # Classes newer than this table are tolerated: they are kept as "unknown" (below)
+        for name, kind in NEWER_ENTITY_KINDS.items():
+            assert ENTITY_KINDS.get(getattr(types, name, None)) == (kind if hasattr(types, name) else None)
+        for cls, (name, extra) in ENTITY_KINDS.items():
+            assert cls is getattr(types, cls.__name__)
+            assert name in records.ENTITY_CODES
+            assert extra == records.ENTITY_EXTRAS.get(name, (None,))[0]
+
+    def test_unknown_class_keeps_span(self):
+        class MessageEntityFuture(types.MessageEntityBold):
+            pass
+        assert serialize_entities([MessageEntityFuture(3, 4)]) == [{"type": "unknown", "offset": 3, "length": 4}]
+
 
 class TestCLI:
     @patch.dict('os.environ', {'TELEGRAM_API_ID': '12345', 'TELEGRAM_API_HASH': 'abcdef'})
     @patch('tg_export.cli.TelegramClient')
-    @patch('tg_export.cli.Path')
+    @patch('tg_export.cli.session_path')
     def test_login_command(self, mock_path, mock_client):
         runner = CliRunner()
         
@@ -91,6 +141,79 @@ class TestCLI:
             assert "TELEGRAM_API_ID and TELEGRAM_API_HASH must be set" in result.output
 
 
+class TestTakeout:
+    def test_takeout_finished_on_success(self, tmp_path):
+        client = FakeClient([make_message(i) for i in range(1, 11)])
+        output = tmp_path / "out.jsonl"
+        
+        count = asyncio.run(dump_with_takeout(client, "chat", output))
+        
+        assert count == 10
+        assert client.takeout_started
+        assert client.takeout_finished is True
+        assert client.requests[0]["wait_time"] == 0
+    
+    def test_takeout_cancelled_on_error(self, tmp_path):
+        client = FakeClient([make_message(i) for i in range(1, 11)], flood_after=3)
+        output = tmp_path / "out.jsonl"
+        
+        with pytest.raises(FloodWaitError):
+            asyncio.run(dump_with_takeout(client, "chat", output))
+        
+        assert client.takeout_finished is False
+        assert len(output.read_text().splitlines()) == 3
+    
+    def test_takeout_cannot_combine_with_pool(self):
+        runner = CliRunner()
+        result = runner.invoke(cli, ['dump', '--chat-url', 'https://t.me/x', '--out', 'x.jsonl', '--pool', '--takeout'])
+        assert result.exit_code != 0
+        assert "cannot be combined" in result.output
+
+
+class PagedClient(FakeClient):
+    """Serves messages in pages, logging when each page is requested"""
+    
+    def __init__(self, messages, log):
+        super().__init__(messages)
+        self.log = log
+    
+    async def iter_messages(self, chat, **kwargs):
+        for n, message in enumerate(self.messages):
+            if n % BATCH_SIZE == 0:
+                self.log.append(("fetch", n // BATCH_SIZE))
+                await asyncio.sleep(0.001)
+            self.served += 1
+            yield message
+
+
+class TestDumpPipeline:
+    def test_next_page_fetched_while_processing(self, tmp_path, monkeypatch):
+        log = []
+        def page_senders(page):
+            log.extend(("process", message.id) for message in page)
+            return [message.sender for message in page]
+        monkeypatch.setattr(metrics, "page_senders", page_senders)
+        client = PagedClient([make_message(i) for i in range(1, 3 * BATCH_SIZE + 1)], log)
+        
+        count = asyncio.run(dump_messages(client, "chat", tmp_path / "out.jsonl", reverse=True, delays=(0, 0)))
+        
+        assert count == 3 * BATCH_SIZE
+        assert log.index(("fetch", 1)) < log.index(("process", BATCH_SIZE))
+        assert [r["msg_id"] for r in map(json.loads, (tmp_path / "out.jsonl").read_text().splitlines())] == list(range(1, 3 * BATCH_SIZE + 1))
+    
+    def test_prefetch_is_bounded(self):
+        async def run():
+            client = PagedClient([make_message(i) for i in range(1, 1001)], [])
+            queue = asyncio.Queue(maxsize=2)
+            fetcher = asyncio.ensure_future(prefetch_messages(client.iter_messages("chat"), queue, None, (0, 0)))
+            await asyncio.sleep(0.05)
+            fetcher.cancel()
+            return client.served
+        
+        # Two queued pages, plus the one waiting to be queued
+        assert asyncio.run(run()) <= 3 * BATCH_SIZE
+
+
 def test_unique_message_ids(tmp_path):
     """Test that exported messages have unique IDs"""
     file = tmp_path / "test.jsonl"
@@ -0,0 +1,113 @@
+import gzip
+import os
+
+import pytest
+
+from tg_export import quick_export
+from tg_export.downloads import accepts_gzip, gzip_path
+from tg_export.quick_export import app
+
+BODY = "".join(f"[2025-01-01 00:{i % 60:02d}] alice: message number {i}\n" for i in range(2000)).encode()
+
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    monkeypatch.setattr(quick_export, "EXPORTS_DIR", tmp_path)
+    path = tmp_path / "quick_1h.txt"
+    path.write_bytes(BODY)
+    return path
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def test_accepts_gzip():
+    assert accepts_gzip("gzip, deflate, br")
+    assert accepts_gzip("br;q=1.0, gzip;q=0.5")
+    assert accepts_gzip("*")
+    assert not accepts_gzip("")
+    assert not accepts_gzip("identity")
+    assert not accepts_gzip("gzip;q=0, *")
+    assert not accepts_gzip("br, *;q=0")
+
+
+def test_plain_download(export, client):
+    response = client.get("/download/quick_1h.txt")
+    assert response.status_code == 200
+    assert response.data == BODY
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Content-Disposition"].startswith("attachment")
+    assert response.mimetype == "text/plain"
+
+
+def test_range_and_conditional(export, client):
+    etag = client.get("/download/quick_1h.txt").headers["ETag"]
+
+    response = client.get("/download/quick_1h.txt", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.data == BODY[100:200]
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(BODY)}"
+
+    assert client.get("/download/quick_1h.txt", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/download/quick_1h.txt", headers={"Range": f"bytes={len(BODY)}-"}).status_code == 416
+
+    # A resume against a different version of the file gets the whole file
+    response = client.get("/download/quick_1h.txt", headers={"Range": "bytes=100-", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.data == BODY
+
+
+def test_gzip_streamed_then_cached(export, client):
+    headers = {"Accept-Encoding": "gzip"}
+    first = client.get("/download/quick_1h.txt", headers=headers)
+    assert first.status_code == 200
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in first.headers["Vary"]
+    assert gzip.decompress(first.data) == BODY
+    assert len(first.data) * 5 < len(BODY)
+    assert gzip_path(export).read_bytes() == first.data
+
+    second = client.get("/download/quick_1h.txt", headers=headers)
+    assert second.data == first.data
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert second.headers["Content-Length"] == str(len(first.data))
+
+    partial = client.get("/download/quick_1h.txt", headers=dict(headers, Range="bytes=10-"))
+    assert partial.status_code == 206
+    assert partial.headers["Content-Encoding"] == "gzip"
+    assert partial.data == first.data[10:]
+
+    not_modified = client.get("/download/quick_1h.txt", headers=dict(headers, **{"If-None-Match": first.headers["ETag"]}))
+    assert not_modified.status_code == 304
+    # The identity representation has its own ETag
+    assert client.get("/download/quick_1h.txt").headers["ETag"] != first.headers["ETag"]
+
+
+def test_gzip_copy_refreshed_when_export_changes(export, client):
+    headers = {"Accept-Encoding": "gzip"}
+    before = client.get("/download/quick_1h.txt", headers=headers)
+
+    export.write_bytes(BODY + b"[2025-01-01 01:00] bob: one more\n")
+    os.utime(export, ns=(0, export.stat().st_mtime_ns + 10**9))
+
+    after = client.get("/download/quick_1h.txt", headers=headers)
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert gzip.decompress(after.data).endswith(b"one more\n")
+    assert gzip.decompress(gzip_path(export).read_bytes()) == gzip.decompress(after.data)
+
+
+def test_small_files_not_compressed(export, client):
+    (export.parent / "small.txt").write_text("hi\n")
+    response = client.get("/download/small.txt", headers={"Accept-Encoding": "gzip"})
+    assert response.data == b"hi\n"
+    assert "Content-Encoding" not in response.headers
+
+
+def test_outside_exports_dir(export, client):
+    (export.parent.parent / "secret.txt").write_text("secret")
+    assert client.get(f"/download/../{export.parent.parent.name}/secret.txt").status_code == 404
+    assert client.get("/download/missing.txt").status_code == 404
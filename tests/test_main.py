@@ -0,0 +1,31 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import click
+import pytest
+
+from tg_export.main import COMMANDS, cli
+
+ROOT = Path(__file__).parent.parent
+
+
+@pytest.mark.parametrize("args", [["--help"], ["clean", "--help"]])
+def test_light_commands_do_not_import_telethon(args):
+    code = (
+        "import sys\n"
+        "from tg_export.main import cli\n"
+        f"try:\n    cli({args!r})\n"
+        "except SystemExit:\n    pass\n"
+        "print(sorted(m for m in ('telethon', 'flask', 'dotenv') if m in sys.modules))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert proc.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_lazy_help_matches_commands():
+    ctx = click.Context(cli)
+    for name, (path, short_help) in COMMANDS.items():
+        command = cli.get_command(ctx, name)
+        assert command.name == name
+        assert command.get_short_help_str(limit=200) == short_help
@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from click.testing import CliRunner
+
+from tg_export.changes import append_changes, delete_change, edit_change
+from tg_export.cli import dump_messages, get_last_message_id
+from tg_export.main import cli
+from tg_export.merge import export_runs
+from tg_export.reader import ExportReader
+
+from .fakes import FakeClient, make_message
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def export_chat(path, ids, step, resume_ids=(), username="alice", fmt="jsonl"):
+    """A fresh (newest-first) dump, then optionally a resumed ascending one"""
+    client = FakeClient([make_message(i, username=username, date=START + timedelta(minutes=i * step)) for i in ids])
+    asyncio.run(dump_messages(client, "chat", path, delays=(0, 0), record_format=fmt))
+    if resume_ids:
+        client.messages.extend(make_message(i, username=username, date=START + timedelta(minutes=i * step)) for i in resume_ids)
+        asyncio.run(dump_messages(client, "chat", path, min_id=get_last_message_id(path), delays=(0, 0)))
+    return path
+
+
+def test_export_runs(tmp_path):
+    fresh = export_chat(tmp_path / "fresh.jsonl", range(1, 6), 1)
+    resumed = export_chat(tmp_path / "resumed.jsonl", range(1, 6), 1, resume_ids=range(6, 9))
+    with ExportReader(fresh) as reader:
+        assert [d for _, _, d in export_runs(reader)] == [True]
+    with ExportReader(resumed) as reader:
+        assert [d for _, _, d in export_runs(reader)] == [True, False]
+
+
+def test_merge_interleaves_by_date(tmp_path):
+    a = export_chat(tmp_path / "a.jsonl", range(1, 6), 2, resume_ids=range(6, 9), username="alice")
+    b = export_chat(tmp_path / "b.tgx", range(1, 12), 1, username="bob", fmt="binary")
+    out = tmp_path / "timeline.txt"
+
+    result = CliRunner().invoke(cli, ["merge", str(a), str(b), "--label", "alpha", "--out", str(out)])
+    assert result.exit_code == 0, result.output
+
+    lines = out.read_text().splitlines()
+    assert len(lines) == 8 + 11
+    assert [line[1:17] for line in lines] == sorted(line[1:17] for line in lines)
+    assert lines[0] == "[2025-01-01 00:01] [b] bob: message 1"
+    assert lines[1] == "[2025-01-01 00:02] [alpha] alice: message 1"
+    assert lines[-1] == "[2025-01-01 00:16] [alpha] alice: message 8"
+
+
+def test_merge_applies_change_log(tmp_path):
+    a = export_chat(tmp_path / "a.jsonl", range(1, 6), 2, resume_ids=range(6, 9), username="alice")
+    b = export_chat(tmp_path / "b.tgx", range(1, 4), 1, username="bob", fmt="binary")
+    # Deletions and edits in both runs of a and in the binary export
+    append_changes(a, [delete_change(2, 0), edit_change(4, 0, "edited 4", []), delete_change(7, 0)])
+    append_changes(b, [edit_change(1, 0, "edited 1", [])])
+    out = tmp_path / "timeline.txt"
+
+    result = CliRunner().invoke(cli, ["merge", str(a), str(b), "--out", str(out)])
+    assert result.exit_code == 0, result.output
+
+    text = out.read_text()
+    assert "alice: message 2" not in text and "alice: message 7" not in text
+    assert "[a] alice: edited 4" in text and "[b] bob: edited 1" in text
+    assert "message 4" not in text and "bob: message 1" not in text
+    assert len(text.splitlines()) == 6 + 3
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from tg_export import metrics
+from tg_export.clean_export import clean
+from tg_export.cli import dump_messages
+from tg_export.quick_export import app
+
+from .fakes import FakeClient, make_message
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    metrics.REGISTRY.reset()
+    yield
+    metrics.REGISTRY.reset()
+    metrics.REGISTRY.output = None
+
+
+def test_counter_and_histogram_render():
+    registry = metrics.Registry()
+    counter = registry.counter("things_total", "Things")
+    histogram = registry.histogram("wait_seconds", "Waits", buckets=(1, 5))
+    counter.inc(outcome="kept")
+    counter.inc(2, outcome="kept")
+    histogram.observe(0.5)
+    histogram.observe(3)
+
+    text = registry.render_prometheus()
+    assert 'things_total{outcome="kept"} 3' in text
+    assert 'wait_seconds_bucket{le="1"} 1' in text
+    assert 'wait_seconds_bucket{le="+Inf"} 2' in text
+    assert "wait_seconds_count 2" in text
+
+
+def test_dump_records_pages_and_bytes(tmp_path):
+    client = FakeClient([make_message(i) for i in range(1, 251)])
+    output_file = tmp_path / "out.jsonl"
+    asyncio.run(dump_messages(client, "chat", output_file, delays=(0, 0)))
+
+    assert metrics.PAGE_FETCH_SECONDS.count() == 3
+    assert metrics.RECORDS_SERIALIZED.value() == 250
+    # Timed once per page fetched and per batch written, not per message
+    assert metrics.SERIALIZE_SECONDS.count() == 3
+    assert metrics.SENDER_RESOLVE_SECONDS.count() == 3
+    assert metrics.SENDER_RESOLUTIONS.value(result="resolved") == 250
+    assert metrics.BYTES_WRITTEN.value() == output_file.stat().st_size
+
+
+def test_metrics_endpoint():
+    metrics.record_flood_wait(30)
+    response = app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "tg_export_flood_waits_total 1" in response.get_data(as_text=True)
+
+
+def test_clean_writes_metrics_file(tmp_path):
+    input_file = tmp_path / "in.jsonl"
+    lines = [
+        {"date": "2025-01-01T00:00:00+00:00", "sender_username": "alice", "text": "hi"},
+        {"date": "2025-01-01T00:01:00+00:00", "sender_username": "somebot", "text": "beep"},
+        {"date": "2025-01-01T00:02:00+00:00", "sender_username": "alice", "text": "", "media_type": "photo"},
+    ]
+    input_file.write_text("".join(json.dumps(line) + "\n" for line in lines))
+    metrics_file = tmp_path / "metrics.json"
+
+    result = CliRunner().invoke(clean, ["--input", str(input_file), "--output", str(tmp_path / "out.txt"),
+                                        "--metrics-file", str(metrics_file)])
+    assert result.exit_code == 0, result.output
+
+    counts = json.loads(metrics_file.read_text())["tg_export_clean_records_total"]
+    assert counts['{outcome="kept"}'] == 1
+    assert counts['{outcome="bot"}'] == 1
+    assert counts['{outcome="media_only"}'] == 1
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from telethon.errors import ChannelPrivateError
+from telethon.tl.types import Channel, ChatPhotoEmpty, InputPeerChannel
+
+from tg_export.cli import run_export
+from tg_export.peers import PeerCache, peer_cache_path, resolve_chat
+from tg_export.sessions import SessionPool
+
+from .fakes import FakeClient, make_message
+
+
+def channel(access_hash):
+    return Channel(id=1234, title="Team", photo=ChatPhotoEmpty(), date=None, access_hash=access_hash, username="team")
+
+
+class ResolvingClient(FakeClient):
+    """Resolves chats to a channel and refuses requests made with a stale access hash"""
+
+    def __init__(self, messages, access_hash=2):
+        super().__init__(messages)
+        self.access_hash = access_hash
+        self.resolved = 0
+
+    async def start(self):
+        pass
+
+    async def get_entity(self, identifier):
+        self.resolved += 1
+        return channel(self.access_hash)
+
+    async def iter_messages(self, chat, **kwargs):
+        if chat.access_hash != self.access_hash:
+            raise ChannelPrivateError(None)
+        async for message in super().iter_messages(chat, **kwargs):
+            yield message
+
+
+def test_peer_cache_persists(tmp_path):
+    path = peer_cache_path(tmp_path / ".session")
+    assert path.name == ".session.peers.json"
+
+    client = ResolvingClient([])
+    peers = PeerCache(path)
+    assert asyncio.run(resolve_chat(client, "Team", peers)).access_hash == 2
+    assert asyncio.run(resolve_chat(client, "team", PeerCache(path))) == InputPeerChannel(1234, 2)
+    assert client.resolved == 1
+    assert PeerCache(path).title("team") == "Team"
+
+    assert peers.invalidate("team")
+    assert not peers.invalidate("team")
+    assert "team" not in PeerCache(path)
+
+
+def test_stale_peer_is_resolved_again(tmp_path):
+    peers = PeerCache(tmp_path / "peers.json")
+    peers.put("team", channel(1))
+    client = ResolvingClient([make_message(i) for i in range(1, 6)])
+    output = tmp_path / "out.jsonl"
+
+    asyncio.run(run_export(lambda: client, "https://t.me/team", output, None, None, delays=(0, 0), peers=peers))
+
+    assert client.resolved == 1
+    assert len(output.read_text().splitlines()) == 5
+    assert peers.get("team").access_hash == 2
+
+
+def test_inaccessible_chat_is_not_retried_forever(tmp_path):
+    peers = PeerCache(tmp_path / "peers.json")
+    client = ResolvingClient([make_message(1)])
+    pool = SessionPool({"a": client}, {"a": peers})
+
+    asyncio.run(pool.get_entity("a", "team"))
+    # Resolved over the network this run, so a failure is real
+    assert not pool.forget_entity("a", "team")
+
+    other = SessionPool({"a": client}, {"a": PeerCache(tmp_path / "peers.json")})
+    asyncio.run(other.get_entity("a", "team"))
+    assert other.forget_entity("a", "team")
+    assert client.resolved == 1
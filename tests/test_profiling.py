@@ -0,0 +1,35 @@
+import asyncio
+import json
+
+from click.testing import CliRunner
+
+from tg_export.clean_export import clean
+from tg_export.cli import dump_messages
+from tg_export.profiling import PROFILE_FILE, REPORT_FILE, SNAPSHOT_FILE, RunProfiler
+
+from .fakes import FakeClient, make_message
+
+
+def test_profiler_writes_raw_files_and_report(tmp_path):
+    profiler = RunProfiler(tmp_path / "prof")
+    profiler.start()
+    client = FakeClient([make_message(i) for i in range(1, 201)])
+    asyncio.run(dump_messages(client, "chat", tmp_path / "out.jsonl", delays=(0, 0)))
+    report = profiler.stop()
+
+    assert (tmp_path / "prof" / PROFILE_FILE).stat().st_size > 0
+    assert (tmp_path / "prof" / SNAPSHOT_FILE).stat().st_size > 0
+    text = report.read_text()
+    assert "waiting on Telegram for pages" in text
+    assert "serialize_entities" in text
+    assert "dump_messages" in text
+
+
+def test_clean_profile_option(tmp_path):
+    input_file = tmp_path / "in.jsonl"
+    input_file.write_text(json.dumps({"date": "2025-01-01T00:00:00+00:00", "sender_username": "alice", "text": "hi"}) + "\n")
+
+    result = CliRunner().invoke(clean, ["--input", str(input_file), "--output", str(tmp_path / "out.txt"),
+                                        "--profile", str(tmp_path / "prof")])
+    assert result.exit_code == 0, result.output
+    assert "regex" in (tmp_path / "prof" / REPORT_FILE).read_text()
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from tg_export import metrics, quick_export
+from tg_export.cli import dump_messages
+from tg_export.query import ArchiveQueries
+from tg_export.quick_export import app
+
+from .fakes import FakeClient, make_message
+
+TEXTS = ["shipping the release today", "lunch?", "release notes are done", "standup in five"]
+
+
+def messages(ids, chat_id=1234):
+    return [make_message(i, chat_id=chat_id, username="bob" if i % 2 else "alice", text=TEXTS[i % len(TEXTS)])
+            for i in ids]
+
+
+@pytest.fixture
+def archives(tmp_path, monkeypatch):
+    root = tmp_path / "exports"
+    (root / "quick").mkdir(parents=True)
+    team = FakeClient(messages(range(1, 31)))
+    asyncio.run(dump_messages(team, "chat", root / "team.jsonl", reverse=True, delays=(0, 0)))
+    asyncio.run(dump_messages(FakeClient(messages(range(1, 6), chat_id=99)), "chat", root / "quick" / "other.tgx",
+                              reverse=True, delays=(0, 0), record_format="binary"))
+    monkeypatch.setattr(quick_export, "archive_queries", ArchiveQueries(root))
+    metrics.REGISTRY.reset()
+    yield root, team
+    metrics.REGISTRY.reset()
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def get(client, **params):
+    response = client.get("/api/messages", query_string=params)
+    return response.status_code, response.get_json()
+
+
+def test_list_archives(archives, client):
+    listed = client.get("/api/archives").get_json()["archives"]
+    assert [(a["name"], a["chat_id"], a["format"]) for a in listed] == [("team.jsonl", -1000000001234, "jsonl"),
+                                                                         ("quick/other.tgx", -1000000000099, "binary")]
+
+
+def test_pages_follow_cursor(archives, client):
+    root, team = archives
+    status, page = get(client, archive="team.jsonl", limit=12)
+    assert status == 200
+    assert [m["msg_id"] for m in page["messages"]] == list(range(30, 18, -1))
+    assert page["messages"][0]["date"] == "2025-01-01T00:30:00+00:00"
+
+    # Messages appended while paging do not shift the next page
+    team.messages.extend(messages(range(31, 41)))
+    asyncio.run(dump_messages(team, "chat", root / "team.jsonl", min_id=30, delays=(0, 0)))
+
+    seen = [m["msg_id"] for m in page["messages"]]
+    while page["next_cursor"]:
+        status, page = get(client, archive="team.jsonl", limit=12, cursor=page["next_cursor"])
+        seen += [m["msg_id"] for m in page["messages"]]
+    assert seen == list(range(30, 0, -1))
+    assert get(client, archive="team.jsonl", limit=1)[1]["messages"][0]["msg_id"] == 40
+
+
+def test_filters(archives, client):
+    status, page = get(client, chat=-1000000001234, q="Release", sender="@Alice",
+                       since="2025-01-01T00:05", until="2025-01-01 00:25")
+    assert status == 200
+    assert [m["msg_id"] for m in page["messages"]] == list(range(24, 5, -2))
+    assert {m["sender_username"] for m in page["messages"]} == {"alice"}
+    assert page["next_cursor"] is None
+    assert [m["msg_id"] for m in get(client, chat=-1000000000099)[1]["messages"]] == [5, 4, 3, 2, 1]
+
+
+def test_cache_invalidated_when_archive_grows(archives, client):
+    root, team = archives
+    first = get(client, archive="team.jsonl", q="lunch")[1]
+    assert get(client, archive="team.jsonl", q="lunch")[1] == first
+    assert metrics.QUERY_CACHE.value(result="hit") == 1
+    assert metrics.QUERY_CACHE.value(result="miss") == 1
+
+    team.messages.extend(messages(range(31, 36)))
+    asyncio.run(dump_messages(team, "chat", root / "team.jsonl", min_id=30, delays=(0, 0)))
+    grown = get(client, archive="team.jsonl", q="lunch")[1]
+    assert grown["messages"][0]["msg_id"] == 33
+    assert metrics.QUERY_CACHE.value(result="miss") == 2
+
+
+def test_cache_is_bounded(archives):
+    root, team = archives
+    queries = ArchiveQueries(root, cache_size=2)
+    path = queries.find("team.jsonl")
+    for limit in (1, 2, 3):
+        queries.query(path, limit=limit)
+    assert len(queries._cache) == 2
+
+
+def test_errors(archives, client):
+    assert get(client)[0] == 400
+    assert get(client, archive="missing.jsonl")[0] == 404
+    assert get(client, archive="../team.jsonl")[0] == 404
+    assert get(client, chat=5)[0] == 404
+    assert get(client, archive="team.jsonl", cursor="nope")[0] == 400
+    assert get(client, archive="team.jsonl", since="yesterday")[0] == 400
+    assert get(client, archive="team.jsonl", limit=0)[0] == 400
@@ -0,0 +1,75 @@
+import pytest
+
+from tg_export import records
+from tg_export.cli import get_last_message_id
+from tg_export.reader import ExportReader
+
+FIELDS = ("msg_id", "ts", "sender_id", "sender_username", "reply_to", "text", "entities", "media_type")
+
+
+def make_record(msg_id):
+    return {
+        "msg_id": msg_id,
+        "chat_id": -1001,
+        "ts": 1735732800 + msg_id * 30,
+        "sender_id": msg_id % 3 or None,
+        "sender_username": "bob" if msg_id % 2 else None,
+        "reply_to": msg_id - 1 if msg_id % 4 == 0 else None,
+        "text": f'say "hi" {msg_id} \\ ok' if msg_id % 5 else "",
+        "entities": [{"type": "text_url", "offset": 0, "length": 3, "url": "https://x.y"}] if msg_id % 6 == 0 else [],
+        "media_type": "photo" if msg_id % 5 == 0 else None,
+        "media_file_id": "9" if msg_id % 5 == 0 else None,
+    }
+
+
+def write_export(path, fmt, ids):
+    path.write_bytes(records.header(fmt) + b"".join(records.encode(make_record(i), fmt) for i in ids))
+    return path
+
+
+@pytest.mark.parametrize("fmt", records.FORMATS)
+def test_forward_reverse_and_seek(tmp_path, fmt):
+    path = write_export(tmp_path / "export", fmt, range(1, 13))
+    with ExportReader(path) as reader:
+        forward = [(offset, reader.decode(raw)["msg_id"]) for offset, raw in reader]
+        backward = [(offset, reader.decode(raw)["msg_id"]) for offset, raw in reader.reverse()]
+        assert [i for _, i in forward] == list(range(1, 13))
+        assert backward == forward[::-1]
+
+        offset = forward[5][0]
+        assert reader.decode(reader.record_at(offset))["msg_id"] == 6
+        assert [reader.decode(raw)["msg_id"] for _, raw in reader.records(offset)] == list(range(6, 13))
+        assert [reader.decode(raw)["msg_id"] for _, raw in reader.reverse(offset)] == list(range(5, 0, -1))
+
+
+@pytest.mark.parametrize("fmt", records.FORMATS)
+@pytest.mark.parametrize("names", [("msg_id",), ("ts", "reply_to"), ("text", "sender_username"), FIELDS])
+def test_partial_fields_match_full_decode(tmp_path, fmt, names):
+    path = write_export(tmp_path / "export", fmt, range(1, 13))
+    with ExportReader(path) as reader:
+        for offset, raw in reader:
+            record = reader.decode(raw)
+            assert reader.fields(raw, names) == {name: record[name] for name in names}
+
+
+def test_truncated_binary_tail_is_ignored(tmp_path):
+    path = write_export(tmp_path / "export", "binary", range(1, 6))
+    path.write_bytes(path.read_bytes() + records.encode(make_record(6), "binary")[:-7])
+    with ExportReader(path) as reader:
+        assert [reader.fields(raw, ("msg_id",))["msg_id"] for _, raw in reader.reverse()] == [5, 4, 3, 2, 1]
+
+
+def test_last_message_id_of_newest_first_export(tmp_path):
+    # A fresh dump is written newest first; resuming must continue after the newest id
+    path = write_export(tmp_path / "export.jsonl", "jsonl", range(10, 0, -1))
+    assert get_last_message_id(path) == 10
+    path.write_bytes(path.read_bytes() + records.encode(make_record(11), "jsonl"))
+    assert get_last_message_id(path) == 11
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.jsonl"
+    path.write_bytes(b"")
+    with ExportReader(path) as reader:
+        assert list(reader) == [] and list(reader.reverse()) == []
+        assert reader.last() is None
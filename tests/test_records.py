@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from tg_export import records
+from tg_export.clean_export import convert_to_clean_format
+from tg_export.cli import dump_messages, get_last_message_id
+from tg_export.reader import ExportReader, read_records
+from tg_export.records import decode_line, encode
+
+from .fakes import FakeClient, make_message
+
+RECORD = {
+    "msg_id": 42,
+    "chat_id": -1001234567890,
+    "ts": 1735732800,
+    "sender_id": 7,
+    "sender_username": "алиса",
+    "reply_to": 41,
+    "text": "hello 🚀 world",
+    "entities": [{"type": "bold", "offset": 0, "length": 5},
+                 {"type": "text_url", "offset": 6, "length": 2, "url": "https://example.com"}],
+    "media_type": "photo",
+    "media_file_id": "123",
+}
+EVERY_ENTITY = dict(RECORD, entities=[
+    {"type": "pre", "offset": 0, "length": 5},
+    {"type": "pre", "offset": 0, "length": 5, "language": "python"},
+    {"type": "mention", "offset": 6, "length": 1},
+    {"type": "mention_name", "offset": 6, "length": 1, "user_id": 42},
+    {"type": "custom_emoji", "offset": 6, "length": 2, "document_id": 5368324170671202286},
+    {"type": "blockquote", "offset": 0, "length": 14, "collapsed": True},
+    {"type": "blockquote", "offset": 0, "length": 14},
+    {"type": "formatted_date", "offset": 9, "length": 5, "date": 1735732800},
+    {"type": "diff_replace", "offset": 9, "length": 5, "old_text": "мир"},
+    {"type": "spoiler", "offset": 9, "length": 5},
+    {"type": "unknown", "offset": 1, "length": 1},
+])
+EMPTY = dict(RECORD, sender_id=None, sender_username=None, reply_to=None, text="", entities=[],
+             media_type=None, media_file_id=None)
+
+
+@pytest.mark.parametrize("fmt", records.FORMATS)
+@pytest.mark.parametrize("record", [RECORD, EVERY_ENTITY, EMPTY])
+def test_round_trip(tmp_path, fmt, record):
+    path = tmp_path / "export"
+    path.write_bytes(records.header(fmt) + encode(record, fmt) * 2)
+    assert records.detect_format(path) == fmt
+    assert list(read_records(path)) == [record, record]
+    with ExportReader(path) as reader:
+        assert reader.decode(reader.last()) == record
+
+
+def test_compact_is_smaller():
+    assert len(encode(RECORD, "compact")) < len(encode(RECORD, "jsonl"))
+    assert len(encode(RECORD, "binary")) < len(encode(RECORD, "compact"))
+
+
+def test_every_entity_type_encodes():
+    values = {"str": "x", "int": 7, "flag": True}
+    for name in records.ENTITY_TYPES:
+        entity = {"type": name, "offset": 1, "length": 2}
+        if name in records.ENTITY_EXTRAS:
+            field, kind = records.ENTITY_EXTRAS[name]
+            entity[field] = values[kind]
+        record = dict(RECORD, entities=[entity])
+        for fmt in records.FORMATS:
+            raw = encode(record, fmt)
+            decoded = records.decode_frame(raw[4:-4]) if fmt == "binary" else decode_line(raw)
+            assert decoded["entities"] == [entity], (name, fmt)
+
+
+def test_legacy_dates():
+    assert decode_line('{"msg_id": 1, "date": "2025-01-01T12:00:00+00:00Z"}')["ts"] == 1735732800
+    assert decode_line('{"msg_id": 1, "date": "2025-01-01T12:00:00+00:00+00:00"}')["ts"] == 1735732800
+
+
+def test_resume_keeps_file_format(tmp_path):
+    output_file = tmp_path / "out.tgx"
+    client = FakeClient([make_message(i) for i in range(1, 11)])
+    asyncio.run(dump_messages(client, "chat", output_file, reverse=True, delays=(0, 0), record_format="binary"))
+    client.messages.extend(make_message(i) for i in range(11, 16))
+    asyncio.run(dump_messages(client, "chat", output_file, min_id=get_last_message_id(output_file), delays=(0, 0)))
+
+    assert records.detect_format(output_file) == "binary"
+    assert [r["msg_id"] for r in read_records(output_file)] == list(range(1, 16))
+
+
+def test_clean_reads_every_format(tmp_path):
+    client = FakeClient([make_message(i, reply_to=i - 1 if i > 1 else None) for i in range(1, 21)])
+    outputs = []
+    for fmt in records.FORMATS:
+        export = tmp_path / f"export.{fmt}"
+        asyncio.run(dump_messages(client, "chat", export, delays=(0, 0), record_format=fmt))
+        clean_file = tmp_path / f"clean_{fmt}.txt"
+        convert_to_clean_format(export, clean_file)
+        outputs.append(clean_file.read_text())
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert "[2025-01-01 00:20] alice (replying to #19 alice: \"message 19\"): message 20" in outputs[0]
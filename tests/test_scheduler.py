@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import click
+import pytest
+
+from tg_export.scheduler import FollowScheduler, load_config, next_interval, update_rate
+
+from .fakes import FakeClient, make_message
+
+
+class TestPollInterval:
+    def test_busy_chat_polled_at_minimum(self):
+        assert next_interval(10.0, min_interval=300, max_interval=3600) == 300
+
+    def test_quiet_chat_polled_rarely(self):
+        assert next_interval(None, min_interval=300, max_interval=3600) == 3600
+        assert next_interval(0.0, min_interval=300, max_interval=3600) == 3600
+
+    def test_interval_scales_with_rate(self):
+        assert next_interval(50 / 1000, min_interval=300, max_interval=3600) == pytest.approx(1000)
+
+    def test_rate_smoothing(self):
+        assert update_rate(None, 10, 100) == pytest.approx(0.1)
+        assert update_rate(0.1, 0, 100, smoothing=0.5) == pytest.approx(0.05)
+
+
+def test_load_config_requires_chats(tmp_path):
+    config = tmp_path / "follow.json"
+    config.write_text(json.dumps({"chats": [{"chat_url": "https://t.me/a"}]}))
+    with pytest.raises(click.ClickException):
+        load_config(config)
+
+
+def test_poll_keeps_persistent_cursor(tmp_path):
+    client = FakeClient([make_message(i) for i in range(1, 6)])
+    out = tmp_path / "a.jsonl"
+    state_file = tmp_path / "state.json"
+    chats = [{"chat_url": "https://t.me/a", "out": str(out)}]
+
+    scheduler = FollowScheduler(client, chats, state_file)
+    asyncio.run(scheduler.poll("https://t.me/a"))
+    # Following starts at the newest message, so nothing is exported yet
+    assert json.loads(state_file.read_text())["https://t.me/a"]["cursor"] == 5
+
+    client.messages += [make_message(i) for i in range(6, 9)]
+    scheduler = FollowScheduler(client, chats, state_file)
+    asyncio.run(scheduler.poll("https://t.me/a"))
+
+    ids = [json.loads(line)["msg_id"] for line in out.read_text().splitlines()]
+    assert ids == [6, 7, 8]
+    assert json.loads(state_file.read_text())["https://t.me/a"]["cursor"] == 8
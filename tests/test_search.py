@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from click.testing import CliRunner
+
+from tg_export.cli import dump_messages
+from tg_export.main import cli
+from tg_export.search import SearchIndex, epoch, index_path
+
+from .fakes import FakeClient, make_message
+
+TEXTS = ["Привет мир", "shipping the release today", "release notes are \"done\"", "lunch?", "Мир и дружба"]
+
+
+def messages(ids):
+    return [make_message(i, username="bob" if i % 2 else "alice", text=TEXTS[i % len(TEXTS)]) for i in ids]
+
+
+def test_index_queries(tmp_path):
+    export = tmp_path / "export.jsonl"
+    asyncio.run(dump_messages(FakeClient(messages(range(1, 21))), "chat", export, delays=(0, 0)))
+
+    with SearchIndex(export) as index:
+        assert index.update() == 20
+        msg_ids = lambda offsets: sorted(index.db.execute(
+            f"SELECT msg_id FROM messages WHERE offset IN ({','.join(map(str, offsets))})").fetchall())
+
+        assert msg_ids(index.search(["мир"])) == [(4,), (5,), (9,), (10,), (14,), (15,), (19,), (20,)]
+        assert msg_ids(index.search(["RELEASE", "notes"])) == [(2,), (7,), (12,), (17,)]
+        assert msg_ids(index.search(["release"], user="@Alice")) == [(2,), (6,), (12,), (16,)]
+        since = epoch(datetime(2025, 1, 1, 0, 10))
+        assert msg_ids(index.search(["мир"], since=since, until=since + 5 * 60)) == [(10,), (14,)]
+        assert len(index.search(limit=3)) == 3
+
+
+def test_index_updates_incrementally(tmp_path):
+    export = tmp_path / "export.tgx"
+    client = FakeClient(messages(range(1, 11)))
+    asyncio.run(dump_messages(client, "chat", export, reverse=True, delays=(0, 0), record_format="binary"))
+
+    with SearchIndex(export) as index:
+        assert index.update() == 10
+        client.messages.extend(messages(range(11, 16)))
+        asyncio.run(dump_messages(client, "chat", export, min_id=10, delays=(0, 0)))
+        assert index.update() == 5
+        assert index.update() == 0
+        assert len(index) == 15
+
+        # A rewritten archive is indexed from scratch
+        asyncio.run(dump_messages(FakeClient(messages(range(100, 103))), "chat", export, delays=(0, 0)))
+        assert index.update() == 3
+        assert len(index) == 3
+
+
+def test_partial_last_line_waits(tmp_path):
+    export = tmp_path / "export.jsonl"
+    asyncio.run(dump_messages(FakeClient(messages(range(1, 4))), "chat", export, delays=(0, 0)))
+    with open(export, "a") as f:
+        f.write('{"msg_id": 4, "chat_id": 1, "da')
+    with SearchIndex(export) as index:
+        assert index.update() == 3
+
+
+def test_search_command(tmp_path):
+    export = tmp_path / "export.jsonl"
+    asyncio.run(dump_messages(FakeClient(messages(range(1, 21))), "chat", export, delays=(0, 0)))
+
+    result = CliRunner().invoke(cli, ["search", str(export), "release", "--user", "bob", "--limit", "2"])
+    assert result.exit_code == 0, result.output
+    assert result.stdout.splitlines() == ["[2025-01-01 00:11] bob: shipping the release today",
+                                          "[2025-01-01 00:17] bob: release notes are \"done\""]
+    assert index_path(export).exists()
@@ -0,0 +1,88 @@
+import asyncio
+import json
+from pathlib import Path
+from unittest.mock import AsyncMock, Mock, patch
+
+from click.testing import CliRunner
+
+from tg_export.cli import dump_sharded
+from tg_export.main import cli
+from tg_export.sessions import DEFAULT_SESSION, SessionPool, available_sessions, session_path, split_id_range
+
+from .fakes import FakeClient, make_message
+
+
+class TestSplitIdRange:
+    def test_split_covers_range(self):
+        ranges = split_id_range(0, 100, 4)
+        assert ranges == [(0, 25), (25, 50), (50, 75), (75, 100)]
+
+    def test_split_small_range(self):
+        assert split_id_range(10, 12, 8) == [(10, 11), (11, 12)]
+
+    def test_split_empty_range(self):
+        assert split_id_range(5, 5, 4) == []
+
+
+class TestSessionPool:
+    def test_flood_waited_session_skipped(self):
+        async def run():
+            pool = SessionPool({"a": FakeClient([]), "b": FakeClient([])})
+            pool.flood_wait("a", 60)
+            name, _ = await pool.acquire()
+            pool.release(name)
+            return name, pool.blocked("a")
+
+        name, blocked = asyncio.run(run())
+        assert name == "b"
+        assert blocked > 0
+
+    def test_acquire_waits_for_flood_wait_to_expire(self):
+        async def run():
+            pool = SessionPool({"a": FakeClient([])})
+            pool.flood_wait("a", 0.05)
+            name, _ = await pool.acquire()
+            return name
+
+        assert asyncio.run(run()) == "a"
+
+
+class TestAvailableSessions:
+    def test_default_listed_once(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "sessions").mkdir()
+        for name in ("alt", "default"):
+            (tmp_path / "sessions" / f"{name}.session").write_text("")
+        assert available_sessions() == ["alt"]
+
+        DEFAULT_SESSION.write_text("")
+        assert available_sessions() == ["default", "alt"]
+        assert [session_path(name) for name in available_sessions()] == [DEFAULT_SESSION, Path("sessions/alt.session")]
+
+    @patch.dict('os.environ', {'TELEGRAM_API_ID': '12345', 'TELEGRAM_API_HASH': 'abcdef'})
+    def test_login_default_writes_plain_session(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        client = Mock(start=AsyncMock(), disconnect=AsyncMock())
+        client.session.save.return_value = "session_string"
+        with patch('tg_export.cli.TelegramClient', return_value=client):
+            result = CliRunner().invoke(cli, ['login', '--session', 'default'])
+
+        assert result.exit_code == 0, result.output
+        assert DEFAULT_SESSION.read_text() == "session_string"
+        assert not (tmp_path / "sessions" / "default.session").exists()
+
+
+def test_dump_sharded_survives_flood_wait(tmp_path):
+    messages = [make_message(i) for i in range(1, 61)]
+    pool = SessionPool({
+        "a": FakeClient(messages, flood_after=5),
+        "b": FakeClient(messages),
+    })
+    output = tmp_path / "out.jsonl"
+
+    count = asyncio.run(dump_sharded(pool, "chat", output, shards=6))
+
+    ids = [json.loads(line)["msg_id"] for line in output.read_text().splitlines()]
+    assert count == 60
+    assert ids == list(range(1, 61))
+    assert not list(tmp_path.glob("*.part*"))
@@ -0,0 +1,231 @@
+import asyncio
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from click.testing import CliRunner
+
+from tg_export import records
+from tg_export.cli import BATCH_SIZE, PREFETCH_MESSAGES, WRITE_AHEAD, dump_messages, message_record
+from tg_export.main import cli
+from tg_export.sinks import FileSink, StreamSink, WebhookSink
+from tests.fakes import FakeClient, make_message
+
+
+def record(msg_id):
+    return message_record(make_message(msg_id), "alice")
+
+
+def encoded(batch, fmt="jsonl"):
+    return b"".join(records.encode(r, fmt) for r in batch)
+
+
+class SlowStream(io.BytesIO):
+    """Records how many messages the client had served when each write began"""
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.served_at = []
+
+    def write(self, data):
+        self.served_at.append(self.client.served)
+        time.sleep(0.02)
+        return super().write(data)
+
+
+class TestStreamSink:
+    def test_header_once_and_cursor(self):
+        stream = io.BytesIO()
+        sink = StreamSink(stream, "binary")
+        for batch in ([record(3), record(1)], [record(2)]):
+            sink.write(batch, encoded(batch, "binary"))
+        sink.close()
+
+        assert stream.getvalue().startswith(records.MAGIC)
+        assert stream.getvalue().count(records.MAGIC) == 1
+        assert sink.last_id == 3
+        assert sink.bytes_written == len(stream.getvalue())
+
+    def test_dump_to_stream(self):
+        client = FakeClient([make_message(i) for i in range(1, 251)])
+        stream = io.BytesIO()
+        sink = StreamSink(stream)
+
+        count = asyncio.run(dump_messages(client, "chat", None, min_id=50, delays=(0, 0), sink=sink))
+
+        ids = [json.loads(line)["msg_id"] for line in stream.getvalue().splitlines()]
+        assert count == 200
+        assert ids == list(range(51, 251))
+        assert sink.last_id == 250
+
+    def test_slow_reader_holds_back_fetching(self):
+        client = FakeClient([make_message(i) for i in range(1, 2001)])
+        stream = SlowStream(client)
+
+        asyncio.run(dump_messages(client, "chat", None, delays=(0, 0), sink=StreamSink(stream)))
+
+        in_flight = PREFETCH_MESSAGES + (WRITE_AHEAD + 3) * BATCH_SIZE
+        assert len(stream.served_at) == 2000 // BATCH_SIZE
+        assert all(served - n * BATCH_SIZE <= in_flight for n, served in enumerate(stream.served_at))
+
+    def test_closed_pipe_stops_dump(self):
+        read_end, write_end = os.pipe()
+        os.close(read_end)
+        client = FakeClient([make_message(i) for i in range(1, 2001)])
+        with open(write_end, "wb") as stream:
+            with pytest.raises(BrokenPipeError):
+                asyncio.run(dump_messages(client, "chat", None, delays=(0, 0), sink=StreamSink(stream)))
+        assert client.served < 2000
+
+    def test_failing_sink_stops_fetch(self):
+        class FailingSink(StreamSink):
+            def write(self, batch, data):
+                raise OSError("disk full")
+
+        client = FakeClient([make_message(i) for i in range(1, 2001)])
+        with pytest.raises(OSError, match="disk full"):
+            asyncio.run(dump_messages(client, "chat", None, delays=(0, 0), sink=FailingSink(io.BytesIO())))
+        # Noticed on the next batch, well before WRITE_AHEAD batches have piled up
+        assert client.served <= PREFETCH_MESSAGES + 3 * BATCH_SIZE
+
+
+class TestFileSink:
+    def test_append_keeps_format(self, tmp_path):
+        path = tmp_path / "out.bin"
+        sink = FileSink(path, record_format="binary")
+        sink.write([record(1)], encoded([record(1)], "binary"))
+        sink.close()
+
+        sink = FileSink(path, append=True)
+        assert sink.record_format == "binary"
+        assert sink.bytes_written == 0
+        sink.close()
+
+
+class Endpoint(BaseHTTPRequestHandler):
+    """Answers POSTs with the queued status codes (then 200), keeping the bodies"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.bodies.append(body)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint():
+    server = HTTPServer(("127.0.0.1", 0), Endpoint)
+    server.bodies = []
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_port}/hook"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post_batches(sink, count, per_write=10):
+    for start in range(1, count + 1, per_write):
+        batch = [record(i) for i in range(start, start + per_write)]
+        sink.write(batch, encoded(batch))
+    sink.close()
+
+
+class TestWebhookSink:
+    def test_batches_by_count(self, endpoint):
+        sink = WebhookSink(endpoint.url, batch_size=25, batch_seconds=60)
+        post_batches(sink, 100)
+
+        sizes = [len(body.splitlines()) for body in endpoint.bodies]
+        assert sizes == [30, 30, 30, 10]
+        ids = [json.loads(line)["msg_id"] for body in endpoint.bodies for line in body.splitlines()]
+        assert ids == list(range(1, 101))
+        assert sink.last_id == 100
+        assert sink.batches == 4
+
+    def test_batches_by_bytes(self, endpoint):
+        sink = WebhookSink(endpoint.url, batch_bytes=1, batch_seconds=60)
+        post_batches(sink, 30)
+        assert len(endpoint.bodies) == 3
+
+    def test_batches_by_age(self, endpoint):
+        sink = WebhookSink(endpoint.url, batch_seconds=0)
+        post_batches(sink, 30)
+        assert len(endpoint.bodies) == 3
+
+    def test_close_posts_the_rest(self, endpoint):
+        sink = WebhookSink(endpoint.url, batch_seconds=60)
+        sink.write([record(1)], encoded([record(1)]))
+        assert endpoint.bodies == []
+        assert sink.last_id is None
+        sink.close()
+        assert len(endpoint.bodies) == 1
+        assert sink.last_id == 1
+
+    def test_retries_server_errors(self, endpoint):
+        endpoint.statuses = [503, 429, 502]
+        sink = WebhookSink(endpoint.url, backoff=0)
+        post_batches(sink, 10)
+
+        assert len(endpoint.bodies) == 4
+        assert len(set(endpoint.bodies)) == 1
+        assert sink.batches == 1
+
+    def test_gives_up_after_retries(self, endpoint):
+        endpoint.statuses = [500] * 3
+        sink = WebhookSink(endpoint.url, retries=2, backoff=0)
+        with pytest.raises(urllib.error.HTTPError):
+            post_batches(sink, 10)
+        assert len(endpoint.bodies) == 3
+        assert sink.last_id is None
+
+    def test_client_errors_not_retried(self, endpoint):
+        endpoint.statuses = [400]
+        sink = WebhookSink(endpoint.url, backoff=0)
+        with pytest.raises(urllib.error.HTTPError):
+            post_batches(sink, 10)
+        assert len(endpoint.bodies) == 1
+
+    def test_connection_errors_retried(self):
+        server = HTTPServer(("127.0.0.1", 0), Endpoint)
+        url = f"http://127.0.0.1:{server.server_port}/hook"
+        server.server_close()
+
+        sink = WebhookSink(url, retries=1, backoff=0)
+        with pytest.raises(urllib.error.URLError):
+            post_batches(sink, 10)
+
+    def test_binary_rejected(self):
+        with pytest.raises(ValueError):
+            WebhookSink("http://127.0.0.1/hook", "binary")
+
+
+class TestStreamingOptions:
+    def test_out_or_webhook_required(self):
+        result = CliRunner().invoke(cli, ['dump', '--chat-url', 'https://t.me/x'])
+        assert result.exit_code != 0
+        assert "exactly one of --out and --webhook" in result.output
+
+    def test_stream_cannot_combine_with_pool(self):
+        result = CliRunner().invoke(cli, ['dump', '--chat-url', 'https://t.me/x', '--out', '-', '--pool'])
+        assert result.exit_code != 0
+        assert "cannot be combined" in result.output
+
+    def test_webhook_needs_json(self):
+        result = CliRunner().invoke(cli, ['dump', '--chat-url', 'https://t.me/x', '--webhook', 'http://127.0.0.1/hook', '--format', 'binary'])
+        assert result.exit_code != 0
+        assert "NDJSON" in result.output
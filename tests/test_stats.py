@@ -0,0 +1,63 @@
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from tg_export import stats as stats_module
+from tg_export.cli import dump_messages
+from tg_export.main import cli
+from tg_export.reader import ExportReader
+from tg_export.stats import count_range, export_stats
+
+from .fakes import FakeClient, make_message
+
+
+def make_export(path, fmt="jsonl", count=120):
+    messages = [make_message(i, username="price_bot" if i % 10 == 0 else ("alice" if i % 3 else "bob")) for i in range(1, count + 1)]
+    asyncio.run(dump_messages(FakeClient(messages), "chat", path, delays=(0, 0), record_format=fmt))
+    return path
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "binary"])
+def test_ranges_merge_to_single_pass(tmp_path, monkeypatch, fmt):
+    export = make_export(tmp_path / "export", fmt)
+    with ExportReader(export) as reader:
+        ranges = reader.split(7)
+    assert len(ranges) > 1
+    assert ranges[0][0] < ranges[0][1] == ranges[1][0]
+
+    merged = count_range(export, *ranges[0])
+    for start, end in ranges[1:]:
+        merged.merge(count_range(export, start, end))
+    assert merged.to_dict() == count_range(export).to_dict()
+
+    monkeypatch.setattr(stats_module, "PARALLEL_MIN_BYTES", 0)
+    assert export_stats(export, workers=3).to_dict() == merged.to_dict()
+
+
+def test_stats_summary(tmp_path):
+    summary = count_range(make_export(tmp_path / "export.jsonl")).to_dict(top=2)
+    assert summary["total"] == 120
+    assert summary["bots"] == 12
+    assert summary["bot_share"] == 0.1
+    assert summary["top_posters"] == [{"user": "alice", "messages": 72}, {"user": "bob", "messages": 36}]
+    assert summary["per_hour"]["00"] == 59 and summary["per_hour"]["01"] == 60 and summary["per_hour"]["02"] == 1
+    assert summary["first"] == "2025-01-01 00:01" and summary["last"] == "2025-01-01 02:00"
+
+
+def test_stats_command(tmp_path):
+    export = make_export(tmp_path / "export.jsonl")
+    result = CliRunner().invoke(cli, ["stats", str(export), "--jobs", "1"])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output)["total"] == 120
+
+    out = tmp_path / "stats.csv"
+    result = CliRunner().invoke(cli, ["stats", str(export), "--format", "csv", "--out", str(out), "--top", "1"])
+    assert result.exit_code == 0, result.output
+    rows = list(csv.reader(io.StringIO(out.read_text())))
+    assert rows[0] == ["metric", "key", "value"]
+    assert ["messages_by_user", "alice", "72"] in rows
+    assert ["bot_share", "", "0.1"] in rows
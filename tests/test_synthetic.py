@@ -0,0 +1,57 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+from telethon.errors import FloodWaitError
+
+from benchmarks.run import bench_clean, bench_dump, bench_web, parse_size
+from benchmarks.synthetic import SyntheticClient
+
+
+async def collect(client, **kwargs):
+    return [m.id async for m in client.iter_messages(client.peer, **kwargs)]
+
+
+class TestSyntheticClient:
+    def test_newest_first_by_default(self):
+        client = SyntheticClient(250)
+        ids = asyncio.run(collect(client))
+        assert ids == list(range(250, 0, -1))
+        assert client.requests == 3
+
+    def test_min_max_reverse(self):
+        client = SyntheticClient(250)
+        assert asyncio.run(collect(client, min_id=10, max_id=15, reverse=True)) == [11, 12, 13, 14]
+
+    def test_stream_is_reproducible(self):
+        end = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        first = SyntheticClient(100, seed=3, end=end).message(42)
+        second = SyntheticClient(100, seed=3, end=end).message(42)
+        assert (first.text, first.sender_id, first.date) == (second.text, second.sender_id, second.date)
+
+    def test_injected_flood_wait(self):
+        client = SyntheticClient(100, flood_every=30)
+        with pytest.raises(FloodWaitError):
+            asyncio.run(collect(client))
+        assert client.served == 30
+
+
+class TestBenchmarks:
+    def test_parse_size(self):
+        assert parse_size("10k") == 10_000
+        assert parse_size("1M") == 1_000_000
+        assert parse_size("500") == 500
+
+    def test_dump_benchmark_recovers_from_flood_waits(self, tmp_path):
+        result = bench_dump(500, tmp_path, flood_every=120)
+        ids = [json.loads(line)["msg_id"] for line in (tmp_path / "dump.jsonl").read_text().splitlines()]
+        assert ids == list(range(1, 501))
+        assert result["bytes_written"] > 0
+
+    def test_clean_benchmark(self, tmp_path):
+        assert bench_clean(300, tmp_path)["bytes_written"] > 0
+
+    def test_web_benchmark(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        assert bench_web(300, tmp_path)["bytes_written"] > 0
@@ -0,0 +1,62 @@
+import asyncio
+
+from tg_export.clean_export import convert_to_clean_format
+from tg_export.cli import dump_messages, fetch_parents
+from tg_export.threads import ParentCache, ParentIndex, parent_cache_path, snippet, thread_rows
+
+from .fakes import FakeClient, make_message
+
+
+def rows(ids, reply_gap):
+    for msg_id in ids:
+        yield None, {"msg_id": msg_id, "sender_id": 1, "sender_username": "alice", "text": f"message {msg_id}",
+                     "reply_to": msg_id - reply_gap if msg_id > reply_gap else None}
+
+
+def test_snippet():
+    assert snippet("  short\n text ") == "short text"
+    assert snippet("word " * 30, limit=12) == "word word…"
+
+
+def test_parent_index_is_bounded():
+    index = ParentIndex(2)
+    for msg_id in range(1, 4):
+        index.add(msg_id, "alice", "text")
+    assert 1 not in index and 3 in index and len(index) == 2
+
+
+def test_thread_rows_in_both_orders():
+    for ids in (range(1, 21), range(20, 0, -1)):
+        threaded = [data for chat, data in thread_rows(rows(ids, 3), window=5)]
+        assert [data["msg_id"] for data in threaded] == list(ids)
+        assert {data["msg_id"]: data["parent"] for data in threaded if "parent" in data}[10] == ("alice", "message 7")
+        assert all("parent" in data for data in threaded if data["reply_to"])
+
+    # Parents further away than the window are left for the cache
+    far = {data["msg_id"]: data for chat, data in thread_rows(rows(range(1, 41), 8), window=5)}
+    assert "parent" not in far[20]
+
+
+def test_fetch_parents_batches_and_caches(tmp_path):
+    messages = [make_message(i) for i in range(1, 201)]
+    messages += [make_message(i, username="bob", reply_to=i - 150 if i < 380 else 999) for i in range(201, 401)]
+    client = FakeClient(messages)
+    export = tmp_path / "export.jsonl"
+    asyncio.run(dump_messages(client, "chat", export, min_id=200, delays=(0, 0)))
+
+    cache_dir = tmp_path / "parents"
+    # 150 missing parents (51-200) plus a deleted one: two batched requests
+    assert asyncio.run(fetch_parents(client, "chat", export, cache_dir, delays=(0, 0))) == 2
+    assert asyncio.run(fetch_parents(client, "chat", export, cache_dir, delays=(0, 0))) == 0
+
+    with ParentCache(parent_cache_path(-1000000001234, cache_dir)) as cache:
+        assert len(cache) == 151
+        assert cache.get(60) == ("alice", "message 60")
+        assert cache.get(999)[1] == ""
+
+    clean_file = tmp_path / "clean.txt"
+    convert_to_clean_format(export, clean_file, parents_dir=cache_dir)
+    text = clean_file.read_text()
+    assert 'bob (replying to #60 alice: "message 60"): message 210' in text
+    assert 'bob (replying to #200 alice: "message 200"): message 350' in text
+    assert "bob (replying to #999): message 390" in text
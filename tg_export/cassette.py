@@ -0,0 +1,216 @@
+"""Record and replay the Telegram API traffic of an export.
+
+A cassette is a gzip stream of frames. Each frame carries its kind, the id
+of the call it belongs to, the time the API took to produce it and a
+payload: JSON for calls and errors, raw TL bytes for entities and messages.
+The first frame holds the time the recording started, so windows like
+`quick --hours` are measured from then when the cassette is replayed.
+Replaying a cassette runs the export pipeline offline, either as fast as
+possible or with the recorded API timing.
+"""
+import asyncio
+import gzip
+import json
+import struct
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from telethon.errors import FloodWaitError
+from telethon.extensions import BinaryReader, markdown
+from telethon.utils import get_peer_id
+
+FRAME = struct.Struct('<BIdI')  # kind, call id, seconds, payload length
+
+CALL = 1
+ENTITY = 2
+MESSAGE = 3
+SENDER = 4
+ERROR = 5
+START = 6
+
+
+class ReplayError(Exception):
+    """The export asked for something that is not in the cassette"""
+
+
+def _started(payload: bytes) -> datetime:
+    # Naive local time, like the datetime.now() that time windows are measured from
+    return datetime.fromtimestamp(json.loads(payload)["started"])
+
+
+def recording_started(path: Path) -> Optional[datetime]:
+    """When a cassette was recorded; None for cassettes recorded before this was kept"""
+    with gzip.open(path, 'rb') as f:
+        header = f.read(FRAME.size)
+        if len(header) < FRAME.size:
+            return None
+        kind, call_id, seconds, length = FRAME.unpack(header)
+        return _started(f.read(length)) if kind == START else None
+
+
+def call_key(method: str, target, **kwargs) -> str:
+    """Identify an API call independently of the entity object passed in"""
+    try:
+        target = get_peer_id(target)
+    except Exception:
+        target = str(target)
+    args = {k: v for k, v in kwargs.items() if v is not None}
+    return json.dumps([method, target, args], sort_keys=True, default=str)
+
+
+class RecordingClient:
+    """Wraps a TelegramClient and records get_entity/iter_messages traffic"""
+
+    def __init__(self, client, path: Path):
+        self._client = client
+        self._file = gzip.open(path, 'wb')
+        self._calls = 0
+        self._senders = set()
+        self._frame(START, 0, 0.0, json.dumps({"started": time.time()}).encode('utf-8'))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _frame(self, kind: int, call_id: int, seconds: float, payload: bytes):
+        self._file.write(FRAME.pack(kind, call_id, seconds, len(payload)))
+        self._file.write(payload)
+
+    def _begin(self, key: str) -> int:
+        self._calls += 1
+        self._frame(CALL, self._calls, 0.0, key.encode('utf-8'))
+        return self._calls
+
+    def _error(self, call_id: int, seconds: float, error: Exception):
+        info = {"type": type(error).__name__, "message": str(error)}
+        if isinstance(error, FloodWaitError):
+            info["seconds"] = error.seconds
+        self._frame(ERROR, call_id, seconds, json.dumps(info).encode('utf-8'))
+
+    async def get_entity(self, entity):
+        call_id = self._begin(call_key("get_entity", entity))
+        start = time.perf_counter()
+        try:
+            result = await self._client.get_entity(entity)
+        except Exception as e:
+            self._error(call_id, time.perf_counter() - start, e)
+            raise
+        self._frame(ENTITY, call_id, time.perf_counter() - start, bytes(result))
+        return result
+
+    async def iter_messages(self, entity, **kwargs):
+        call_id = self._begin(call_key("iter_messages", entity, **kwargs))
+        messages = self._client.iter_messages(entity, **kwargs).__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                message = await messages.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                self._error(call_id, time.perf_counter() - start, e)
+                raise
+            elapsed = time.perf_counter() - start
+
+            sender = message.sender
+            if sender is not None and message.sender_id not in self._senders:
+                self._senders.add(message.sender_id)
+                self._frame(SENDER, call_id, 0.0, bytes(sender))
+            self._frame(MESSAGE, call_id, elapsed, bytes(message))
+            yield message
+
+    async def disconnect(self):
+        self._file.close()
+        await self._client.disconnect()
+
+
+class _NoEntityCache:
+    def get(self, peer_id):
+        return None
+
+
+class ReplayClient:
+    """Serves a recorded cassette in place of a TelegramClient.
+
+    With realtime=True each frame is delayed by the time the API took when
+    it was recorded; otherwise frames are served as fast as possible.
+    `started` is when the cassette was recorded (None if it does not say).
+    """
+
+    def __init__(self, path: Path, realtime: bool = False):
+        self.realtime = realtime
+        self.started = None
+        self.parse_mode = markdown
+        self._self_id = None
+        self._mb_entity_cache = _NoEntityCache()
+        self._senders = {}
+        self._calls = defaultdict(deque)  # call key -> call ids, in recorded order
+        self._frames = defaultdict(list)  # call id -> [(kind, seconds, payload)]
+
+        data = bytearray()
+        with gzip.open(path, 'rb') as f:
+            try:
+                while chunk := f.read(1 << 20):
+                    data += chunk
+            except EOFError:
+                pass  # Recording was interrupted; replay what was written
+
+        offset = 0
+        while offset + FRAME.size <= len(data):
+            kind, call_id, seconds, length = FRAME.unpack_from(data, offset)
+            offset += FRAME.size
+            if offset + length > len(data):
+                break
+            payload = bytes(data[offset:offset + length])
+            offset += length
+            if kind == START:
+                self.started = _started(payload)
+            elif kind == CALL:
+                self._calls[payload.decode('utf-8')].append(call_id)
+            else:
+                self._frames[call_id].append((kind, seconds, payload))
+
+    async def start(self):
+        return self
+
+    async def disconnect(self):
+        pass
+
+    def _take(self, key: str) -> list:
+        if not self._calls[key]:
+            raise ReplayError(f"No recorded call matches {key}")
+        return self._frames[self._calls[key].popleft()]
+
+    async def _wait(self, seconds: float):
+        if self.realtime and seconds:
+            await asyncio.sleep(seconds)
+
+    @staticmethod
+    def _raise(payload: bytes):
+        info = json.loads(payload)
+        if info["type"] == "FloodWaitError":
+            raise FloodWaitError(None, capture=info["seconds"])
+        raise ReplayError(f"{info['type']}: {info['message']}")
+
+    async def get_entity(self, entity):
+        for kind, seconds, payload in self._take(call_key("get_entity", entity)):
+            await self._wait(seconds)
+            if kind == ERROR:
+                self._raise(payload)
+            return BinaryReader(payload).tgread_object()
+        raise ReplayError("Recorded get_entity call has no result")
+
+    async def iter_messages(self, entity, **kwargs):
+        for kind, seconds, payload in self._take(call_key("iter_messages", entity, **kwargs)):
+            if kind == SENDER:
+                sender = BinaryReader(payload).tgread_object()
+                self._senders[get_peer_id(sender)] = sender
+                continue
+            await self._wait(seconds)
+            if kind == ERROR:
+                self._raise(payload)
+            message = BinaryReader(payload).tgread_object()
+            message._finish_init(self, self._senders, None)
+            yield message
@@ -0,0 +1,82 @@
+"""Edits and deletions of archived messages, kept beside the archive.
+
+Exports are append-only, so `reconcile` does not rewrite them: it appends
+compact change records to <archive>.changes.jsonl, and readers overlay
+them on the archive (the latest change for a message wins).
+
+    {"op":"edit","id":42,"ts":1735700000,"text":"fixed typo","ent":[["b",0,5]]}
+    {"op":"del","id":43,"ts":1735700000}
+"""
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from . import records
+
+CHANGES_SUFFIX = ".changes.jsonl"
+EDIT = "edit"
+DELETE = "del"
+
+
+def changes_path(archive: Path) -> Path:
+    archive = Path(archive)
+    return archive.with_name(archive.name + CHANGES_SUFFIX)
+
+
+def edit_change(msg_id: int, ts: int, text: str, entities: list) -> dict:
+    change = {"op": EDIT, "id": msg_id, "ts": ts, "text": text}
+    if entities:
+        change["ent"] = records.compact_entities(entities)
+    return change
+
+
+def delete_change(msg_id: int, ts: int) -> dict:
+    return {"op": DELETE, "id": msg_id, "ts": ts}
+
+
+def read_changes(archive: Path, offset: int = 0) -> Iterator[tuple]:
+    """Yield (end offset, change) for the complete change records from offset on"""
+    path = changes_path(archive)
+    if not path.exists():
+        return
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            offset += len(line)
+            if not line.endswith(b"\n"):
+                return  # Still being written
+            if line.strip():
+                yield offset, json.loads(line)
+
+
+def load_changes(archive: Path) -> Dict[int, Optional[dict]]:
+    """msg_id -> the latest {'text', 'entities'} for edited messages, or None for deleted ones"""
+    changes = {}
+    for offset, change in read_changes(archive):
+        if change["op"] == DELETE:
+            changes[change["id"]] = None
+        else:
+            changes[change["id"]] = {"text": change["text"], "entities": records.expand_entities(change.get("ent", []))}
+    return changes
+
+
+def apply_change(data: dict, changes: Dict[int, Optional[dict]]) -> Optional[dict]:
+    """A record's fields with its latest change applied; None if the message was deleted"""
+    if data["msg_id"] not in changes:
+        return data
+    change = changes[data["msg_id"]]
+    if change is None:
+        return None
+    for name in ("text", "entities"):
+        if name in data:
+            data[name] = change[name]
+    return data
+
+
+def append_changes(archive: Path, new: Iterable[dict]) -> int:
+    """Append change records; returns how many"""
+    lines = [json.dumps(change, ensure_ascii=False, separators=(",", ":")) + "\n" for change in new]
+    if lines:
+        with open(changes_path(archive), "a", encoding="utf-8") as f:
+            f.writelines(lines)
+    return len(lines)
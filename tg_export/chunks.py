@@ -0,0 +1,241 @@
+"""Clean output split into chunks that fit an LLM context.
+
+Each chunk stays under a token budget, estimated from UTF-8 length
+(about 4 bytes per token) rather than a real tokenizer. A chunk is cut at
+the best break near its end: a long silence first, then the start of a
+new thread, and mid-thread only when nothing better is in reach. Optional
+overlap repeats the last messages of a chunk at the start of the next.
+
+Large exports are split into byte ranges (moved to silences) that are
+chunked in a process pool; chunks never span two ranges. A manifest.json
+lists the chunks in order.
+"""
+import calendar
+import json
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from .clean_export import (CHUNK_GAP_MINUTES, CLEAN_FIELDS, clean_messages, format_clean_line, new_stats,
+                           record_clean_metrics)
+from .reader import ExportReader
+from .threads import ParentCache, export_chat_id, parent_cache_path, thread_rows
+
+BYTES_PER_TOKEN = 4
+# A chunk is not cut at a break that would leave it less than this full
+MIN_FILL = 0.5
+# Exports smaller than this are chunked in-process
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+# Records scanned past a range boundary looking for a silence to move it to
+ALIGN_LIMIT = 10000
+MANIFEST = "manifest.json"
+CHUNK_PREFIX = "chunk_"
+
+# Break quality before a message
+MID_THREAD, NEW_THREAD, SILENCE = 0, 1, 2
+
+Entry = namedtuple("Entry", "line tokens minute score")
+Chunk = namedtuple("Chunk", "lines tokens first last overlap")
+
+
+def estimate_tokens(text: str) -> int:
+    size = len(text) if text.isascii() else len(text.encode("utf-8"))
+    return -(-size // BYTES_PER_TOKEN)
+
+
+class Chunker:
+    """Groups formatted lines into token-budgeted chunks, cutting at natural breaks"""
+
+    def __init__(self, max_tokens: int, overlap: int = 0, gap_minutes: int = CHUNK_GAP_MINUTES):
+        if overlap * 2 > max_tokens:
+            raise ValueError("Overlap must be at most half the token budget")
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.gap = gap_minutes
+        self.entries = []
+        self.size = 0
+        self.carried = 0    # Leading entries repeated from the previous chunk
+        self.last_minute = None
+
+    def add(self, line: str, minute: int, is_reply: bool) -> Iterator[Chunk]:
+        """Add a line (minute: its time in epoch minutes), yielding any chunk it completes"""
+        tokens = estimate_tokens(line)
+        if self.last_minute is not None and abs(minute - self.last_minute) >= self.gap:
+            score = SILENCE
+        else:
+            score = MID_THREAD if is_reply else NEW_THREAD
+        self.last_minute = minute
+
+        while self.entries and self.size + tokens > self.max_tokens:
+            if len(self.entries) == self.carried:
+                # Only the overlap is left and it does not fit with this line
+                self.entries, self.size, self.carried = [], 0, 0
+                break
+            yield self._cut(score)
+        self.entries.append(Entry(line, tokens, minute, score))
+        self.size += tokens
+
+    def finish(self) -> Iterator[Chunk]:
+        if len(self.entries) > self.carried:
+            yield self._chunk(self.entries)
+        self.entries, self.size, self.carried = [], 0, 0
+
+    def _cut(self, next_score: int) -> Chunk:
+        # Best break: highest score, then latest, among those filling the chunk enough
+        best, best_score = len(self.entries), next_score
+        floor = self.max_tokens * MIN_FILL
+        filled = sum(entry.tokens for entry in self.entries[:self.carried + 1])
+        for k in range(self.carried + 1, len(self.entries)):
+            score = self.entries[k].score
+            if filled >= floor and (score > best_score or (score == best_score and k > best)):
+                best, best_score = k, score
+            filled += self.entries[k].tokens
+
+        chunk_entries, rest = self.entries[:best], self.entries[best:]
+        chunk = self._chunk(chunk_entries)
+
+        tail, tail_tokens = [], 0
+        for entry in reversed(chunk_entries[self.carried:]):
+            if tail_tokens + entry.tokens > self.overlap:
+                break
+            tail.insert(0, entry)
+            tail_tokens += entry.tokens
+        self.entries = tail + rest
+        self.carried = len(tail)
+        self.size = sum(entry.tokens for entry in self.entries)
+        return chunk
+
+    def _chunk(self, entries: List[Entry]) -> Chunk:
+        minutes = [entry.minute for entry in entries]
+        return Chunk([entry.line for entry in entries], sum(entry.tokens for entry in entries),
+                     min(minutes), max(minutes), self.carried)
+
+
+def _epoch_minute(readable: str) -> int:
+    return calendar.timegm(time.strptime(readable, "%Y-%m-%d %H:%M")) // 60
+
+
+def _minute(ts: int) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.gmtime(ts * 60))
+
+
+def chunk_messages(messages, max_tokens: int, overlap: int = 0, gap_minutes: int = CHUNK_GAP_MINUTES,
+                   format: str = "txt") -> Iterator[Chunk]:
+    """Chunks of clean messages, as .txt lines or clean JSONL"""
+    chunker = Chunker(max_tokens, overlap, gap_minutes)
+    readable, minute = None, None
+    for msg in messages:
+        if msg['time'] != readable:
+            readable, minute = msg['time'], _epoch_minute(msg['time'])
+        line = (format_clean_line(msg) if format == "txt" else json.dumps(msg, ensure_ascii=False)) + "\n"
+        yield from chunker.add(line, minute, 'replying_to_msg_id' in msg)
+    yield from chunker.finish()
+
+
+def align_to_silences(reader: ExportReader, bounds: List[Tuple[int, int]], gap_minutes: int) -> List[Tuple[int, int]]:
+    """Move the boundaries between byte ranges forward to the next silence, where one is near"""
+    starts = [reader.start]
+    for start, end in bounds[1:]:
+        previous = None
+        for scanned, (offset, raw) in enumerate(reader.records(start)):
+            ts = reader.fields(raw, ('ts',))['ts']
+            if previous is not None and abs(ts - previous) >= gap_minutes * 60:
+                start = offset
+                break
+            if scanned >= ALIGN_LIMIT:
+                break
+            previous = ts
+        if start > starts[-1]:
+            starts.append(start)
+    return list(zip(starts, starts[1:] + [reader.end]))
+
+
+def chunk_range(input_file: Path, start: Optional[int], end: Optional[int], output_dir: Path, prefix: str,
+                max_tokens: int, overlap: int, gap_minutes: int, format: str, filter_bots: bool,
+                cache_file: Optional[Path]) -> Tuple[dict, List[dict]]:
+    """Clean and chunk the records starting in [start, end) into prefix<n> files; returns (stats, chunk entries)"""
+    stats = new_stats()
+    written = []
+    with ExportReader(input_file) as reader, ParentCache(cache_file) as cache:
+        end = reader.end if end is None else end
+
+        def rows():
+            for offset, raw in reader.records(start):
+                if offset >= end:
+                    return
+                data = reader.current(raw, CLEAN_FIELDS)
+                if data is not None:
+                    yield None, data
+
+        messages = clean_messages(thread_rows(rows(), cache), stats, filter_bots)
+        for n, chunk in enumerate(chunk_messages(messages, max_tokens, overlap, gap_minutes, format), 1):
+            path = output_dir / f"{prefix}{n:04d}.{format}"
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(chunk.lines)
+            written.append({"file": path.name, "messages": len(chunk.lines), "tokens": chunk.tokens,
+                            "first": _minute(chunk.first), "last": _minute(chunk.last),
+                            "overlap_messages": chunk.overlap, "over_budget": chunk.tokens > max_tokens})
+    return stats, written
+
+
+def _chunk_job(job: tuple) -> Tuple[dict, List[dict]]:
+    return chunk_range(*job)
+
+
+def chunk_export(input_file: Path, output_dir: Path, max_tokens: int, overlap: int = 0,
+                 gap_minutes: int = CHUNK_GAP_MINUTES, format: str = "txt", filter_bots: bool = True,
+                 parents_dir: Optional[Path] = None, workers: int = 1) -> dict:
+    """Write an export's clean output as chunk files plus a manifest; returns clean stats and chunk totals"""
+    Chunker(max_tokens, overlap)  # Validates the budget before any work
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for old in output_dir.glob(f"{CHUNK_PREFIX}*"):
+        old.unlink()
+
+    chat_id = export_chat_id(input_file) if parents_dir else None
+    cache_file = parent_cache_path(chat_id, parents_dir) if chat_id is not None else None
+
+    with ExportReader(input_file) as reader:
+        ranges = reader.split(workers) if workers > 1 and reader.size >= PARALLEL_MIN_BYTES else []
+        if len(ranges) > 1:
+            ranges = align_to_silences(reader, ranges, gap_minutes)
+    if len(ranges) <= 1:
+        ranges = [(None, None)]
+
+    jobs = [(input_file, start, end, output_dir, f"part{i:04d}_", max_tokens, overlap, gap_minutes, format,
+             filter_bots, cache_file) for i, (start, end) in enumerate(ranges)]
+    if len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+            results = list(pool.map(_chunk_job, jobs))
+    else:
+        results = [_chunk_job(jobs[0])]
+
+    stats = new_stats()
+    chunks = []
+    for part_stats, part_chunks in results:
+        for key in stats:
+            stats[key] += part_stats[key]
+        for entry in part_chunks:
+            name = f"{CHUNK_PREFIX}{len(chunks) + 1:04d}.{format}"
+            (output_dir / entry["file"]).replace(output_dir / name)
+            chunks.append(dict(entry, file=name))
+    record_clean_metrics(stats)
+
+    manifest = {
+        "source": input_file.name,
+        "format": format,
+        "max_tokens": max_tokens,
+        "overlap_tokens": overlap,
+        "gap_minutes": gap_minutes,
+        "bytes_per_token": BYTES_PER_TOKEN,
+        "messages": stats['kept'],
+        "tokens": sum(entry["tokens"] for entry in chunks),
+        "chunks": chunks,
+    }
+    tmp = output_dir / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2))
+    tmp.replace(output_dir / MANIFEST)
+
+    stats['chunks'] = len(chunks)
+    return stats
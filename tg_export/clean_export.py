@@ -1,8 +1,25 @@
+import glob
 import json
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
 import click
-from datetime import datetime
+
+from . import metrics, records
+from .changes import CHANGES_SUFFIX, changes_path
+from .reader import ExportReader
+from .threads import PARENT_CACHE_DIR, ParentCache, display_name, export_chat_id, parent_cache_path, snippet, thread_rows
+
+# The only record fields clean needs, so the reader can skip the rest
+CLEAN_FIELDS = ('msg_id', 'ts', 'sender_id', 'sender_username', 'reply_to', 'text', 'media_type')
+# Clean outputs are named <export stem>_clean.<format>, or <export stem>_clean_chunks/ when chunked
+CLEAN_SUFFIX = '_clean'
+CHUNKS_SUFFIX = '_chunks'
+# Minutes of silence that make a preferred boundary between chunks
+CHUNK_GAP_MINUTES = 30
 
 
 def clean_text(text: str) -> str:
@@ -37,104 +54,248 @@ def is_bot_message(username: str, text: str) -> bool:
     return False
 
 
-def convert_to_clean_format(input_file: Path, output_file: Path, filter_bots: bool = True):
-    """Convert JSONL to a cleaner format for LLMs"""
-    
-    messages = []
-    stats = {
+def new_stats() -> dict:
+    return {
         'total': 0,
         'kept': 0,
         'filtered_bots': 0,
-        'filtered_media_only': 0
+        'filtered_media_only': 0,
+        'filtered_empty': 0
     }
+
+
+def record_clean_metrics(stats: dict):
+    metrics.CLEAN_RECORDS.inc(stats['kept'], outcome="kept")
+    metrics.CLEAN_RECORDS.inc(stats['filtered_bots'], outcome="bot")
+    metrics.CLEAN_RECORDS.inc(stats['filtered_media_only'], outcome="media_only")
+    metrics.CLEAN_RECORDS.inc(stats['filtered_empty'], outcome="empty")
+
+
+def clean_messages(rows, stats: dict, filter_bots: bool = True):
+    """Filter and clean (chat label, record fields) rows, counting outcomes in stats"""
+    # Consecutive messages mostly share a minute, so format each minute once
+    last_minute = None
+    readable_time = None
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            stats['total'] += 1
-            data = json.loads(line)
-            
-            # Skip bot messages if filter is on
-            if filter_bots and is_bot_message(data.get('sender_username', ''), data.get('text', '')):
-                stats['filtered_bots'] += 1
-                continue
-            
-            # Skip media-only messages with no text
-            if not data.get('text', '').strip() and data.get('media_type'):
-                stats['filtered_media_only'] += 1
-                continue
-            
-            # Clean the text
-            clean_msg_text = clean_text(data.get('text', ''))
-            
-            # Skip empty messages after cleaning
-            if not clean_msg_text:
-                continue
-            
-            # Format timestamp
-            date_str = data['date'].rstrip('Z')
-            if date_str.endswith('+00:00+00:00'):
-                date_str = date_str[:-6]  # Remove duplicate timezone
-            timestamp = datetime.fromisoformat(date_str)
-            readable_time = timestamp.strftime('%Y-%m-%d %H:%M')
-            
-            # Create simplified message
-            clean_msg = {
-                'time': readable_time,
-                'user': data.get('sender_username', f"user_{data.get('sender_id', 'unknown')}"),
-                'text': clean_msg_text
-            }
-            
-            # Add reply context if exists
-            if data.get('reply_to'):
-                clean_msg['replying_to_msg_id'] = data['reply_to']
-            
-            messages.append(clean_msg)
-            stats['kept'] += 1
-    
-    # Write clean format
+    for chat, data in rows:
+        stats['total'] += 1
+        text = data['text']
+        
+        # Skip bot messages if filter is on
+        if filter_bots and is_bot_message(data['sender_username'], text):
+            stats['filtered_bots'] += 1
+            continue
+        
+        # Skip media-only messages with no text
+        if not text.strip() and data['media_type']:
+            stats['filtered_media_only'] += 1
+            continue
+        
+        # Clean the text
+        clean_msg_text = clean_text(text)
+        
+        # Skip empty messages after cleaning
+        if not clean_msg_text:
+            stats['filtered_empty'] += 1
+            continue
+        
+        # Format timestamp
+        minute = data['ts'] // 60
+        if minute != last_minute:
+            last_minute = minute
+            readable_time = time.strftime('%Y-%m-%d %H:%M', time.gmtime(data['ts']))
+        
+        # Create clean message
+        clean_msg = {
+            'time': readable_time,
+            'user': display_name(data),
+            'text': clean_msg_text
+        }
+        if chat:
+            clean_msg['chat'] = chat
+        
+        # Add reply context if exists
+        if data['reply_to']:
+            clean_msg['replying_to_msg_id'] = data['reply_to']
+            # Quote the parent when the thread stage found it
+            parent = data.get('parent')
+            quote = snippet(clean_text(parent[1])) if parent else ""
+            if quote:
+                clean_msg['replying_to_user'] = parent[0]
+                clean_msg['replying_to_text'] = quote
+        
+        stats['kept'] += 1
+        yield clean_msg
+
+
+def format_clean_line(msg: dict) -> str:
+    """One clean message as a chat log line (without the newline)"""
+    chat = f"[{msg['chat']}] " if 'chat' in msg else ""
+    reply_indicator = ""
+    if 'replying_to_text' in msg:
+        reply_indicator = f" (replying to #{msg['replying_to_msg_id']} {msg['replying_to_user']}: \"{msg['replying_to_text']}\")"
+    elif 'replying_to_msg_id' in msg:
+        reply_indicator = f" (replying to #{msg['replying_to_msg_id']})"
+    return f"[{msg['time']}] {chat}{msg['user']}{reply_indicator}: {msg['text']}"
+
+
+def write_clean_messages(messages, output_file: Path):
+    """Stream clean messages to a .txt chat log or clean JSONL"""
     with open(output_file, 'w', encoding='utf-8') as f:
         # Option 1: Simple chat format (most LLM-friendly)
         if output_file.suffix == '.txt':
             for msg in messages:
-                reply_indicator = f" (replying to #{msg.get('replying_to_msg_id', '')})" if 'replying_to_msg_id' in msg else ""
-                f.write(f"[{msg['time']}] {msg['user']}{reply_indicator}: {msg['text']}\n")
+                f.write(format_clean_line(msg) + '\n')
         
         # Option 2: Clean JSON format
         else:
             for msg in messages:
                 f.write(json.dumps(msg, ensure_ascii=False) + '\n')
+
+
+def convert_to_clean_format(input_file: Path, output_file: Path, filter_bots: bool = True, parents_dir: Optional[Path] = None):
+    """Convert an export (any record format) to a cleaner format for LLMs.
+
+    Replies quote their parent; parents_dir adds the ones fetched by
+    `dump --with-parents` for this chat.
+    """
+    stats = new_stats()
+    chat_id = export_chat_id(input_file) if parents_dir else None
+    cache_file = parent_cache_path(chat_id, parents_dir) if chat_id is not None else None
     
+    with ExportReader(input_file) as reader, ParentCache(cache_file) as cache:
+        rows = ((None, data) for data in (reader.current(raw, CLEAN_FIELDS) for offset, raw in reader) if data is not None)
+        write_clean_messages(clean_messages(thread_rows(rows, cache), stats, filter_bots), output_file)
+    
+    record_clean_metrics(stats)
     return stats
 
 
+def find_exports(patterns: Iterable[str]) -> List[Path]:
+    """Export files named by paths, directories (.jsonl and binary files in them) and glob patterns"""
+    found = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = [p for p in sorted(path.iterdir())
+                          if p.is_file() and not p.name.startswith('.') and not p.stem.endswith(CLEAN_SUFFIX)
+                          and not p.name.endswith(CHANGES_SUFFIX)
+                          and (p.suffix == '.jsonl' or records.detect_format(p) == 'binary')]
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = [Path(p) for p in sorted(glob.glob(pattern)) if Path(p).is_file()]
+        for candidate in candidates:
+            if candidate not in found:
+                found.append(candidate)
+    return found
+
+
+def clean_output_path(input_file: Path, format: str, output_dir: Optional[Path] = None) -> Path:
+    return (output_dir or input_file.parent) / f"{input_file.stem}{CLEAN_SUFFIX}.{format}"
+
+
+def chunks_output_path(input_file: Path, output_dir: Optional[Path] = None) -> Path:
+    return (output_dir or input_file.parent) / f"{input_file.stem}{CLEAN_SUFFIX}{CHUNKS_SUFFIX}"
+
+
+def is_up_to_date(input_file: Path, output_file: Path) -> bool:
+    """Whether output_file is newer than the export and its recorded changes"""
+    if not output_file.exists():
+        return False
+    sources = [input_file, changes_path(input_file)]
+    return all(output_file.stat().st_mtime >= source.stat().st_mtime for source in sources if source.exists())
+
+
+def _clean_job(job: Tuple[Path, Path, bool, Optional[Path]]) -> dict:
+    input_file, output_file, filter_bots, parents_dir = job
+    return convert_to_clean_format(input_file, output_file, filter_bots, parents_dir)
+
+
+def clean_files(jobs: List[Tuple[Path, Path, bool, Optional[Path]]], workers: int = 1) -> dict:
+    """Run (input, output, filter_bots, parents_dir) clean jobs, in a process pool if workers > 1; returns summed stats"""
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_clean_job, jobs))
+    else:
+        results = [_clean_job(job) for job in jobs]
+    
+    totals = new_stats()
+    for stats in results:
+        for key in totals:
+            totals[key] += stats[key]
+    
+    if workers > 1 and len(jobs) > 1:
+        # Worker processes count into their own metrics registries
+        record_clean_metrics(totals)
+    return totals
+
+
+def echo_stats(stats: dict):
+    click.echo(f"📊 Stats:")
+    click.echo(f"   Total messages: {stats['total']}")
+    click.echo(f"   Kept: {stats['kept']}")
+    click.echo(f"   Filtered bots: {stats['filtered_bots']}")
+    click.echo(f"   Filtered media-only: {stats['filtered_media_only']}")
+    if 'chunks' in stats:
+        click.echo(f"   Chunks: {stats['chunks']}")
+
+
 @click.command()
-@click.option('--input', '-i', required=True, help='Input JSONL file')
-@click.option('--output', '-o', help='Output file (defaults to input_clean.txt)')
+@click.option('--input', '-i', 'inputs', required=True, multiple=True, help='Input export file, directory or glob (repeatable)')
+@click.option('--output', '-o', help='Output file (defaults to input_clean.txt); a directory when cleaning many files')
 @click.option('--format', type=click.Choice(['txt', 'jsonl']), default='txt', help='Output format')
 @click.option('--keep-bots/--no-bots', default=False, help='Keep bot messages (default: filter out)')
-def clean(input: str, output: str, format: str, keep_bots: bool):
+@click.option('--max-tokens', type=int, help='Split the output into chunks of at most this many (estimated) tokens, with a manifest')
+@click.option('--overlap', type=int, default=0, help='Tokens of trailing messages repeated at the start of the next chunk')
+@click.option('--gap', type=int, default=CHUNK_GAP_MINUTES, show_default=True, help='Minutes of silence that make a preferred chunk boundary')
+@click.option('--parents-dir', type=click.Path(file_okay=False), default=str(PARENT_CACHE_DIR), help='Quote reply parents fetched by dump --with-parents from this cache')
+@click.option('--jobs', '-j', type=int, default=os.cpu_count() or 1, show_default=True, help='Files cleaned in parallel')
+@click.option('--force', is_flag=True, help='Clean files even if their output is newer than the export')
+@click.option('--metrics-file', type=click.Path(), help='Write run metrics here (.json, or Prometheus text otherwise)')
+@click.option('--profile', type=click.Path(file_okay=False), help='Write CPU/allocation profiles and a report to this directory')
+def clean(inputs: Tuple[str, ...], output: str, format: str, keep_bots: bool, parents_dir: str = None, jobs: int = 1, force: bool = False, metrics_file: str = None, profile: str = None, max_tokens: Optional[int] = None, overlap: int = 0, gap: int = CHUNK_GAP_MINUTES):
     """Clean exported Telegram data for LLM processing"""
+    if profile:
+        from .profiling import profile_command
+        profile_command(click.get_current_context(), Path(profile))
+    if metrics_file:
+        metrics.REGISTRY.output = Path(metrics_file)
+        click.get_current_context().call_on_close(metrics.REGISTRY.flush)
+    
+    parents = Path(parents_dir) if parents_dir else None
+    chunking = (max_tokens, overlap, gap) if max_tokens else None
+    if max_tokens and overlap * 2 > max_tokens:
+        click.echo("Error: --overlap must be at most half of --max-tokens", err=True)
+        raise click.Abort()
+    
+    if len(inputs) > 1 or not Path(inputs[0]).is_file():
+        clean_many(inputs, Path(output) if output else None, format, not keep_bots, parents, jobs, force, chunking)
+        return
     
-    input_file = Path(input)
-    if not input_file.exists():
-        click.echo(f"Error: Input file {input} not found", err=True)
+    input_file = Path(inputs[0])
+    
+    if chunking:
+        from .chunks import MANIFEST, chunk_export
+        output_dir = Path(output) if output else chunks_output_path(input_file)
+        click.echo(f"Cleaning {input_file.name} into chunks of up to {max_tokens} tokens...")
+        stats = chunk_export(input_file, output_dir, max_tokens, overlap, gap, format, not keep_bots, parents, jobs)
+        click.echo(f"\n✅ Cleaning complete!")
+        echo_stats(stats)
+        click.echo(f"\n📁 Chunks saved to: {output_dir} (see {MANIFEST})")
         return
     
     if not output:
-        output = input_file.stem + f"_clean.{format}"
+        output = input_file.stem + f"{CLEAN_SUFFIX}.{format}"
     
     output_file = Path(output)
     
     click.echo(f"Cleaning {input_file.name}...")
     
-    stats = convert_to_clean_format(input_file, output_file, filter_bots=not keep_bots)
+    stats = convert_to_clean_format(input_file, output_file, filter_bots=not keep_bots, parents_dir=parents)
     
     click.echo(f"\n✅ Cleaning complete!")
-    click.echo(f"📊 Stats:")
-    click.echo(f"   Total messages: {stats['total']}")
-    click.echo(f"   Kept: {stats['kept']}")
-    click.echo(f"   Filtered bots: {stats['filtered_bots']}")
-    click.echo(f"   Filtered media-only: {stats['filtered_media_only']}")
+    echo_stats(stats)
     click.echo(f"\n📁 Clean file saved to: {output_file}")
     
     # Show sample
@@ -146,5 +307,50 @@ def clean(input: str, output: str, format: str, keep_bots: bool):
             click.echo(f"   {line.strip()}")
 
 
+def clean_many(patterns: Tuple[str, ...], output_dir: Optional[Path], format: str, filter_bots: bool, parents_dir: Optional[Path], workers: int, force: bool, chunking: Optional[Tuple[int, int, int]] = None):
+    """Clean every export matched by patterns, skipping ones whose output is up to date.
+
+    chunking is (max_tokens, overlap, gap_minutes): each export then gets a
+    chunk directory, and the workers split large exports instead.
+    """
+    input_files = find_exports(patterns)
+    if not input_files:
+        click.echo(f"Error: No export files found in {', '.join(patterns)}", err=True)
+        return
+    
+    if output_dir:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    
+    jobs = []
+    skipped = 0
+    for input_file in input_files:
+        if chunking:
+            from .chunks import MANIFEST
+            output_file = chunks_output_path(input_file, output_dir) / MANIFEST
+        else:
+            output_file = clean_output_path(input_file, format, output_dir)
+        if not force and is_up_to_date(input_file, output_file):
+            skipped += 1
+            continue
+        jobs.append((input_file, output_file, filter_bots, parents_dir))
+    
+    click.echo(f"Cleaning {len(jobs)} of {len(input_files)} exports ({skipped} up to date) with {min(workers, len(jobs)) or 1} workers...")
+    if chunking:
+        from .chunks import chunk_export
+        stats = new_stats()
+        stats['chunks'] = 0
+        for input_file, output_file, filter_bots, parents_dir in jobs:
+            file_stats = chunk_export(input_file, output_file.parent, *chunking, format, filter_bots, parents_dir, workers)
+            for key in stats:
+                stats[key] += file_stats[key]
+    else:
+        stats = clean_files(jobs, workers)
+    
+    click.echo(f"\n✅ Cleaning complete!")
+    click.echo(f"   Files cleaned: {len(jobs)}")
+    click.echo(f"   Files up to date: {skipped}")
+    echo_stats(stats)
+
+
 if __name__ == '__main__':
     clean()
\ No newline at end of file
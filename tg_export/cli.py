@@ -2,19 +2,30 @@ import click
 import asyncio
 from pathlib import Path
 import os
-from typing import Optional
+import sys
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
-import json
 import time
 import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from telethon import TelegramClient
-from telethon.errors import FloodWaitError
+from telethon.errors import FloodWaitError, TakeoutInitDelayError
 from telethon.sessions import StringSession
-from telethon.tl.types import MessageEntityBold, MessageEntityItalic, MessageEntityCode, MessageEntityPre, MessageEntityTextUrl
+from telethon.tl import types
 from telethon.utils import get_peer_id
 from dotenv import load_dotenv
 
+from . import metrics, records
+from .reader import ExportReader
+from .main import cli
+from .changes import append_changes, changes_path, delete_change, edit_change
+from .peers import ACCESS_ERRORS, PeerCache, peer_cache_path, resolve_chat
+from .sessions import DEFAULT_SESSION, SessionPool, available_sessions, session_path, split_id_range
+from .sinks import FileSink, StreamSink, WebhookSink, close_stdout
+from .threads import PARENT_CACHE_DIR, ParentCache, export_chat_id, missing_parents, parent_cache_path
+
 load_dotenv()
 
 # Safety settings to avoid bans
@@ -22,15 +33,27 @@ BATCH_SIZE = 100  # Messages per request
 MIN_DELAY = 1.0   # Minimum delay between batches (seconds)
 MAX_DELAY = 3.0   # Maximum delay between batches
 
+# Takeout sessions are meant for bulk export, so they get lighter throttling
+TAKEOUT_MIN_DELAY = 0.1
+TAKEOUT_MAX_DELAY = 0.5
+
+# Dump pipeline: messages read ahead of processing (queued a page at a time),
+# and record batches queued for the writer thread, before each side waits for the other
+PREFETCH_MESSAGES = 2 * BATCH_SIZE
+WRITE_AHEAD = 4
+FETCH_DONE = object()
+SINCE_REACHED = object()
 
-@click.group()
-def cli():
-    """Telegram Group-Chat Exporter"""
-    pass
+# Reply parents looked up per get_messages call (Telegram's limit for ids)
+PARENT_BATCH = 100
 
+# Newest messages `reconcile` re-checks by default
+RECONCILE_WINDOW = 500
 
-@cli.command()
-def login():
+
+@click.command()
+@click.option('--session', 'session_name', help='Save as a named session (for --pool exports)')
+def login(session_name: Optional[str]):
     """Authenticate with Telegram"""
     api_id = os.getenv("TELEGRAM_API_ID")
     api_hash = os.getenv("TELEGRAM_API_HASH")
@@ -40,7 +63,9 @@ def login():
         raise click.Abort()
     
     api_id = int(api_id)
-    session_file = Path(".session")
+    # --session default is the plain .session file, as everywhere else
+    session_file = session_path(session_name)
+    session_file.parent.mkdir(parents=True, exist_ok=True)
     
     async def auth():
         session = session_file.read_text() if session_file.exists() else ""
@@ -77,159 +102,629 @@ def parse_chat_url(url: str):
 
 
 def get_last_message_id(output_file: Path) -> Optional[int]:
-    """Get the last message ID from existing output file"""
+    """Get the newest message ID in an existing output file.
+
+    A fresh export is written newest first and resumed exports append in
+    ascending order, so the newest message is either the first or the last.
+    """
     if not output_file.exists():
         return None
     
     try:
-        # Read last line
-        with open(output_file, 'rb') as f:
-            f.seek(0, 2)  # Go to end
-            if f.tell() == 0:  # Empty file
-                return None
-            
-            # Find last newline
-            f.seek(-2, 2)
-            while f.read(1) != b'\n':
-                if f.tell() == 1:  # Beginning of file
-                    f.seek(0)
-                    break
-                f.seek(-2, 1)
-            
-            last_line = f.readline().decode('utf-8').strip()
-            if last_line:
-                data = json.loads(last_line)
-                return data.get('msg_id')
+        with ExportReader(output_file) as reader:
+            ids = [reader.fields(raw, ('msg_id',))['msg_id'] for raw in (reader.first(), reader.last()) if raw is not None]
+        ids = [i for i in ids if i is not None]
+        return max(ids) if ids else None
     except Exception:
         return None
-    
-    return None
+
+
+# Telethon entity class -> (record type, attribute kept as the type's extra field)
+ENTITY_KINDS = {
+    types.MessageEntityBold: ("bold", None),
+    types.MessageEntityItalic: ("italic", None),
+    types.MessageEntityCode: ("code", None),
+    types.MessageEntityPre: ("pre", "language"),
+    types.MessageEntityTextUrl: ("text_url", "url"),
+    types.MessageEntityUnderline: ("underline", None),
+    types.MessageEntityStrike: ("strike", None),
+    types.MessageEntitySpoiler: ("spoiler", None),
+    types.MessageEntityBlockquote: ("blockquote", "collapsed"),
+    types.MessageEntityMention: ("mention", None),
+    types.MessageEntityMentionName: ("mention_name", "user_id"),
+    types.MessageEntityHashtag: ("hashtag", None),
+    types.MessageEntityCashtag: ("cashtag", None),
+    types.MessageEntityBotCommand: ("bot_command", None),
+    types.MessageEntityUrl: ("url", None),
+    types.MessageEntityEmail: ("email", None),
+    types.MessageEntityPhone: ("phone", None),
+    types.MessageEntityBankCard: ("bank_card", None),
+    types.MessageEntityCustomEmoji: ("custom_emoji", "document_id"),
+    types.MessageEntityUnknown: ("unknown", None),
+}
+# Classes newer than telethon 1.40 (the oldest version allowed), added when the installed one has them
+NEWER_ENTITY_KINDS = {
+    "MessageEntityFormattedDate": ("formatted_date", "date"),
+    "MessageEntityDiffInsert": ("diff_insert", None),
+    "MessageEntityDiffDelete": ("diff_delete", None),
+    "MessageEntityDiffReplace": ("diff_replace", "old_text"),
+}
+ENTITY_KINDS.update((getattr(types, name), kind) for name, kind in NEWER_ENTITY_KINDS.items() if hasattr(types, name))
+# Entity classes newer than this table are kept with their span at least
+UNKNOWN_ENTITY = ("unknown", None)
 
 
 def serialize_entities(entities):
-    """Convert Telegram entities to serializable format"""
+    """Convert Telegram entities to record entities, with the type's extra field only when it is set"""
     if not entities:
         return []
     
     result = []
+    append = result.append
+    kinds = ENTITY_KINDS
     for entity in entities:
-        if isinstance(entity, MessageEntityBold):
-            result.append({"type": "bold", "offset": entity.offset, "length": entity.length})
-        elif isinstance(entity, MessageEntityItalic):
-            result.append({"type": "italic", "offset": entity.offset, "length": entity.length})
-        elif isinstance(entity, MessageEntityCode):
-            result.append({"type": "code", "offset": entity.offset, "length": entity.length})
-        elif isinstance(entity, MessageEntityPre):
-            result.append({"type": "pre", "offset": entity.offset, "length": entity.length})
-        elif isinstance(entity, MessageEntityTextUrl):
-            result.append({"type": "text_url", "offset": entity.offset, "length": entity.length, "url": entity.url})
+        name, extra = kinds.get(type(entity), UNKNOWN_ENTITY)
+        if extra is None:
+            append({"type": name, "offset": entity.offset, "length": entity.length})
+            continue
+        item = {"type": name, "offset": entity.offset, "length": entity.length}
+        value = getattr(entity, extra)
+        if value:
+            # Dates are kept as epoch seconds like the record's ts
+            item[extra] = int(value.timestamp()) if extra == "date" else value
+        append(item)
     
     return result
 
 
-async def dump_messages(client: TelegramClient, chat, output_file: Path, min_id: Optional[int] = None, since: Optional[datetime] = None, username_filter: Optional[str] = None):
-    """Dump messages from a chat to JSONL file"""
+def entity_spans(entities) -> List[Tuple[int, int]]:
+    """(offset, length) of each record entity; unlike type names and extras, these do not depend on the dumping code"""
+    return [(entity["offset"], entity["length"]) for entity in entities or []]
+
+
+def message_record(message, sender_username: Optional[str]) -> dict:
+    """Build an export record from a Telegram message"""
+    # Determine media type
+    media_type = None
+    media_file_id = None
+    
+    if message.photo:
+        media_type = "photo"
+        media_file_id = str(message.photo.id)
+    elif message.video:
+        media_type = "video"
+        media_file_id = str(message.video.id)
+    elif message.document:
+        media_type = "doc"
+        media_file_id = str(message.document.id)
+    
+    return {
+        "msg_id": message.id,
+        "chat_id": get_peer_id(message.peer_id),
+        "ts": int(message.date.timestamp()),
+        "sender_id": message.sender_id,
+        "sender_username": sender_username,
+        "reply_to": message.reply_to.reply_to_msg_id if message.reply_to else None,
+        "text": message.text or "",
+        "entities": serialize_entities(message.entities),
+        "media_type": media_type,
+        "media_file_id": media_file_id
+    }
+
+
+async def prefetch_messages(messages, queue: asyncio.Queue, since: Optional[datetime], delays: Tuple[float, float]):
+    """Read pages of messages ahead into a bounded queue, ending with FETCH_DONE, SINCE_REACHED or the error raised.
+
+    Pausing after every page here keeps requests paced while the consumer
+    goes on processing what was already fetched.
+    """
+    try:
+        # Note: iter_messages will fetch ALL messages unless we stop
+        async for page in metrics.timed_pages(messages, BATCH_SIZE):
+            # Check if before since date - if so, we're done (without fetching another page)
+            if since:
+                older = next((n for n, message in enumerate(page) if message.date.replace(tzinfo=None) < since), None)
+                if older is not None:
+                    if older:
+                        await queue.put(page[:older])
+                    await queue.put(SINCE_REACHED)
+                    return
+            await queue.put(page)
+            
+            if delays[1] > 0:
+                # Add random delay between batches to avoid rate limits
+                await asyncio.sleep(random.uniform(*delays))
+        await queue.put(FETCH_DONE)
+    except Exception as e:
+        await queue.put(e)
+
+
+async def dump_messages(client: TelegramClient, chat, output_file: Optional[Path], min_id: Optional[int] = None, since: Optional[datetime] = None, username_filter: Optional[str] = None, max_id: Optional[int] = None, reverse: bool = False, delays: Optional[Tuple[float, float]] = None, wait_time: Optional[float] = None, record_format: str = records.DEFAULT_FORMAT, sink=None):
+    """Dump messages from a chat to an export file (appending keeps the file's format), or to a sink.
+
+    Runs as a pipeline: a fetcher task reads pages ahead into a bounded
+    queue, this coroutine filters messages and encodes records a batch at a
+    time, and a writer thread hands the encoded batches to the sink. Encoding
+    stays on this thread so it is profiled and does not contend with the
+    fetcher for the GIL; the writer thread only does I/O.
+    """
+    min_delay, max_delay = delays or (MIN_DELAY, MAX_DELAY)
     count = 0
-    mode = 'a' if min_id else 'w'
-    batch_count = 0
     reached_time_limit = False
     filtered_count = 0
+    own_sink = sink is None
+    if own_sink:
+        sink = FileSink(output_file, append=bool(min_id), record_format=record_format)
+    encode = records.ENCODERS[sink.record_format]
+    start_bytes = 0 if own_sink else sink.bytes_written
     
-    with open(output_file, mode, encoding='utf-8') as f:
+    try:
+        def write_batch(batch: List[dict]):
+            started = time.perf_counter()
+            data = b"".join([encode(record) for record in batch])
+            metrics.SERIALIZE_SECONDS.observe(time.perf_counter() - started)
+            pending.append(writer.submit(sink.write, batch, data))
+        
         # Set up iteration parameters
         iter_params = {}
         if min_id:
             iter_params["min_id"] = min_id
+        if max_id:
+            iter_params["max_id"] = max_id
+        if min_id or reverse:
             iter_params["reverse"] = True
+        if wait_time is not None:
+            iter_params["wait_time"] = wait_time
         
-        # Note: iter_messages will fetch ALL messages unless we break
-        async for message in client.iter_messages(chat, **iter_params):
-            # Check if before since date - if so, we're done
-            if since and message.date.replace(tzinfo=None) < since:
-                reached_time_limit = True
-                break
-            
-            # Determine media type
-            media_type = None
-            media_file_id = None
-            
-            if message.photo:
-                media_type = "photo"
-                media_file_id = str(message.photo.id)
-            elif message.video:
-                media_type = "video"
-                media_file_id = str(message.video.id)
-            elif message.document:
-                media_type = "doc"
-                media_file_id = str(message.document.id)
-            
-            # Get sender username
-            sender_username = getattr(message.sender, 'username', None) if message.sender else None
-            
-            # Filter by username if specified
-            if username_filter:
-                if not sender_username or sender_username.lower() != username_filter.lower():
-                    filtered_count += 1
-                    continue
-            
-            # Build message data
-            data = {
-                "msg_id": message.id,
-                "chat_id": get_peer_id(message.peer_id),
-                "date": message.date.isoformat() + "Z",
-                "sender_id": message.sender_id,
-                "sender_username": sender_username,
-                "reply_to": message.reply_to.reply_to_msg_id if message.reply_to else None,
-                "text": message.text or "",
-                "entities": serialize_entities(message.entities),
-                "media_type": media_type,
-                "media_file_id": media_file_id
-            }
-            
-            f.write(json.dumps(data, ensure_ascii=False) + '\n')
-            count += 1
-            
-            if count % BATCH_SIZE == 0:
-                batch_count += 1
-                click.echo(f"Exported {count} messages...", err=True)
+        queue = asyncio.Queue(maxsize=PREFETCH_MESSAGES // BATCH_SIZE)
+        fetcher = asyncio.ensure_future(prefetch_messages(client.iter_messages(chat, **iter_params), queue, since, (min_delay, max_delay)))
+        writer = ThreadPoolExecutor(max_workers=1)
+        pending = deque()
+        batch = []
+        
+        try:
+            while True:
+                page = await queue.get()
+                if page is FETCH_DONE:
+                    break
+                if page is SINCE_REACHED:
+                    reached_time_limit = True
+                    break
+                if isinstance(page, Exception):
+                    raise page
                 
-                # Add random delay between batches to avoid rate limits
-                delay = random.uniform(MIN_DELAY, MAX_DELAY)
-                await asyncio.sleep(delay)
+                for message, sender in zip(page, metrics.page_senders(page)):
+                    # Get sender username
+                    sender_username = getattr(sender, 'username', None) if sender else None
+                    
+                    # Filter by username if specified
+                    if username_filter:
+                        if not sender_username or sender_username.lower() != username_filter.lower():
+                            filtered_count += 1
+                            continue
+                    
+                    # Build message data
+                    batch.append(message_record(message, sender_username))
+                    count += 1
+                    
+                    if count % BATCH_SIZE == 0:
+                        write_batch(batch)
+                        batch = []
+                        # A failed write stops the fetch now, not WRITE_AHEAD batches later
+                        while pending and pending[0].done():
+                            pending.popleft().result()
+                        click.echo(f"Exported {count} messages...", err=True)
+                        # Backpressure: wait for the writer once it falls WRITE_AHEAD batches behind
+                        if len(pending) > WRITE_AHEAD:
+                            await asyncio.wrap_future(pending.popleft())
+        finally:
+            fetcher.cancel()
+            await asyncio.wait([fetcher])
+            # Everything received before a stop or error is still written
+            if batch:
+                write_batch(batch)
+            writer.shutdown(wait=True)
+            metrics.RECORDS_SERIALIZED.inc(count)
+            metrics.BYTES_WRITTEN.inc(sink.bytes_written - start_bytes)
+        
+        for future in pending:
+            future.result()
         
         if reached_time_limit:
             click.echo(f"Reached time limit (messages before {since})", err=True)
         
         if username_filter and filtered_count > 0:
             click.echo(f"Filtered out {filtered_count} messages from other users", err=True)
+    finally:
+        if own_sink:
+            sink.close()
+    
+    return count
+
+
+async def dump_with_takeout(client: TelegramClient, chat, output_file: Path, **kwargs):
+    """Run dump_messages through a takeout session.
+
+    The takeout is finished when the dump completes and cancelled if it
+    fails or is interrupted (Ctrl-C cancels the running task).
+    """
+    async with client.takeout(finalize=True, users=True, chats=True, megagroups=True, channels=True) as takeout:
+        try:
+            return await dump_messages(takeout, chat, output_file, delays=(TAKEOUT_MIN_DELAY, TAKEOUT_MAX_DELAY), wait_time=0, **kwargs)
+        except BaseException:
+            takeout.success = False
+            click.echo("Takeout session cancelled", err=True)
+            raise
+
+
+async def fetch_parents(client: TelegramClient, chat, output_file: Path, cache_dir: Path = PARENT_CACHE_DIR, delays: Optional[Tuple[float, float]] = None) -> int:
+    """Fetch reply parents missing from an export into the chat's parent cache.
+
+    Parents are looked up PARENT_BATCH ids per request, and every id asked
+    for is cached (deleted messages as empty records) so later exports of
+    the same chat never ask for it again. Returns the number of requests.
+    """
+    min_delay, max_delay = delays or (MIN_DELAY, MAX_DELAY)
+    chat_id = export_chat_id(output_file) if output_file.exists() else None
+    if chat_id is None:
+        return 0
+    
+    cache_file = parent_cache_path(chat_id, cache_dir)
+    with ParentCache(cache_file) as cache:
+        ids = sorted(i for i in missing_parents(output_file) if i not in cache)
+    if not ids:
+        return 0
+    
+    click.echo(f"Fetching {len(ids)} reply parents...", err=True)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    requests = 0
+    with open(cache_file, 'ab') as f:
+        for start in range(0, len(ids), PARENT_BATCH):
+            batch = ids[start:start + PARENT_BATCH]
+            if start:
+                await asyncio.sleep(random.uniform(min_delay, max_delay))
+            while True:
+                try:
+                    messages = await client.get_messages(chat, ids=batch)
+                    break
+                except FloodWaitError as e:
+                    click.echo(f"Rate limited. Waiting {e.seconds} seconds...", err=True)
+                    metrics.record_flood_wait(e.seconds)
+                    await asyncio.sleep(e.seconds)
+            requests += 1
+            metrics.PARENT_FETCHES.inc()
+            
+            found = [message for message in messages if message is not None]
+            senders = dict(zip((message.id for message in found), metrics.page_senders(found)))
+            for msg_id, message in zip(batch, messages):
+                if message is None:
+                    record = {"msg_id": msg_id, "chat_id": chat_id, "ts": 0, "sender_id": None, "sender_username": None,
+                              "reply_to": None, "text": "", "entities": [], "media_type": None, "media_file_id": None}
+                else:
+                    sender = senders[message.id]
+                    record = message_record(message, getattr(sender, 'username', None) if sender else None)
+                f.write(records.encode_v1(record))
+    
+    return requests
+
+
+async def reconcile_archive(client: TelegramClient, chat, archive: Path, recent: int = RECONCILE_WINDOW, ids: Optional[List[int]] = None, delays: Optional[Tuple[float, float]] = None) -> dict:
+    """Append edits and deletions of archived messages to the archive's change log.
+
+    Re-checks the `recent` newest messages (archived ones missing from that
+    range were deleted) and any specific ids, e.g. from update events.
+    Archived records are found through the search index, never a scan.
+    """
+    from .search import SearchIndex
+
+    min_delay, max_delay = delays or (MIN_DELAY, MAX_DELAY)
+    stats = {'checked': 0, 'edited': 0, 'deleted': 0}
+    # msg_id -> current message, or None once it is known to be deleted
+    current = {}
+    ranges = []
+    
+    if recent:
+        async for page in metrics.timed_pages(client.iter_messages(chat, limit=recent), BATCH_SIZE):
+            for message in page:
+                current[message.id] = message
+        if current:
+            ranges.append((min(current), max(current)))
     
+    ids = sorted(set(ids or []) - set(current))
+    for start in range(0, len(ids), PARENT_BATCH):
+        if start:
+            await asyncio.sleep(random.uniform(min_delay, max_delay))
+        batch = ids[start:start + PARENT_BATCH]
+        messages = await client.get_messages(chat, ids=batch)
+        for msg_id, message in zip(batch, messages):
+            current[msg_id] = message
+        ranges.extend((msg_id, msg_id) for msg_id in batch)
+    
+    now = int(time.time())
+    changes = []
+    with SearchIndex(archive) as index:
+        index.update()
+        with ExportReader(archive) as reader:
+            for low, high in ranges:
+                for msg_id, offset in sorted(index.offsets_by_id(low, high).items()):
+                    stats['checked'] += 1
+                    message = current.get(msg_id)
+                    if message is None:
+                        changes.append(delete_change(msg_id, now))
+                        stats['deleted'] += 1
+                        continue
+                    archived = reader.current(reader.record_at(offset), ('text', 'entities'))
+                    text, entities = message.text or "", serialize_entities(message.entities)
+                    if archived['text'] != text or entity_spans(archived['entities']) != entity_spans(entities):
+                        edited = int(message.edit_date.timestamp()) if getattr(message, 'edit_date', None) else now
+                        changes.append(edit_change(msg_id, edited, text, entities))
+                        stats['edited'] += 1
+        append_changes(archive, changes)
+        # Brings the index itself up to date with the new changes
+        index.update()
+    return stats
+
+
+async def dump_sharded(pool: SessionPool, chat_identifier, output_file: Path, min_id: Optional[int] = None, since: Optional[datetime] = None, username_filter: Optional[str] = None, shards: Optional[int] = None, record_format: str = records.DEFAULT_FORMAT):
+    """Dump a chat by splitting its message id range across a session pool"""
+    if min_id:
+        record_format = records.detect_format(output_file) or record_format
+    # Find the id range to export with whichever session is free
+    while True:
+        name, client = await pool.acquire()
+        try:
+            chat = await pool.get_entity(name, chat_identifier)
+            latest = await client.get_messages(chat, limit=1)
+            high = latest[0].id if latest else 0
+            low = min_id or 0
+            if since and not min_id:
+                before = await client.get_messages(chat, limit=1, offset_date=since)
+                low = before[0].id if before else 0
+            break
+        except FloodWaitError as e:
+            click.echo(f"Session {name} rate limited for {e.seconds} seconds, rotating...", err=True)
+            pool.flood_wait(name, e.seconds)
+        finally:
+            pool.release(name)
+
+    ranges = split_id_range(low, high, shards or len(pool) * 4)
+    parts = [output_file.with_name(f"{output_file.name}.part{i}") for i in range(len(ranges))]
+    queue = asyncio.Queue()
+    for i, (start, end) in enumerate(ranges):
+        queue.put_nowait((i, start, end))
+
+    async def worker():
+        while True:
+            try:
+                i, start, end = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            name, client = await pool.acquire()
+            try:
+                # Part files are ascending, so an interrupted shard resumes from its last line
+                resume_id = get_last_message_id(parts[i]) or start
+                chat = await pool.get_entity(name, chat_identifier)
+                await dump_messages(client, chat, parts[i], min_id=resume_id, max_id=end + 1, username_filter=username_filter, reverse=True, record_format=record_format)
+            except FloodWaitError as e:
+                click.echo(f"Session {name} rate limited for {e.seconds} seconds, rotating...", err=True)
+                pool.flood_wait(name, e.seconds)
+                queue.put_nowait((i, start, end))
+            except ACCESS_ERRORS:
+                # A stale cached peer is resolved again; a chat we really cannot read is an error
+                if not pool.forget_entity(name, chat_identifier):
+                    raise
+                queue.put_nowait((i, start, end))
+            finally:
+                pool.release(name)
+
+    click.echo(f"Exporting messages {low + 1}-{high} in {len(ranges)} shards across {len(pool)} sessions", err=True)
+    await asyncio.gather(*(worker() for _ in range(len(pool))))
+
+    # Stitch the shards together in id order (counting records, since a
+    # flood-waited shard may have written part of its range before failing)
+    count = 0
+    with open(output_file, 'ab' if min_id else 'wb') as out:
+        if out.tell() == 0:
+            out.write(records.header(record_format))
+        for part in parts:
+            if part.exists():
+                with ExportReader(part) as reader:
+                    count += reader.write_records(out)
+                part.unlink()
+
     return count
 
 
-@cli.command()
+async def open_pool(api_id: int, api_hash: str, names: Optional[List[str]] = None) -> SessionPool:
+    """Start a client for every logged-in session"""
+    clients = {}
+    peers = {}
+    for name in names or available_sessions():
+        client = TelegramClient(StringSession(session_path(name).read_text()), api_id, api_hash)
+        await client.start()
+        clients[name] = client
+        peers[name] = PeerCache(peer_cache_path(session_path(name)))
+    return SessionPool(clients, peers)
+
+
+def window_end(replay: Optional[str]) -> datetime:
+    """Where --last/--hours windows end: now, or when the replayed cassette was recorded"""
+    if replay:
+        from .cassette import recording_started
+        started = recording_started(Path(replay))
+        if started is not None:
+            return started
+    return datetime.now()
+
+
+async def run_export(make_client, chat_url: str, output_file: Path, since: Optional[datetime], username: Optional[str], takeout: bool = False, delays: Optional[Tuple[float, float]] = None, record_format: str = records.DEFAULT_FORMAT, with_parents: bool = False, peers: Optional[PeerCache] = None, sink=None, min_id: Optional[int] = None):
+    """Export one chat with a single client (resolving it through the peer cache, if given).
+
+    With a sink, records go there instead of output_file and the reports go
+    to stderr, keeping stdout clean for the records themselves.
+    """
+    client = make_client()
+
+    await client.start()
+
+    # Parse chat
+    chat_identifier = parse_chat_url(chat_url)
+
+    try:
+        chat = await resolve_chat(client, chat_identifier, peers)
+    except Exception as e:
+        click.echo(f"Error: Could not access chat: {e}", err=True)
+        await client.disconnect()
+        raise click.Abort()
+
+    # Check for incremental export
+    last_msg_id = max(filter(None, (min_id, get_last_message_id(output_file) if sink is None else None)), default=None)
+
+    if last_msg_id:
+        click.echo(f"Resuming from message ID {last_msg_id}", err=True)
+
+    def dump_once():
+        if takeout:
+            return dump_with_takeout(client, chat, output_file, min_id=last_msg_id, since=since, username_filter=username, record_format=record_format, sink=sink)
+        return dump_messages(client, chat, output_file, min_id=last_msg_id, since=since, username_filter=username, delays=delays, record_format=record_format, sink=sink)
+
+    async def run_dump():
+        nonlocal chat
+        try:
+            return await dump_once()
+        except ACCESS_ERRORS:
+            if peers is None or not peers.invalidate(chat_identifier):
+                raise
+            click.echo("Cached chat is no longer accessible, resolving it again...", err=True)
+            chat = await resolve_chat(client, chat_identifier, peers)
+            return await dump_once()
+
+    # Export messages
+    try:
+        count = await run_dump()
+
+        streaming = sink is not None
+        click.echo(f"\nExported {count} messages", err=streaming)
+        if username:
+            click.echo(f"Filtered to messages from: {username}", err=streaming)
+        if not streaming:
+            # Report file size
+            file_size = output_file.stat().st_size
+            file_size_mb = file_size / 1024 / 1024
+            click.echo(f"File size: {file_size_mb:.2f} MB")
+
+        if with_parents:
+            requests = await fetch_parents(client, chat, output_file, delays=delays)
+            click.echo(f"Reply parents fetched in {requests} requests")
+
+    except FloodWaitError as e:
+        click.echo(f"Rate limited. Waiting {e.seconds} seconds...", err=True)
+        metrics.record_flood_wait(e.seconds)
+        await asyncio.sleep(e.seconds)
+        # Retry
+        count = await run_dump()
+    except TakeoutInitDelayError as e:
+        click.echo(f"Error: Telegram requires confirming the takeout request in your app. Try again in {e.seconds} seconds", err=True)
+        raise click.Abort()
+    finally:
+        await client.disconnect()
+
+
+@click.command()
 @click.option('--chat-url', required=True, help='Telegram chat URL')
-@click.option('--out', required=True, type=click.Path(), help='Output JSONL file')
+@click.option('--out', type=click.Path(allow_dash=True), help='Output file (JSONL unless --format binary), or - to stream to stdout')
+@click.option('--webhook', help='POST records as NDJSON batches to this URL instead of writing a file')
+@click.option('--min-id', type=int, help='Only export messages newer than this id')
 @click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Only export messages since this date')
 @click.option('--last', help='Only export messages from last N hours/days (e.g., "24h", "7d", "48h")')
 @click.option('--username', help='Only export messages from this username')
-def dump(chat_url: str, out: str, since: Optional[datetime], last: Optional[str], username: Optional[str]):
+@click.option('--pool', is_flag=True, help='Shard the export across every logged-in session')
+@click.option('--shards', type=int, help='Number of id-range shards for --pool (default: 4 per session)')
+@click.option('--takeout', is_flag=True, help='Use a takeout session for bulk backfills (lighter throttling)')
+@click.option('--record', type=click.Path(), help='Record the Telegram API traffic to this cassette file')
+@click.option('--replay', type=click.Path(exists=True), help='Run offline against a recorded cassette')
+@click.option('--replay-speed', type=click.Choice(['fast', 'recorded']), default='fast', help='Replay as fast as possible or with recorded timing')
+@click.option('--format', 'record_format', type=click.Choice(records.FORMATS), default=records.DEFAULT_FORMAT, help='Record encoding for new files: jsonl (v1), compact (v2 JSONL) or binary')
+@click.option('--with-parents', is_flag=True, help=f'Also fetch reply parents missing from the export (cached in {PARENT_CACHE_DIR})')
+def dump(chat_url: str, out: Optional[str], since: Optional[datetime], last: Optional[str], username: Optional[str], pool: bool = False, shards: Optional[int] = None, takeout: bool = False, record: Optional[str] = None, replay: Optional[str] = None, replay_speed: str = 'fast', record_format: str = records.DEFAULT_FORMAT, with_parents: bool = False, webhook: Optional[str] = None, min_id: Optional[int] = None):
     """Dump all messages from a chat"""
-    output_file = Path(out)
-    output_file.parent.mkdir(parents=True, exist_ok=True)
+    if bool(out) == bool(webhook):
+        click.echo("Error: Give exactly one of --out and --webhook", err=True)
+        raise click.Abort()
+    
+    streaming = out == '-' or webhook is not None
+    if streaming and (pool or with_parents):
+        click.echo("Error: --out - and --webhook cannot be combined with --pool or --with-parents", err=True)
+        raise click.Abort()
+    
+    if webhook and record_format == 'binary':
+        click.echo("Error: --webhook sends NDJSON; use --format jsonl or compact", err=True)
+        raise click.Abort()
+    
+    if pool and takeout:
+        click.echo("Error: --pool and --takeout cannot be combined", err=True)
+        raise click.Abort()
+    
+    if with_parents and (pool or replay):
+        click.echo("Error: --with-parents cannot be combined with --pool or --replay", err=True)
+        raise click.Abort()
+    
+    if (record or replay) and (pool or takeout):
+        click.echo("Error: --record/--replay cannot be combined with --pool or --takeout", err=True)
+        raise click.Abort()
+    
+    if webhook:
+        sink = WebhookSink(webhook, record_format)
+    elif streaming:
+        sink = StreamSink(sys.stdout.buffer, record_format)
+    else:
+        sink = None
+    output_file = None if streaming else Path(out)
+    if output_file is not None:
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+    
+    def export(make_client, **kwargs):
+        if sink is None:
+            asyncio.run(run_export(make_client, chat_url, output_file, since, username, record_format=record_format, min_id=min_id, **kwargs))
+            return None
+        try:
+            try:
+                asyncio.run(run_export(make_client, chat_url, output_file, since, username, record_format=record_format, min_id=min_id, sink=sink, **kwargs))
+            finally:
+                # Whatever reached the sink is delivered, even after an error
+                sink.close()
+        except BrokenPipeError:
+            # The reader went away (e.g. `| head`): stop without a traceback
+            close_stdout()
+            click.echo("Output closed by the reader, stopping", err=True)
+            sys.exit(1)
+        # The newest id delivered, which `sync` keeps as its cursor
+        return max(filter(None, (min_id, sink.last_id)), default=None)
     
     # Parse --last parameter
     if last:
         if last.endswith('h'):
             hours = int(last[:-1])
-            since = datetime.now() - timedelta(hours=hours)
+            since = window_end(replay) - timedelta(hours=hours)
         elif last.endswith('d'):
             days = int(last[:-1])
-            since = datetime.now() - timedelta(days=days)
+            since = window_end(replay) - timedelta(days=days)
         else:
             click.echo("Error: --last should be in format like '24h' or '7d'", err=True)
             raise click.Abort()
         click.echo(f"Exporting messages from last {last} (since {since.strftime('%Y-%m-%d %H:%M')})", err=True)
     
+    if replay:
+        from .cassette import ReplayClient
+        
+        def make_client():
+            return ReplayClient(Path(replay), realtime=replay_speed == 'recorded')
+        
+        # Nothing to rate limit offline unless reproducing real-world timing
+        delays = None if replay_speed == 'recorded' else (0.0, 0.0)
+        return export(make_client, delays=delays)
+    
     api_id = os.getenv("TELEGRAM_API_ID")
     api_hash = os.getenv("TELEGRAM_API_HASH")
     
@@ -238,70 +733,65 @@ def dump(chat_url: str, out: str, since: Optional[datetime], last: Optional[str]
         raise click.Abort()
     
     api_id = int(api_id)
-    session_file = Path(".session")
+    session_file = DEFAULT_SESSION
+    
+    if pool:
+        if not available_sessions():
+            click.echo("Error: No sessions found. Run 'tg_export login --session NAME' first", err=True)
+            raise click.Abort()
+        
+        async def export_pool():
+            session_pool = await open_pool(api_id, api_hash)
+            try:
+                last_msg_id = max(filter(None, (min_id, get_last_message_id(output_file))), default=None)
+                if last_msg_id:
+                    click.echo(f"Resuming from message ID {last_msg_id}", err=True)
+                
+                count = await dump_sharded(session_pool, parse_chat_url(chat_url), output_file, min_id=last_msg_id, since=since, username_filter=username, shards=shards, record_format=record_format)
+                
+                file_size_mb = output_file.stat().st_size / 1024 / 1024
+                click.echo(f"\nExported {count} messages")
+                click.echo(f"File size: {file_size_mb:.2f} MB")
+            finally:
+                await session_pool.close()
+        
+        asyncio.run(export_pool())
+        return
     
     if not session_file.exists():
         click.echo("Error: Not authenticated. Run 'tg_export login' first", err=True)
         raise click.Abort()
     
-    async def export():
-        session = session_file.read_text()
-        client = TelegramClient(StringSession(session), api_id, api_hash)
-        
-        await client.start()
-        
-        # Parse chat
-        chat_identifier = parse_chat_url(chat_url)
-        
-        try:
-            if isinstance(chat_identifier, str):
-                chat = await client.get_entity(chat_identifier)
-            else:
-                chat = await client.get_entity(chat_identifier)
-        except Exception as e:
-            click.echo(f"Error: Could not access chat: {e}", err=True)
-            await client.disconnect()
-            raise click.Abort()
-        
-        # Check for incremental export
-        last_msg_id = get_last_message_id(output_file)
-        
-        if last_msg_id:
-            click.echo(f"Resuming from message ID {last_msg_id}", err=True)
-        
-        # Export messages
-        try:
-            count = await dump_messages(client, chat, output_file, min_id=last_msg_id, since=since, username_filter=username)
-            
-            # Report file size
-            file_size = output_file.stat().st_size
-            file_size_mb = file_size / 1024 / 1024
-            
-            click.echo(f"\nExported {count} messages")
-            if username:
-                click.echo(f"Filtered to messages from: {username}")
-            click.echo(f"File size: {file_size_mb:.2f} MB")
-            
-        except FloodWaitError as e:
-            click.echo(f"Rate limited. Waiting {e.seconds} seconds...", err=True)
-            await asyncio.sleep(e.seconds)
-            # Retry
-            count = await dump_messages(client, chat, output_file, min_id=last_msg_id, since=since, username_filter=username)
-        
-        await client.disconnect()
+    def make_client():
+        client = TelegramClient(StringSession(session_file.read_text()), api_id, api_hash)
+        if record:
+            from .cassette import RecordingClient
+            client = RecordingClient(client, Path(record))
+        return client
     
-    asyncio.run(export())
+    # Recordings must contain the entity lookup that replaying them will ask for
+    peers = None if record else PeerCache(peer_cache_path(session_file))
+    return export(make_client, takeout=takeout, with_parents=with_parents, peers=peers)
 
 
-@cli.command()
+@click.command()
 @click.option('--chat-url', required=True, help='Telegram chat URL')
 @click.option('--hours', type=int, default=1, help='Export last N hours (default: 1)')
 @click.option('--clean/--raw', default=True, help='Output clean text format (default: True)')
 @click.option('--username', help='Only export messages from this username')
-def quick(chat_url: str, hours: int, clean: bool, username: Optional[str]):
+@click.option('--record', type=click.Path(), help='Record the Telegram API traffic to this cassette file')
+@click.option('--replay', type=click.Path(exists=True), help='Run offline against a recorded cassette')
+@click.option('--with-parents', is_flag=True, help='Quote reply parents from before the time window (a few extra requests)')
+@click.option('--max-tokens', type=int, help='Split the clean output into chunks of at most this many (estimated) tokens')
+@click.option('--overlap', type=int, default=0, help='Tokens of trailing messages repeated at the start of the next chunk')
+def quick(chat_url: str, hours: int, clean: bool, username: Optional[str], record: Optional[str] = None, replay: Optional[str] = None, with_parents: bool = False, max_tokens: Optional[int] = None, overlap: int = 0):
     """Quick export for last N hours - perfect for LLM analysis"""
     from .clean_export import convert_to_clean_format
     
+    if max_tokens and overlap * 2 > max_tokens:
+        click.echo("Error: --overlap must be at most half of --max-tokens", err=True)
+        raise click.Abort()
+    
     # Generate filename
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_dir = Path("exports/quick")
@@ -310,17 +800,31 @@ def quick(chat_url: str, hours: int, clean: bool, username: Optional[str]):
     temp_file = output_dir / f"quick_{hours}h_{timestamp}.jsonl"
     final_file = output_dir / f"quick_{hours}h_{timestamp}.txt"
     
-    # Export with time limit
-    since = datetime.now() - timedelta(hours=hours)
+    # Export with time limit (replays keep the window they were recorded with)
+    since = window_end(replay) - timedelta(hours=hours)
     
     # Run the export
     ctx = click.Context(dump)
-    ctx.invoke(dump, chat_url=chat_url, out=str(temp_file), since=since, last=None, username=username)
+    ctx.invoke(dump, chat_url=chat_url, out=str(temp_file), since=since, last=None, username=username, record=record, replay=replay, with_parents=with_parents)
     
-    if clean and temp_file.exists():
+    if clean and max_tokens and temp_file.exists():
+        from .chunks import MANIFEST, chunk_export
+        
+        chunks_dir = output_dir / f"quick_{hours}h_{timestamp}_chunks"
+        click.echo(f"\nCleaning export into chunks of up to {max_tokens} tokens...", err=True)
+        stats = chunk_export(temp_file, chunks_dir, max_tokens, overlap, filter_bots=True, parents_dir=PARENT_CACHE_DIR)
+        
+        click.echo(f"\n✅ Quick export complete!")
+        click.echo(f"📊 Stats:")
+        click.echo(f"   Kept: {stats['kept']} messages in {stats['chunks']} chunks")
+        click.echo(f"   Filtered: {stats['filtered_bots']} bots, {stats['filtered_media_only']} media-only")
+        click.echo(f"\n📁 Chunks: {chunks_dir} (see {MANIFEST})")
+        
+        temp_file.unlink()
+    elif clean and temp_file.exists():
         # Clean the export
         click.echo("\nCleaning export for LLM use...", err=True)
-        stats = convert_to_clean_format(temp_file, final_file, filter_bots=True)
+        stats = convert_to_clean_format(temp_file, final_file, filter_bots=True, parents_dir=PARENT_CACHE_DIR)
         
         click.echo(f"\n✅ Quick export complete!")
         click.echo(f"📊 Stats:")
@@ -337,12 +841,19 @@ def quick(chat_url: str, hours: int, clean: bool, username: Optional[str]):
         click.echo(f"\n📁 Export saved to: {temp_file}")
 
 
-@cli.command()
+@click.command()
 @click.option('--chat-url', required=True, help='Telegram chat URL')
-@click.option('--out', required=True, type=click.Path(), help='Output JSONL file')
+@click.option('--out', type=click.Path(allow_dash=True), help='Output JSONL file, or - to stream new messages to stdout')
+@click.option('--webhook', help='POST new messages as NDJSON batches to this URL instead of writing a file')
+@click.option('--min-id', type=int, help='Only sync messages newer than this id (where streaming starts)')
 @click.option('--every', required=True, help='Sync interval (e.g., "5m", "1h") - minimum 5m recommended')
-def sync(chat_url: str, out: str, every: str):
+@click.option('--pool', is_flag=True, help='Shard each sync across every logged-in session')
+def sync(chat_url: str, out: Optional[str], every: str, pool: bool, webhook: Optional[str] = None, min_id: Optional[int] = None):
     """Continuously sync new messages"""
+    if bool(out) == bool(webhook):
+        click.echo("Error: Give exactly one of --out and --webhook", err=True)
+        raise click.Abort()
+    
     # Parse interval
     if every.endswith('m'):
         interval = int(every[:-1]) * 60
@@ -358,18 +869,108 @@ def sync(chat_url: str, out: str, every: str):
     
     click.echo(f"Starting sync every {interval} seconds", err=True)
     
+    # Files resume from their last record; streams keep the cursor here
+    cursor = min_id
     while True:
         try:
             # Run dump command
             ctx = click.Context(dump)
-            ctx.invoke(dump, chat_url=chat_url, out=out, since=None)
+            cursor = ctx.invoke(dump, chat_url=chat_url, out=out, webhook=webhook, min_id=cursor, since=None, pool=pool) or cursor
         except Exception as e:
             click.echo(f"Sync error: {e}", err=True)
         
+        metrics.REGISTRY.flush()
+        
         # Add some jitter to avoid predictable patterns
         jitter = random.uniform(0, 30)  # 0-30 seconds random delay
         time.sleep(interval + jitter)
 
 
+@click.command()
+@click.option('--config', 'config_path', required=True, type=click.Path(exists=True), help='JSON file listing the chats to follow')
+@click.option('--state', 'state_path', type=click.Path(), help='Where to keep per-chat cursors (default: next to the config)')
+@click.option('--budget', type=int, help='Maximum polls per hour across all chats')
+def follow(config_path: str, state_path: Optional[str], budget: Optional[int]):
+    """Follow many chats, polling busy ones more often than quiet ones"""
+    from .scheduler import DEFAULT_BUDGET, MAX_INTERVAL, MIN_INTERVAL, FollowScheduler, load_config
+    
+    config_file = Path(config_path)
+    config = load_config(config_file)
+    state_file = Path(state_path or config.get("state") or config_file.with_suffix(".state.json"))
+    
+    api_id = os.getenv("TELEGRAM_API_ID")
+    api_hash = os.getenv("TELEGRAM_API_HASH")
+    
+    if not api_id or not api_hash:
+        click.echo("Error: TELEGRAM_API_ID and TELEGRAM_API_HASH must be set in environment", err=True)
+        raise click.Abort()
+    
+    session_file = DEFAULT_SESSION
+    if not session_file.exists():
+        click.echo("Error: Not authenticated. Run 'tg_export login' first", err=True)
+        raise click.Abort()
+    
+    async def run():
+        client = TelegramClient(StringSession(session_file.read_text()), int(api_id), api_hash)
+        await client.start()
+        
+        scheduler = FollowScheduler(
+            client,
+            config["chats"],
+            state_file,
+            budget=budget or config.get("budget", DEFAULT_BUDGET),
+            min_interval=config.get("min_interval", MIN_INTERVAL),
+            max_interval=config.get("max_interval", MAX_INTERVAL),
+            peers=PeerCache(peer_cache_path(session_file)),
+        )
+        click.echo(f"Following {len(config['chats'])} chats (state: {state_file})", err=True)
+        try:
+            await scheduler.run()
+        finally:
+            await client.disconnect()
+    
+    asyncio.run(run())
+
+
+@click.command()
+@click.option('--chat-url', required=True, help='Telegram chat URL')
+@click.option('--archive', required=True, type=click.Path(exists=True, dir_okay=False), help='Export of this chat to reconcile')
+@click.option('--recent', type=int, default=RECONCILE_WINDOW, show_default=True, help='Re-check this many of the newest messages (0 to skip)')
+@click.option('--ids', help='Comma-separated message ids to re-check (e.g. from edit/delete update events)')
+def reconcile(chat_url: str, archive: str, recent: int, ids: Optional[str]):
+    """Record edits and deletions of already archived messages"""
+    try:
+        msg_ids = [int(i) for i in ids.split(',') if i.strip()] if ids else []
+    except ValueError:
+        click.echo("Error: --ids should be comma-separated message ids", err=True)
+        raise click.Abort()
+    
+    api_id = os.getenv("TELEGRAM_API_ID")
+    api_hash = os.getenv("TELEGRAM_API_HASH")
+    
+    if not api_id or not api_hash:
+        click.echo("Error: TELEGRAM_API_ID and TELEGRAM_API_HASH must be set in environment", err=True)
+        raise click.Abort()
+    
+    session_file = DEFAULT_SESSION
+    if not session_file.exists():
+        click.echo("Error: Not authenticated. Run 'tg_export login' first", err=True)
+        raise click.Abort()
+    
+    async def run():
+        client = TelegramClient(StringSession(session_file.read_text()), int(api_id), api_hash)
+        await client.start()
+        try:
+            chat = await resolve_chat(client, parse_chat_url(chat_url), PeerCache(peer_cache_path(session_file)))
+            return await reconcile_archive(client, chat, Path(archive), recent, msg_ids)
+        finally:
+            await client.disconnect()
+    
+    stats = asyncio.run(run())
+    click.echo(f"Checked {stats['checked']} archived messages: {stats['edited']} edited, {stats['deleted']} deleted")
+    if stats['edited'] or stats['deleted']:
+        click.echo(f"Changes recorded in {changes_path(Path(archive))}")
+
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""Compressed, resumable downloads of exports for the web app.
+
+Clients that accept gzip get <export>.gz, a copy compressed once and kept
+next to the export; the first such request streams the compression while
+it writes the copy. Each representation has its own ETag derived from the
+export's size and mtime, so If-None-Match and Range/If-Range requests
+resume against exactly the bytes they started on.
+"""
+import os
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Iterator
+
+GZIP_SUFFIX = ".gz"
+GZIP_LEVEL = 6
+# Smaller files are not worth compressing
+GZIP_MIN_BYTES = 1024
+# Formats that are already compressed
+COMPRESSED_SUFFIXES = {".gz", ".zip", ".bz2", ".xz", ".zst"}
+READ_BYTES = 256 * 1024
+
+
+def file_etag(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip (explicitly, or via * without gzip;q=0)"""
+    qualities = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.strip().lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def should_compress(path: Path) -> bool:
+    return path.suffix.lower() not in COMPRESSED_SUFFIXES and path.stat().st_size >= GZIP_MIN_BYTES
+
+
+def gzip_path(path: Path) -> Path:
+    return path.with_name(path.name + GZIP_SUFFIX)
+
+
+def is_fresh(cached: Path, source: Path) -> bool:
+    """Whether a compressed copy was made from the export as it is now (it carries the export's mtime)"""
+    try:
+        return cached.stat().st_mtime_ns == source.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def stream_gzip(source: Path, cached: Path) -> Iterator[bytes]:
+    """Yield source gzip-compressed, keeping the output as cached once complete.
+
+    The gzip header carries no timestamp or name, so the streamed bytes are
+    the same as the cached copy's and share its ETag.
+    """
+    stat = source.stat()
+    fd, tmp = tempfile.mkstemp(dir=cached.parent, prefix=cached.name, suffix=".tmp")
+    complete = False
+    try:
+        with os.fdopen(fd, "wb") as out, open(source, "rb") as f:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            remaining = stat.st_size
+            while remaining > 0:
+                block = f.read(min(READ_BYTES, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                data = compressor.compress(block)
+                if data:
+                    out.write(data)
+                    yield data
+            data = compressor.flush()
+            out.write(data)
+            yield data
+        os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        complete = True
+    finally:
+        if complete:
+            os.replace(tmp, cached)
+        else:
+            # The client went away before the end
+            os.unlink(tmp)
@@ -0,0 +1,73 @@
+"""Console entry point.
+
+Subcommands are imported only when they run, so `tg_export clean` and
+`--help` never load Telethon. Keep this module free of heavy imports;
+benchmarks/startup.py measures it.
+"""
+import importlib
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from . import metrics
+
+# name -> (import path, short help shown in --help without importing the command)
+COMMANDS = {
+    "login": ("tg_export.cli:login", "Authenticate with Telegram"),
+    "dump": ("tg_export.cli:dump", "Dump all messages from a chat"),
+    "quick": ("tg_export.cli:quick", "Quick export for last N hours - perfect for LLM analysis"),
+    "sync": ("tg_export.cli:sync", "Continuously sync new messages"),
+    "follow": ("tg_export.cli:follow", "Follow many chats, polling busy ones more often than quiet ones"),
+    "clean": ("tg_export.clean_export:clean", "Clean exported Telegram data for LLM processing"),
+    "reconcile": ("tg_export.cli:reconcile", "Record edits and deletions of already archived messages"),
+    "merge": ("tg_export.merge:merge", "Merge several chat exports into one date-ordered clean timeline"),
+    "search": ("tg_export.search:search", "Search an export by keyword, user and date range"),
+    "stats": ("tg_export.stats:stats", "Top posters, messages per hour and bot share for an export"),
+}
+
+
+class LazyGroup(click.Group):
+    """A click group that imports each subcommand on first use"""
+
+    def __init__(self, *args, lazy_commands: Optional[dict] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name in self.lazy_commands and name not in self.commands:
+            module_name, attr = self.lazy_commands[name][0].split(":")
+            self.add_command(getattr(importlib.import_module(module_name), attr), name)
+        return super().get_command(ctx, name)
+
+    def format_commands(self, ctx, formatter):
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.commands:
+                rows.append((name, self.commands[name].get_short_help_str(formatter.width)))
+            else:
+                rows.append((name, self.lazy_commands[name][1]))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
+@click.option('--metrics-file', type=click.Path(), help='Write run metrics here (.json, or Prometheus text otherwise)')
+@click.option('--profile', type=click.Path(file_okay=False), help='Write CPU/allocation profiles and a report to this directory')
+@click.pass_context
+def cli(ctx, metrics_file: Optional[str], profile: Optional[str]):
+    """Telegram Group-Chat Exporter"""
+    if profile:
+        from .profiling import profile_command
+        profile_command(ctx, Path(profile))
+    if metrics_file:
+        metrics.REGISTRY.output = Path(metrics_file)
+        ctx.call_on_close(metrics.REGISTRY.flush)
+
+
+if __name__ == '__main__':
+    cli()
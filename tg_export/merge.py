@@ -0,0 +1,117 @@
+"""Merge many chat exports into one date-ordered clean timeline.
+
+Each export is already ordered within itself: a fresh dump is written
+newest first and resumed dumps append oldest first, so a file is at most
+one descending run followed by one ascending run. Every run becomes a
+sorted stream read straight from the memory-mapped file, and heapq.merge
+interleaves them holding one record per stream.
+"""
+import calendar
+import heapq
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import click
+
+from .clean_export import CLEAN_FIELDS, clean_messages, new_stats, record_clean_metrics, write_clean_messages
+from .reader import ExportReader
+
+
+def _msg_id(reader: ExportReader, raw) -> int:
+    return reader.fields(raw, ('msg_id',))['msg_id']
+
+
+def export_runs(reader: ExportReader) -> List[Tuple[int, int, bool]]:
+    """Split an export into (start offset, end offset, descending) runs"""
+    records = reader.records()
+    first = next(records, None)
+    second = next(records, None)
+    if first is None or second is None or _msg_id(reader, second[1]) > _msg_id(reader, first[1]):
+        return [(reader.start, reader.end, False)] if first else []
+
+    # Newest-first head: walk it until ids start rising again
+    previous = _msg_id(reader, second[1])
+    for offset, raw in records:
+        msg_id = _msg_id(reader, raw)
+        if msg_id > previous:
+            return [(reader.start, offset, True), (offset, reader.end, False)]
+        previous = msg_id
+    return [(reader.start, reader.end, True)]
+
+
+def run_rows(reader: ExportReader, run: Tuple[int, int, bool], source: int, label: str, since: Optional[int] = None):
+    """Yield (ts, source, label, fields) for one run, oldest first, as edited; deleted messages are skipped"""
+    start, end, descending = run
+    if descending:
+        # Reading a newest-first run backwards yields it oldest first
+        for offset, raw in reader.reverse(end):
+            if offset < start:
+                return
+            data = reader.current(raw, CLEAN_FIELDS)
+            if data is not None and (since is None or data['ts'] >= since):
+                yield data['ts'], source, label, data
+        return
+
+    for offset, raw in reader.records(start):
+        if offset >= end:
+            return
+        data = reader.current(raw, CLEAN_FIELDS)
+        if data is not None and (since is None or data['ts'] >= since):
+            yield data['ts'], source, label, data
+
+
+def merged_rows(readers: Sequence[ExportReader], labels: Sequence[str], since: Optional[int] = None) -> Iterator[Tuple[str, dict]]:
+    """Yield (label, fields) across all exports in date order"""
+    streams = []
+    for reader, label in zip(readers, labels):
+        for run in export_runs(reader):
+            streams.append(run_rows(reader, run, len(streams), label, since))
+    # (ts, source) never ties across streams, so labels and dicts are never compared
+    for ts, source, label, data in heapq.merge(*streams):
+        yield label, data
+
+
+def merge_exports(input_files: Sequence[Path], output_file: Path, labels: Optional[Sequence[str]] = None,
+                  since: Optional[datetime] = None, filter_bots: bool = True) -> dict:
+    """Merge exports into one clean timeline labelled by chat; returns clean stats"""
+    labels = list(labels or [])
+    labels += [Path(path).stem for path in input_files[len(labels):]]
+    since_ts = calendar.timegm(since.timetuple()) if since else None
+    stats = new_stats()
+
+    with ExitStack() as stack:
+        readers = [stack.enter_context(ExportReader(path)) for path in input_files]
+        rows = merged_rows(readers, labels, since_ts)
+        write_clean_messages(clean_messages(rows, stats, filter_bots), output_file)
+
+    record_clean_metrics(stats)
+    return stats
+
+
+@click.command()
+@click.argument('inputs', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--out', '-o', required=True, type=click.Path(), help='Output file (.txt chat log, otherwise clean JSONL)')
+@click.option('--label', 'labels', multiple=True, help='Chat label for each input, in order (default: file name)')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Only merge messages since this date (UTC)')
+@click.option('--keep-bots/--no-bots', default=False, help='Keep bot messages (default: filter out)')
+def merge(inputs: Tuple[str, ...], out: str, labels: Tuple[str, ...], since: Optional[datetime], keep_bots: bool):
+    """Merge several chat exports into one date-ordered clean timeline"""
+    if len(labels) > len(inputs):
+        click.echo("Error: More --label values than input files", err=True)
+        raise click.Abort()
+
+    output_file = Path(out)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    click.echo(f"Merging {len(inputs)} exports...", err=True)
+
+    stats = merge_exports([Path(p) for p in inputs], output_file, labels, since, filter_bots=not keep_bots)
+
+    click.echo(f"\n✅ Merge complete!")
+    click.echo(f"📊 Stats:")
+    click.echo(f"   Total messages: {stats['total']}")
+    click.echo(f"   Kept: {stats['kept']}")
+    click.echo(f"   Filtered bots: {stats['filtered_bots']}")
+    click.echo(f"   Filtered media-only: {stats['filtered_media_only']}")
+    click.echo(f"\n📁 Timeline saved to: {output_file}")
@@ -0,0 +1,243 @@
+"""Counters and latency histograms shared by the CLI and the web app.
+
+Metrics are process-wide. The CLI writes them to --metrics-file and the
+Flask app serves them on /metrics in the Prometheus text format.
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WAIT_BUCKETS = (1, 5, 10, 30, 60, 300, 900, 3600)
+
+
+def _label_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    if not labels:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra: Optional[dict] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        self._inc(_label_key(labels), amount)
+
+    def _inc(self, key: tuple, amount: float):
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def labels(self, **labels) -> "_Bound":
+        """Bind label values once, for use in hot loops"""
+        return _Bound(self._inc, _label_key(labels))
+
+    def value(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(key)} {value:g}"
+
+    def to_dict(self):
+        return {_format_labels(key) or "": value for key, value in self.values.items()}
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series: Dict[tuple, list] = {}  # key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        self._observe(_label_key(labels), value)
+
+    def labels(self, **labels) -> "_Bound":
+        """Bind label values once, for use in hot loops"""
+        return _Bound(self._observe, _label_key(labels))
+
+    def _observe(self, key: tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self.series.get(_label_key(labels))
+        return sum(series[:-1]) if series else 0
+
+    def total(self, **labels) -> float:
+        series = self.series.get(_label_key(labels))
+        return series[-1] if series else 0.0
+
+    def samples(self):
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += n
+                yield f"{self.name}_bucket{_format_labels(key, {'le': bound})} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {series[-1]:g}"
+            yield f"{self.name}_count{_format_labels(key)} {cumulative}"
+
+    def to_dict(self):
+        return {
+            _format_labels(key) or "": {"count": sum(series[:-1]), "sum": series[-1],
+                                        "buckets": dict(zip(map(str, self.buckets + ("+Inf",)), series[:-1]))}
+            for key, series in self.series.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self.series.clear()
+
+
+class _Bound:
+    """A counter or histogram with its labels already resolved"""
+
+    __slots__ = ("_record", "_key")
+
+    def __init__(self, record, key: tuple):
+        self._record = record
+        self._key = key
+
+    def inc(self, amount: float = 1):
+        self._record(self._key, amount)
+
+    def observe(self, value: float):
+        self._record(self._key, value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.output: Optional[Path] = None
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        return {name: metric.to_dict() for name, metric in self.metrics.items()}
+
+    def write(self, path: Path):
+        """Write metrics as JSON (.json) or Prometheus text (anything else)"""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        if path.suffix == ".json":
+            tmp.write_text(json.dumps(self.to_dict(), indent=2))
+        else:
+            tmp.write_text(self.render_prometheus())
+        tmp.replace(path)
+
+    def flush(self):
+        """Write to the configured output file, if any (used by long-running loops)"""
+        if self.output:
+            self.write(self.output)
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+REGISTRY = Registry()
+
+PAGE_FETCH_SECONDS = REGISTRY.histogram("tg_export_page_fetch_seconds", "Time spent waiting on Telegram for a page of messages")
+FLOOD_WAITS = REGISTRY.counter("tg_export_flood_waits_total", "FloodWaitErrors received from Telegram")
+FLOOD_WAIT_SECONDS = REGISTRY.histogram("tg_export_flood_wait_seconds", "Wait time demanded by FloodWaitErrors", WAIT_BUCKETS)
+SENDER_RESOLUTIONS = REGISTRY.counter("tg_export_sender_resolutions_total", "Message senders looked up, by result")
+SENDER_RESOLVE_SECONDS = REGISTRY.histogram("tg_export_sender_resolve_seconds", "Time spent resolving the senders of a page of messages")
+RECORDS_SERIALIZED = REGISTRY.counter("tg_export_records_serialized_total", "Messages serialized to export records")
+SERIALIZE_SECONDS = REGISTRY.histogram("tg_export_serialize_seconds", "Time spent serializing a batch of messages")
+PARENT_FETCHES = REGISTRY.counter("tg_export_parent_fetches_total", "Batched lookups of reply parents missing from an export")
+BYTES_WRITTEN = REGISTRY.counter("tg_export_bytes_written_total", "Bytes written to export files")
+CLEAN_RECORDS = REGISTRY.counter("tg_export_clean_records_total", "Records seen by the clean filter, by outcome")
+QUERY_CACHE = REGISTRY.counter("tg_export_query_cache_total", "Archive API queries, by cache result")
+QUERY_SECONDS = REGISTRY.histogram("tg_export_query_seconds", "Time spent answering an archive API query")
+
+_SENDER_RESOLVED = SENDER_RESOLUTIONS.labels(result="resolved")
+_SENDER_MISSING = SENDER_RESOLUTIONS.labels(result="missing")
+
+
+def record_flood_wait(seconds: float):
+    FLOOD_WAITS.inc()
+    FLOOD_WAIT_SECONDS.observe(seconds)
+
+
+def page_senders(page: list) -> list:
+    """message.sender for each message of a page, timed and counted once for the page"""
+    start = time.perf_counter()
+    senders = [message.sender for message in page]
+    SENDER_RESOLVE_SECONDS.observe(time.perf_counter() - start)
+    missing = sum(1 for sender in senders if sender is None)
+    if missing:
+        _SENDER_MISSING.inc(missing)
+    if len(senders) > missing:
+        _SENDER_RESOLVED.inc(len(senders) - missing)
+    return senders
+
+
+async def timed_pages(messages, page_size: int):
+    """Yield lists of up to page_size messages from an async message iterator, timing each page's arrival"""
+    page = []
+    start = time.perf_counter()
+    try:
+        async for message in messages:
+            page.append(message)
+            if len(page) == page_size:
+                PAGE_FETCH_SECONDS.observe(time.perf_counter() - start)
+                yield page
+                page = []
+                start = time.perf_counter()
+    except Exception:
+        # What arrived before the error (e.g. a FloodWaitError) is still handed on
+        if page:
+            yield page
+        raise
+    if page:
+        PAGE_FETCH_SECONDS.observe(time.perf_counter() - start)
+        yield page
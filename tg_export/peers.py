@@ -0,0 +1,99 @@
+"""Resolved chats cached on disk next to the session.
+
+Resolving a @username costs a request Telegram flood-limits heavily, and
+sync and follow would otherwise repeat it every poll. Access hashes are
+only valid for the account that obtained them, so each session file gets
+its own cache (<session>.peers.json).
+"""
+import json
+from pathlib import Path
+from typing import Optional
+
+from telethon.errors import (ChannelInvalidError, ChannelPrivateError, ChatForbiddenError, ChatIdInvalidError,
+                             PeerIdInvalidError)
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+from telethon.utils import get_input_peer
+
+PEER_CACHE_SUFFIX = ".peers.json"
+# A cached peer that fails with one of these is resolved again
+ACCESS_ERRORS = (ChannelInvalidError, ChannelPrivateError, ChatForbiddenError, ChatIdInvalidError, PeerIdInvalidError)
+
+
+def peer_cache_path(session_file: Path) -> Path:
+    session_file = Path(session_file)
+    return session_file.with_name(session_file.name + PEER_CACHE_SUFFIX)
+
+
+def _peer_key(identifier) -> str:
+    return identifier.lower() if isinstance(identifier, str) else str(identifier)
+
+
+class PeerCache:
+    """chat identifier -> input peer (id, access hash) and title, persisted as JSON"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        try:
+            self.peers = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.peers = {}
+
+    def __contains__(self, identifier) -> bool:
+        return _peer_key(identifier) in self.peers
+
+    def get(self, identifier):
+        """The cached input peer for a chat, or None"""
+        peer = self.peers.get(_peer_key(identifier))
+        if peer is None:
+            return None
+        if peer["type"] == "channel":
+            return InputPeerChannel(peer["id"], peer["access_hash"])
+        if peer["type"] == "user":
+            return InputPeerUser(peer["id"], peer["access_hash"])
+        return InputPeerChat(peer["id"])
+
+    def title(self, identifier) -> Optional[str]:
+        peer = self.peers.get(_peer_key(identifier))
+        return peer["title"] if peer else None
+
+    def put(self, identifier, entity) -> bool:
+        """Cache a resolved entity; returns False for anything that is not a chat or user"""
+        try:
+            peer = get_input_peer(entity)
+        except TypeError:
+            return False
+        title = getattr(entity, "title", None) or getattr(entity, "username", None)
+        if isinstance(peer, InputPeerChannel):
+            self.peers[_peer_key(identifier)] = {"type": "channel", "id": peer.channel_id, "access_hash": peer.access_hash, "title": title}
+        elif isinstance(peer, InputPeerUser):
+            self.peers[_peer_key(identifier)] = {"type": "user", "id": peer.user_id, "access_hash": peer.access_hash, "title": title}
+        elif isinstance(peer, InputPeerChat):
+            self.peers[_peer_key(identifier)] = {"type": "chat", "id": peer.chat_id, "access_hash": None, "title": title}
+        else:
+            return False
+        self.save()
+        return True
+
+    def invalidate(self, identifier) -> bool:
+        """Forget a chat; returns whether it was cached"""
+        if self.peers.pop(_peer_key(identifier), None) is None:
+            return False
+        self.save()
+        return True
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.peers, indent=2, ensure_ascii=False))
+        tmp.replace(self.path)
+
+
+async def resolve_chat(client, identifier, peers: Optional[PeerCache] = None):
+    """A chat's cached input peer, or the entity from client.get_entity (then cached)"""
+    if peers is not None:
+        peer = peers.get(identifier)
+        if peer is not None:
+            return peer
+    entity = await client.get_entity(identifier)
+    if peers is not None:
+        peers.put(identifier, entity)
+    return entity
@@ -0,0 +1,121 @@
+"""Profile a CLI run with cProfile and tracemalloc.
+
+A profile directory gets the raw files in standard formats plus a short
+text report breaking the run down into time spent waiting on Telegram
+and time spent in our own serialization and text processing.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import click
+
+from . import metrics
+
+PROFILE_FILE = "profile.prof"          # pstats format: python -m pstats, snakeviz, ...
+SNAPSHOT_FILE = "allocations.snapshot"  # tracemalloc.Snapshot.load()
+REPORT_FILE = "report.txt"
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 15
+TRACEBACK_FRAMES = 5
+
+
+def _in_package(filename: str, package: str) -> bool:
+    return f"{os.sep}{package}{os.sep}" in filename
+
+
+def _is_idle(key) -> bool:
+    """The event loop blocking in select/epoll: network waits plus throttling sleeps"""
+    return key[0] == "~" and "'select." in key[2] and ("poll'" in key[2] or "select'" in key[2])
+
+
+def _is_json(key) -> bool:
+    return _in_package(key[0], "json") or "_json" in key[2]
+
+
+def _is_regex(key) -> bool:
+    return _in_package(key[0], "re") or "'re.Pattern'" in key[2]
+
+
+def _own_time(stats: pstats.Stats, predicate) -> float:
+    """Sum of time spent inside matching functions themselves (never double counted)"""
+    return sum(tt for key, (cc, nc, tt, ct, callers) in stats.stats.items() if predicate(key))
+
+
+def _cumulative_time(stats: pstats.Stats, name: str) -> float:
+    return sum(ct for key, (cc, nc, tt, ct, callers) in stats.stats.items() if key[2] == name)
+
+
+class RunProfiler:
+    """Collects CPU and allocation profiles between start() and stop()"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fetch_before = metrics.PAGE_FETCH_SECONDS.total()
+        self.resolve_before = metrics.SENDER_RESOLVE_SECONDS.total()
+        tracemalloc.start(TRACEBACK_FRAMES)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.profiler.enable()
+
+    def stop(self) -> Path:
+        """Stop profiling and write the raw files and report; returns the report path"""
+        self.profiler.disable()
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.profiler.dump_stats(self.directory / PROFILE_FILE)
+        snapshot.dump(str(self.directory / SNAPSHOT_FILE))
+
+        stats = pstats.Stats(self.profiler)
+        breakdown = [
+            ("waiting on Telegram for pages", metrics.PAGE_FETCH_SECONDS.total() - self.fetch_before),
+            ("resolving senders", metrics.SENDER_RESOLVE_SECONDS.total() - self.resolve_before),
+            ("event loop idle (network + delays)", _own_time(stats, _is_idle)),
+            ("serialize_entities", _cumulative_time(stats, "serialize_entities")),
+            ("json encode/decode", _own_time(stats, _is_json)),
+            ("regex", _own_time(stats, _is_regex)),
+        ]
+
+        lines = [
+            f"Profile of: {' '.join(sys.argv)}",
+            f"Wall time: {wall:.2f}s  CPU time: {cpu:.2f}s  Peak traced memory: {peak / 2**20:.1f} MiB",
+            "",
+            "Where the time went:",
+        ]
+        lines += [f"  {label:<38} {seconds:8.3f}s {100 * seconds / wall if wall else 0:5.1f}%"
+                  for label, seconds in breakdown]
+
+        listing = io.StringIO()
+        stats.stream = listing
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        lines += ["", f"Top {TOP_FUNCTIONS} functions by cumulative time:", listing.getvalue().strip()]
+
+        lines += ["", f"Top {TOP_ALLOCATIONS} allocation sites still held at exit:"]
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            lines.append(f"  {stat.size / 1024:10.1f} KiB {stat.count:8} blocks  {stat.traceback[0]}")
+
+        lines += ["", f"Raw files: {PROFILE_FILE} (pstats), {SNAPSHOT_FILE} (tracemalloc snapshot)"]
+
+        report = self.directory / REPORT_FILE
+        report.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        return report
+
+
+def profile_command(ctx: click.Context, directory: Path):
+    """Profile the rest of a click command, writing the results when it exits"""
+    profiler = RunProfiler(directory)
+    profiler.start()
+    ctx.call_on_close(lambda: click.echo(f"Profile report written to {profiler.stop()}", err=True))
@@ -0,0 +1,197 @@
+"""Read-only queries over export archives for the web app's JSON API.
+
+Queries are answered from each archive's search index (tg_export.search),
+which is brought up to date only when the archive or its change log has
+changed since the last query. Results come newest first in pages; a page's
+cursor is the (ts, offset) of its last record, so messages appended while
+a client pages through never shift what it sees. Answers are kept in an
+in-process LRU cache keyed by the archive's state, and the entries of an
+archive are dropped as soon as it grows.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+from .changes import changes_path
+from .clean_export import find_exports
+from .reader import ExportReader
+from .search import SearchIndex, epoch
+from .threads import export_chat_id
+
+RESULT_FIELDS = ('msg_id', 'chat_id', 'ts', 'sender_id', 'sender_username', 'reply_to', 'text', 'media_type')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+CACHE_SIZE = 256
+
+
+class QueryError(ValueError):
+    """A query parameter that cannot be used"""
+
+
+def archive_state(path: Path) -> Tuple[int, int, int]:
+    """(size, mtime_ns, change log size) of an archive; changes whenever it grows or is edited"""
+    stat = path.stat()
+    changes = changes_path(path)
+    return stat.st_size, stat.st_mtime_ns, changes.stat().st_size if changes.exists() else 0
+
+
+def encode_cursor(ts: int, offset: int) -> str:
+    return f"{ts:x}.{offset:x}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        ts, offset = cursor.split(".")
+        return int(ts, 16), int(offset, 16)
+    except ValueError:
+        raise QueryError(f"Invalid cursor: {cursor}")
+
+
+def parse_time(value: Optional[str]) -> Optional[int]:
+    """Epoch seconds from an ISO date or date and time (UTC unless it has an offset)"""
+    if not value:
+        return None
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"Invalid date: {value}")
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return epoch(date)
+
+
+def parse_limit(value: Optional[str]) -> int:
+    if not value:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError(f"Invalid limit: {value}")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise QueryError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+def message_json(data: dict) -> dict:
+    return dict(data, date=datetime.fromtimestamp(data['ts'], timezone.utc).isoformat())
+
+
+class ArchiveQueries:
+    """Indexed, cached queries over the exports under one directory"""
+
+    def __init__(self, root: Path, cache_size: int = CACHE_SIZE):
+        self.root = Path(root)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._indexed: Dict[Path, tuple] = {}
+        self._chat_ids: Dict[Path, Tuple[tuple, Optional[int]]] = {}
+        self._lock = threading.Lock()
+
+    def paths(self) -> List[Path]:
+        if not self.root.is_dir():
+            return []
+        dirs = [self.root] + sorted(d for d in self.root.rglob("*") if d.is_dir()
+                                    and not any(part.startswith('.') for part in d.relative_to(self.root).parts))
+        return find_exports(str(d) for d in dirs)
+
+    def name(self, path: Path) -> str:
+        return path.relative_to(self.root).as_posix()
+
+    def chat_id(self, path: Path) -> Optional[int]:
+        state = archive_state(path)
+        known = self._chat_ids.get(path)
+        if known is None or known[0] != state:
+            known = self._chat_ids[path] = (state, export_chat_id(path))
+        return known[1]
+
+    def archives(self) -> List[dict]:
+        archives = []
+        for path in self.paths():
+            with ExportReader(path) as reader:
+                fmt = reader.format
+            size, mtime_ns, changes = archive_state(path)
+            archives.append({
+                'name': self.name(path),
+                'chat_id': self.chat_id(path),
+                'format': fmt,
+                'bytes': size,
+                'modified': datetime.fromtimestamp(mtime_ns / 1e9, timezone.utc).isoformat(),
+            })
+        return archives
+
+    def find(self, archive: Optional[str] = None, chat: Optional[str] = None) -> Path:
+        """The archive named (relative to root) or the one holding a chat id"""
+        paths = self.paths()
+        if archive:
+            for path in paths:
+                if self.name(path) == archive:
+                    return path
+            raise LookupError(f"No archive named {archive}")
+        if not chat:
+            raise QueryError("archive or chat is required")
+        try:
+            chat_id = int(chat)
+        except ValueError:
+            raise QueryError(f"Invalid chat id: {chat}")
+        matches = [path for path in paths if self.chat_id(path) == chat_id]
+        if not matches:
+            raise LookupError(f"No archive for chat {chat_id}")
+        if len(matches) > 1:
+            raise QueryError(f"Chat {chat_id} is in several archives, pick one with archive: "
+                             + ", ".join(self.name(path) for path in matches))
+        return matches[0]
+
+    def _refresh(self, path: Path) -> tuple:
+        """Index what was added to the archive since the last query, dropping its cached answers"""
+        state = archive_state(path)
+        if self._indexed.get(path) != state:
+            with SearchIndex(path) as index:
+                index.update()
+            for key in [key for key in self._cache if key[0] == path]:
+                del self._cache[key]
+            self._indexed[path] = state
+        return state
+
+    def query(self, path: Path, words: Tuple[str, ...] = (), sender: Optional[str] = None,
+              since: Optional[int] = None, until: Optional[int] = None, limit: int = DEFAULT_LIMIT,
+              cursor: Optional[str] = None) -> dict:
+        """One page of an archive's messages matching the filters, newest first"""
+        before = decode_cursor(cursor) if cursor else None
+        started = time.perf_counter()
+        with self._lock:
+            state = self._refresh(path)
+            key = (path, state, tuple(words), sender, since, until, limit, before)
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+        if result is not None:
+            metrics.QUERY_CACHE.inc(result="hit")
+            return result
+
+        with SearchIndex(path) as index:
+            rows = index.page(words, sender, since, until, limit + 1, before)
+        messages = []
+        with ExportReader(path) as reader:
+            for ts, offset in rows[:limit]:
+                data = reader.current(reader.record_at(offset), RESULT_FIELDS)
+                if data is not None:
+                    messages.append(message_json(data))
+        result = {
+            'archive': self.name(path),
+            'messages': messages,
+            'next_cursor': encode_cursor(*rows[limit - 1]) if len(rows) > limit else None,
+        }
+
+        with self._lock:
+            # Not if the archive changed meanwhile, the answer may be stale already
+            if self._indexed.get(path) == state:
+                self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        metrics.QUERY_CACHE.inc(result="miss")
+        metrics.QUERY_SECONDS.observe(time.perf_counter() - started)
+        return result
@@ -1,6 +1,8 @@
 import asyncio
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
+from werkzeug.security import safe_join
 from pathlib import Path
+import mimetypes
 import os
 from datetime import datetime, timedelta
 import json
@@ -15,11 +17,24 @@ from telethon.sessions import StringSession
 from telethon.utils import get_peer_id
 from dotenv import load_dotenv
 
-from .cli import parse_chat_url, serialize_entities
+from . import downloads, metrics
+from .cassette import RecordingClient, ReplayClient
+from .cli import BATCH_SIZE, parse_chat_url, serialize_entities
 from .clean_export import convert_to_clean_format
+from .peers import ACCESS_ERRORS, PeerCache, peer_cache_path, resolve_chat
+from .query import ArchiveQueries, QueryError, parse_limit, parse_time
+from .sessions import DEFAULT_SESSION
 
 load_dotenv()
 
+# Pause briefly every PROGRESS_BATCH messages to stay under rate limits
+PROGRESS_BATCH = 50
+BATCH_DELAY = 0.5
+
+EXPORTS_DIR = Path("exports/quick")
+# Archives served read-only by the /api endpoints
+ARCHIVES_DIR = Path("exports")
+
 app = Flask(__name__)
 app.config['TEMPLATES_AUTO_RELOAD'] = True
 
@@ -35,33 +50,47 @@ export_status = {
 # Cache for recent exports
 recent_exports = []
 
-async def quick_export(chat_url: str, hours: int, clean: bool = True, username_filter: str = None):
+# Indexes and cached answers for the /api endpoints
+archive_queries = ArchiveQueries(ARCHIVES_DIR)
+
+async def quick_export(chat_url: str, hours: int, clean: bool = True, username_filter: str = None, record: Optional[str] = None, replay: Optional[str] = None, replay_speed: str = 'fast'):
     """Export messages from the last N hours"""
     global export_status
     
-    api_id = int(os.getenv("TELEGRAM_API_ID"))
-    api_hash = os.getenv("TELEGRAM_API_HASH")
-    session_file = Path(".session")
-    
-    if not session_file.exists():
-        export_status['error'] = "Not logged in. Run 'tg_export login' first"
-        return None
+    peers = None
+    if replay:
+        client = ReplayClient(Path(replay), realtime=replay_speed == 'recorded')
+    else:
+        api_id = int(os.getenv("TELEGRAM_API_ID"))
+        api_hash = os.getenv("TELEGRAM_API_HASH")
+        session_file = DEFAULT_SESSION
+        
+        if not session_file.exists():
+            export_status['error'] = "Not logged in. Run 'tg_export login' first"
+            return None
+        
+        session = session_file.read_text()
+        client = TelegramClient(StringSession(session), api_id, api_hash)
+        if record:
+            client = RecordingClient(client, Path(record))
+        else:
+            peers = PeerCache(peer_cache_path(session_file))
     
-    session = session_file.read_text()
-    client = TelegramClient(StringSession(session), api_id, api_hash)
+    # Nothing to rate limit when replaying offline as fast as possible
+    batch_delay = 0 if replay and replay_speed == 'fast' else BATCH_DELAY
     
     try:
         await client.start()
         
         # Parse chat
         chat_identifier = parse_chat_url(chat_url)
-        chat = await client.get_entity(chat_identifier)
+        chat = await resolve_chat(client, chat_identifier, peers)
         
-        # Set time limit
-        since = datetime.now() - timedelta(hours=hours)
+        # Set time limit (replays keep the window they were recorded with)
+        since = ((client.started if replay else None) or datetime.now()) - timedelta(hours=hours)
         
         # Create temp file
-        temp_dir = Path("exports/quick")
+        temp_dir = EXPORTS_DIR
         temp_dir.mkdir(parents=True, exist_ok=True)
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -72,56 +101,66 @@ async def quick_export(chat_url: str, hours: int, clean: bool = True, username_f
         messages = []
         count = 0
         
-        async for message in client.iter_messages(chat):
-            if message.date.replace(tzinfo=None) < since:
-                break
-            
-            # Skip empty messages
-            if not message.text:
-                continue
-            
-            # Get sender username
-            sender_username = getattr(message.sender, 'username', None) if message.sender else None
-            
-            # Filter by username if specified
-            if username_filter:
-                if not sender_username or sender_username.lower() != username_filter.lower():
+        reached_since = False
+        async for page in metrics.timed_pages(client.iter_messages(chat), BATCH_SIZE):
+            for message, sender in zip(page, metrics.page_senders(page)):
+                if message.date.replace(tzinfo=None) < since:
+                    reached_since = True
+                    break
+                
+                # Skip empty messages
+                if not message.text:
                     continue
-            
-            # Build message data
-            media_type = None
-            if message.photo:
-                media_type = "photo"
-            elif message.video:
-                media_type = "video"
-            elif message.document:
-                media_type = "doc"
-            
-            data = {
-                "msg_id": message.id,
-                "chat_id": get_peer_id(message.peer_id),
-                "date": message.date.isoformat() + "Z",
-                "sender_id": message.sender_id,
-                "sender_username": sender_username,
-                "reply_to": message.reply_to.reply_to_msg_id if message.reply_to else None,
-                "text": message.text or "",
-                "entities": serialize_entities(message.entities),
-                "media_type": media_type,
-                "media_file_id": None
-            }
-            
-            messages.append(data)
-            count += 1
-            export_status['progress'] = count
-            
-            # Small delay every 50 messages
-            if count % 50 == 0:
-                await asyncio.sleep(0.5)
+                
+                # Get sender username
+                sender_username = getattr(sender, 'username', None) if sender else None
+                
+                # Filter by username if specified
+                if username_filter:
+                    if not sender_username or sender_username.lower() != username_filter.lower():
+                        continue
+                
+                # Build message data
+                media_type = None
+                if message.photo:
+                    media_type = "photo"
+                elif message.video:
+                    media_type = "video"
+                elif message.document:
+                    media_type = "doc"
+                
+                data = {
+                    "msg_id": message.id,
+                    "chat_id": get_peer_id(message.peer_id),
+                    "date": message.date.isoformat() + "Z",
+                    "sender_id": message.sender_id,
+                    "sender_username": sender_username,
+                    "reply_to": message.reply_to.reply_to_msg_id if message.reply_to else None,
+                    "text": message.text or "",
+                    "entities": serialize_entities(message.entities),
+                    "media_type": media_type,
+                    "media_file_id": None
+                }
+                
+                messages.append(data)
+                count += 1
+                export_status['progress'] = count
+                
+                # Small delay every batch
+                if count % PROGRESS_BATCH == 0:
+                    await asyncio.sleep(batch_delay)
+            if reached_since:
+                break
         
         # Write to file
         with open(output_file, 'w', encoding='utf-8') as f:
-            for msg in messages:
-                f.write(json.dumps(msg, ensure_ascii=False) + '\n')
+            for start in range(0, len(messages), BATCH_SIZE):
+                started = time.perf_counter()
+                lines = [json.dumps(msg, ensure_ascii=False) + '\n' for msg in messages[start:start + BATCH_SIZE]]
+                metrics.SERIALIZE_SECONDS.observe(time.perf_counter() - started)
+                f.writelines(lines)
+            metrics.RECORDS_SERIALIZED.inc(len(messages))
+            metrics.BYTES_WRITTEN.inc(f.tell())
         
         # Clean if requested
         if clean:
@@ -134,8 +173,15 @@ async def quick_export(chat_url: str, hours: int, clean: bool = True, username_f
             return output_file
             
     except FloodWaitError as e:
+        metrics.record_flood_wait(e.seconds)
         export_status['error'] = f"Rate limited. Try again in {e.seconds} seconds"
         return None
+    except ACCESS_ERRORS as e:
+        # The next export resolves the chat again in case the cached peer went stale
+        if peers is not None:
+            peers.invalidate(parse_chat_url(chat_url))
+        export_status['error'] = f"Cannot access chat: {e}"
+        return None
     except Exception as e:
         export_status['error'] = str(e)
         return None
@@ -221,11 +267,37 @@ def get_status():
 
 @app.route('/download/<path:filename>')
 def download_file(filename):
-    """Download exported file"""
-    file_path = Path("exports/quick") / filename
-    if file_path.exists():
-        return send_file(file_path, as_attachment=True)
-    return "File not found", 404
+    """Download exported file (gzip-compressed if accepted; resumable with Range and ETags)"""
+    joined = safe_join(str(EXPORTS_DIR), filename)
+    if joined is None or not Path(joined).is_file():
+        return "File not found", 404
+    # send_file resolves relative paths against the package, not the cwd
+    file_path = Path(joined).resolve()
+    etag = downloads.file_etag(file_path)
+    mimetype = mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+    
+    if not (downloads.should_compress(file_path) and downloads.accepts_gzip(request.headers.get('Accept-Encoding', ''))):
+        response = send_file(file_path, mimetype=mimetype, as_attachment=True, etag=etag)
+    else:
+        cached = downloads.gzip_path(file_path)
+        if downloads.is_fresh(cached, file_path):
+            response = send_file(cached, mimetype=mimetype, as_attachment=True, download_name=file_path.name, etag=etag + '-gz')
+        else:
+            # Compress while sending; the copy it leaves serves ranges and later requests
+            response = Response(stream_with_context(downloads.stream_gzip(file_path, cached)), mimetype=mimetype)
+            response.headers['Content-Disposition'] = f'attachment; filename="{file_path.name}"'
+            response.set_etag(etag + '-gz')
+            response = response.make_conditional(request)
+        response.headers['Content-Encoding'] = 'gzip'
+    
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics for exports run by this server"""
+    return Response(metrics.REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/recent')
@@ -234,6 +306,34 @@ def get_recent():
     return jsonify(recent_exports)
 
 
+@app.route('/api/archives')
+def api_archives():
+    """List the archives the query API can serve"""
+    return jsonify({'archives': archive_queries.archives()})
+
+
+@app.route('/api/messages')
+def api_messages():
+    """Query one archive (by name or chat id) by date range, sender and text, a page at a time"""
+    args = request.args
+    try:
+        path = archive_queries.find(args.get('archive'), args.get('chat'))
+        result = archive_queries.query(
+            path,
+            words=tuple(args.get('q', '').split()),
+            sender=args.get('sender') or None,
+            since=parse_time(args.get('since')),
+            until=parse_time(args.get('until')),
+            limit=parse_limit(args.get('limit')),
+            cursor=args.get('cursor') or None,
+        )
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    return jsonify(result)
+
+
 def create_app():
     """Create Flask app with templates"""
     # Create templates directory
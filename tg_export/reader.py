@@ -0,0 +1,290 @@
+"""Memory-mapped reader for export files.
+
+Records are served as memoryview slices of the mapped file, so iterating,
+seeking and reading from the end never copy or decode more than the
+caller asks for. Every offline tool reads exports through this module.
+Edits and deletions recorded by `reconcile` are overlaid by current().
+
+    with ExportReader(path) as reader:
+        for offset, raw in reader:
+            fields = reader.fields(raw, ("msg_id", "ts"))
+"""
+import json
+import mmap
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import records
+from .changes import apply_change, load_changes
+from .records import LENGTH, MAGIC
+
+# Where each record field lives in the two JSONL schemas
+JSON_KEYS = {
+    "jsonl": {"msg_id": "msg_id", "chat_id": "chat_id", "ts": "date", "sender_id": "sender_id",
+              "sender_username": "sender_username", "reply_to": "reply_to", "text": "text",
+              "entities": "entities", "media_type": "media_type", "media_file_id": "media_file_id"},
+    "compact": {"msg_id": "id", "chat_id": "chat", "ts": "ts", "sender_id": "from",
+                "sender_username": "user", "reply_to": "re", "text": "text", "entities": "ent",
+                "media_type": "media", "media_file_id": "fid"},
+}
+# Scanning for a few keys beats parsing the whole line; past this, parse it.
+# benchmarks/fields.py measures the crossover (4-5 fields), so clean's 7 fields are parsed
+SCAN_FIELDS = 3
+# Fields readable from the fixed binary header without decoding strings
+BINARY_HEADER_FIELDS = {"msg_id", "chat_id", "ts", "sender_id", "reply_to", "media_type"}
+# A JSON scalar value; escaped quotes inside strings can never match a key
+JSON_VALUE = rb'\s*("[^"\\]*(?:\\.[^"\\]*)*"|-?\d+|null|true|false|[\[{])'
+
+_patterns: Dict[Tuple[str, str], "re.Pattern"] = {}
+
+
+def _pattern(fmt: str, field: str) -> "re.Pattern":
+    key = (fmt, field)
+    if key not in _patterns:
+        name = JSON_KEYS[fmt][field].encode()
+        _patterns[key] = re.compile(rb'"' + name + rb'":' + JSON_VALUE)
+    return _patterns[key]
+
+
+def _json_value(value: bytes):
+    first = value[:1]
+    if first == b'"':
+        return value[1:-1].decode("utf-8") if b"\\" not in value else json.loads(value)
+    if first == b"n":
+        return None
+    if first in (b"t", b"f"):
+        return first == b"t"
+    return int(value)
+
+
+class ExportReader:
+    """A memory-mapped export file in any record format"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        size = self.path.stat().st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.data = memoryview(self._mmap) if self._mmap is not None else memoryview(b"")
+        self.size = len(self.data)
+
+        if self.data[:len(MAGIC)] == MAGIC:
+            self.format = "binary"
+            self.start = len(MAGIC)
+            self.end = self._binary_end()
+        else:
+            self.format = records.detect_format(self.path) or records.DEFAULT_FORMAT
+            self.start = 0
+            self.end = self.size
+        self.changes = load_changes(self.path)
+
+    def close(self):
+        self.data.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # Callers still hold record slices; the map closes once they are freed
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self) -> Iterator[Tuple[int, memoryview]]:
+        return self.records()
+
+    def _binary_end(self) -> int:
+        """End of the last complete frame (an interrupted write may leave a partial one)"""
+        end = self.size
+        if end - self.start >= 2 * LENGTH.size:
+            (length,) = LENGTH.unpack_from(self.data, end - LENGTH.size)
+            begin = end - 2 * LENGTH.size - length
+            if begin >= self.start and LENGTH.unpack_from(self.data, begin)[0] == length:
+                return end
+        # Tail is damaged: walk forward to the last frame that fits
+        pos = self.start
+        while pos + LENGTH.size <= end:
+            (length,) = LENGTH.unpack_from(self.data, pos)
+            if pos + 2 * LENGTH.size + length > end:
+                break
+            pos += 2 * LENGTH.size + length
+        return pos
+
+    def complete_end(self) -> int:
+        """End of the last complete record (a running dump may be mid-line)"""
+        if self.format == "binary" or self._mmap is None:
+            return self.end
+        return self._mmap.rfind(b"\n", 0, self.end) + 1
+
+    def split(self, parts: int) -> List[Tuple[int, int]]:
+        """Split the records into at most `parts` (start, end) byte ranges on record boundaries"""
+        size = self.end - self.start
+        if size <= 0:
+            return []
+        step = max(1, -(-size // parts))
+        bounds = [self.start]
+        if self.format == "binary":
+            # Frames can only be found from the front; hop over their lengths
+            target = self.start + step
+            for offset, raw in self.records():
+                if offset >= target:
+                    bounds.append(offset)
+                    target = offset + step
+        else:
+            target = self.start + step
+            while target < self.end:
+                newline = self._mmap.find(b"\n", target - 1, self.end)
+                if newline == -1 or newline + 1 >= self.end:
+                    break
+                bounds.append(newline + 1)
+                target = newline + 1 + step
+        bounds.append(self.end)
+        return list(zip(bounds, bounds[1:]))
+
+    def records(self, offset: Optional[int] = None) -> Iterator[Tuple[int, memoryview]]:
+        """Yield (offset, raw record) from offset (default: the first record) to the end"""
+        data, end = self.data, self.end
+        pos = self.start if offset is None else max(offset, self.start)
+        if self.format == "binary":
+            while pos < end:
+                (length,) = LENGTH.unpack_from(data, pos)
+                yield pos, data[pos + LENGTH.size:pos + LENGTH.size + length]
+                pos += 2 * LENGTH.size + length
+            return
+
+        find = self._mmap.find if self._mmap is not None else None
+        while pos < end:
+            newline = find(b"\n", pos)
+            if newline == -1:
+                newline = end
+            if newline > pos:
+                yield pos, data[pos:newline]
+            pos = newline + 1
+
+    def reverse(self, offset: Optional[int] = None) -> Iterator[Tuple[int, memoryview]]:
+        """Yield (offset, raw record) backwards, starting before offset (default: the end)"""
+        data = self.data
+        pos = self.end if offset is None else min(offset, self.end)
+        if self.format == "binary":
+            while pos > self.start:
+                (length,) = LENGTH.unpack_from(data, pos - LENGTH.size)
+                begin = pos - 2 * LENGTH.size - length
+                yield begin, data[begin + LENGTH.size:pos - LENGTH.size]
+                pos = begin
+            return
+
+        if self._mmap is None:
+            return
+        # Skip the newline ending the record before pos
+        if pos > 0 and data[pos - 1:pos] == b"\n":
+            pos -= 1
+        while pos > 0:
+            begin = self._mmap.rfind(b"\n", 0, pos) + 1
+            if pos > begin:
+                yield begin, data[begin:pos]
+            pos = begin - 1
+
+    def record_at(self, offset: int) -> memoryview:
+        """The raw record starting at a byte offset"""
+        return next(self.records(offset))[1]
+
+    def first(self) -> Optional[memoryview]:
+        return next(self.records(), (None, None))[1]
+
+    def last(self) -> Optional[memoryview]:
+        return next(self.reverse(), (None, None))[1]
+
+    def decode(self, raw: memoryview) -> dict:
+        """Fully decode a raw record"""
+        if self.format == "binary":
+            return records.decode_frame(raw)
+        return records.decode_line(str(raw, "utf-8"))
+
+    def fields(self, raw: memoryview, names: Iterable[str]) -> dict:
+        """Decode only the named fields of a raw record"""
+        names = tuple(names)
+        if self.format == "binary":
+            if BINARY_HEADER_FIELDS.issuperset(names):
+                head = records.HEAD.unpack_from(raw, 0)
+                flags = head[0]
+                values = {
+                    "msg_id": head[1],
+                    "chat_id": head[2],
+                    "ts": head[3],
+                    "sender_id": head[4] if flags & records.HAS_SENDER else None,
+                    "reply_to": head[5] if flags & records.HAS_REPLY else None,
+                    "media_type": records.MEDIA_TYPES[head[6]],
+                }
+                return {name: values[name] for name in names}
+            record = records.decode_frame(raw)
+            return {name: record[name] for name in names}
+
+        if len(names) > SCAN_FIELDS:
+            return self._pick(raw, names)
+
+        result = {}
+        for name in names:
+            match = _pattern(self.format, name).search(raw)
+            if match is None:
+                result[name] = None
+            elif match.group(1) in (b"[", b"{"):
+                # Nested values need a real JSON parse
+                return self._pick(raw, names)
+            else:
+                result[name] = _json_value(match.group(1))
+        return self._normalize(result)
+
+    def current(self, raw: memoryview, names: Iterable[str]) -> Optional[dict]:
+        """fields() with the archive's latest edit applied; None for a deleted message"""
+        names = tuple(names)
+        if not self.changes:
+            return self.fields(raw, names)
+        data = self.fields(raw, names if "msg_id" in names else names + ("msg_id",))
+        if apply_change(data, self.changes) is None:
+            return None
+        return data if "msg_id" in names else {name: data[name] for name in names}
+
+    def _pick(self, raw: memoryview, names: Tuple[str, ...]) -> dict:
+        data = json.loads(str(raw, "utf-8"))
+        keys = JSON_KEYS[self.format]
+        return self._normalize({name: data.get(keys[name]) for name in names})
+
+    def _normalize(self, result: dict) -> dict:
+        """Turn raw JSON values into record values (epoch ts, entity dicts, defaults)"""
+        if self.format == "jsonl" and result.get("ts") is not None:
+            result["ts"] = records.parse_date(result["ts"])
+        if "text" in result and result["text"] is None:
+            result["text"] = ""
+        if "entities" in result:
+            entities = result["entities"] or []
+            result["entities"] = records.expand_entities(entities) if self.format == "compact" else entities
+        return result
+
+    def write_records(self, out) -> int:
+        """Append every complete record to an open binary file (without a file header)"""
+        count = 0
+        if self.format == "binary":
+            out.write(self.data[self.start:self.end])
+            for _ in self.records():
+                count += 1
+            return count
+        for offset, raw in self.records():
+            out.write(raw)
+            out.write(b"\n")
+            count += 1
+        return count
+
+
+def read_records(path: Path) -> Iterator[dict]:
+    """Yield fully decoded records from an export in any format"""
+    if not Path(path).exists():
+        return
+    with ExportReader(path) as reader:
+        for offset, raw in reader:
+            record = apply_change(reader.decode(raw), reader.changes)
+            if record is not None:
+                yield record
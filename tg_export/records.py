@@ -0,0 +1,295 @@
+"""Export record formats.
+
+Three on-disk encodings share one in-memory record: a dict with msg_id,
+chat_id, ts (epoch seconds, UTC), sender_id, sender_username, reply_to,
+text, entities, media_type and media_file_id.
+
+- jsonl:   the original schema (v1), one JSON object per line with an ISO
+           date string and entities as a list of dicts.
+- compact: schema v2, one JSON object per line with short keys, an epoch
+           timestamp, no null fields and entities as [code, offset,
+           length(, extra)] lists.
+- binary:  a "TGX2" file header followed by length-prefixed and
+           length-suffixed frames, so a file can be read from either end.
+
+tg_export.reader detects the format, so every tool accepts any of them.
+"""
+import json
+import struct
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+FORMATS = ("jsonl", "compact", "binary")
+DEFAULT_FORMAT = "jsonl"
+
+MAGIC = b"TGX2"
+LENGTH = struct.Struct("<I")
+HEAD = struct.Struct("<BqqqqqBIIIH")  # flags, ids, ts, reply, media, string lengths, entity count
+ENTITY = struct.Struct("<BII")        # type, offset, length
+
+HAS_SENDER = 1
+HAS_REPLY = 2
+HAS_USERNAME = 4
+HAS_MEDIA_ID = 8
+
+MEDIA_TYPES = (None, "photo", "video", "doc")
+# Binary type numbers are positions in ENTITY_TYPES, so new types only ever go at the end
+ENTITY_TYPES = ("bold", "italic", "code", "pre", "text_url", "underline", "strike", "spoiler", "blockquote",
+                "mention", "mention_name", "hashtag", "cashtag", "bot_command", "url", "email", "phone",
+                "bank_card", "custom_emoji", "formatted_date", "diff_insert", "diff_delete", "diff_replace",
+                "unknown")
+ENTITY_CODES = {"bold": "b", "italic": "i", "code": "c", "pre": "p", "text_url": "u", "underline": "_",
+                "strike": "s", "spoiler": "x", "blockquote": "q", "mention": "@", "mention_name": "m",
+                "hashtag": "#", "cashtag": "$", "bot_command": "/", "url": "l", "email": "e", "phone": "t",
+                "bank_card": "k", "custom_emoji": "j", "formatted_date": "d", "diff_insert": "+",
+                "diff_delete": "-", "diff_replace": "r", "unknown": "?"}
+ENTITY_NAMES = {code: name for name, code in ENTITY_CODES.items()}
+ENTITY_NUMBERS = {name: number for number, name in enumerate(ENTITY_TYPES)}
+# The one optional field an entity type carries besides offset and length, and how the binary format stores it
+ENTITY_EXTRAS = {"text_url": ("url", "str"), "pre": ("language", "str"), "blockquote": ("collapsed", "flag"),
+                 "mention_name": ("user_id", "int"), "custom_emoji": ("document_id", "int"),
+                 "formatted_date": ("date", "int"), "diff_replace": ("old_text", "str")}
+# Binary entities always followed by their extra, from before HAS_EXTRA existed
+URL_ENTITIES = {"text_url"}
+# Set on a binary entity's type number when its extra follows
+HAS_EXTRA = 0x80
+INT_EXTRA = struct.Struct("<q")
+UTC_SUFFIXES = ("+00:00Z", "+00:00+00:00", "+00:00", "Z", "")
+
+
+@lru_cache(maxsize=4096)
+def _iso_minute(minute: int) -> str:
+    return datetime.fromtimestamp(minute * 60, timezone.utc).isoformat()[:16]
+
+
+def _iso_date(ts: int) -> str:
+    # Messages share minutes, so only the seconds are formatted per record
+    return f"{_iso_minute(ts // 60)}:{ts % 60:02d}+00:00Z"
+
+
+@lru_cache(maxsize=4096)
+def _minute_epoch(minute: str) -> int:
+    return int(datetime.fromisoformat(minute + ":00+00:00").timestamp())
+
+
+def parse_date(value: str) -> int:
+    """Epoch seconds from a v1 date ("...+00:00Z", older exports had "+00:00+00:00")"""
+    # Fast path for the UTC dates dump writes: messages share minutes, so cache those
+    if value[19:] in UTC_SUFFIXES and value[16:17] == ":":
+        return _minute_epoch(value[:16]) + int(value[17:19])
+    value = value.rstrip("Z")
+    if value.endswith("+00:00+00:00"):
+        value = value[:-6]
+    date = datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp())
+
+
+def compact_entities(entities: list) -> list:
+    compact = []
+    for entity in entities:
+        name = entity["type"]
+        item = [ENTITY_CODES.get(name, name), entity["offset"], entity["length"]]
+        extra = ENTITY_EXTRAS.get(name)
+        if extra is not None and extra[0] in entity:
+            item.append(entity[extra[0]])
+        compact.append(item)
+    return compact
+
+
+def expand_entities(compact: list) -> list:
+    entities = []
+    for item in compact:
+        name = ENTITY_NAMES.get(item[0], item[0])
+        entity = {"type": name, "offset": item[1], "length": item[2]}
+        if len(item) > 3:
+            entity[ENTITY_EXTRAS.get(name, ("url",))[0]] = item[3]
+        entities.append(entity)
+    return entities
+
+
+def _encode_entity(entity: dict) -> bytes:
+    name = entity["type"]
+    number = ENTITY_NUMBERS[name]
+    extra = ENTITY_EXTRAS.get(name)
+    if extra is None or (extra[0] not in entity and name not in URL_ENTITIES):
+        return ENTITY.pack(number, entity["offset"], entity["length"])
+
+    field, kind = extra
+    if name not in URL_ENTITIES:
+        number |= HAS_EXTRA
+    head = ENTITY.pack(number, entity["offset"], entity["length"])
+    if kind == "str":
+        value = entity.get(field, "").encode("utf-8")
+        return head + LENGTH.pack(len(value)) + value
+    if kind == "int":
+        return head + INT_EXTRA.pack(entity[field])
+    return head
+
+
+def encode_v1(record: dict) -> bytes:
+    data = {
+        "msg_id": record["msg_id"],
+        "chat_id": record["chat_id"],
+        "date": _iso_date(record["ts"]),
+        "sender_id": record["sender_id"],
+        "sender_username": record["sender_username"],
+        "reply_to": record["reply_to"],
+        "text": record["text"],
+        "entities": record["entities"],
+        "media_type": record["media_type"],
+        "media_file_id": record["media_file_id"],
+    }
+    return (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def encode_compact(record: dict) -> bytes:
+    data = {"v": 2, "id": record["msg_id"], "chat": record["chat_id"], "ts": record["ts"]}
+    if record["sender_id"] is not None:
+        data["from"] = record["sender_id"]
+    if record["sender_username"]:
+        data["user"] = record["sender_username"]
+    if record["reply_to"]:
+        data["re"] = record["reply_to"]
+    if record["text"]:
+        data["text"] = record["text"]
+    if record["entities"]:
+        data["ent"] = compact_entities(record["entities"])
+    if record["media_type"]:
+        data["media"] = record["media_type"]
+    if record["media_file_id"]:
+        data["fid"] = record["media_file_id"]
+    return (json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def encode_binary(record: dict) -> bytes:
+    username = (record["sender_username"] or "").encode("utf-8")
+    text = (record["text"] or "").encode("utf-8")
+    media_id = (record["media_file_id"] or "").encode("utf-8")
+    flags = ((HAS_SENDER if record["sender_id"] is not None else 0)
+             | (HAS_REPLY if record["reply_to"] else 0)
+             | (HAS_USERNAME if record["sender_username"] is not None else 0)
+             | (HAS_MEDIA_ID if record["media_file_id"] is not None else 0))
+    entities = record["entities"] or []
+
+    parts = [HEAD.pack(flags, record["msg_id"], record["chat_id"], record["ts"], record["sender_id"] or 0,
+                       record["reply_to"] or 0, MEDIA_TYPES.index(record["media_type"]),
+                       len(username), len(text), len(media_id), len(entities)),
+             username, text, media_id]
+    parts.extend(_encode_entity(entity) for entity in entities)
+
+    payload = b"".join(parts)
+    length = LENGTH.pack(len(payload))
+    return length + payload + length
+
+
+ENCODERS = {"jsonl": encode_v1, "compact": encode_compact, "binary": encode_binary}
+
+
+def encode(record: dict, fmt: str = DEFAULT_FORMAT) -> bytes:
+    return ENCODERS[fmt](record)
+
+
+def header(fmt: str) -> bytes:
+    """Bytes that start a new file in this format"""
+    return MAGIC if fmt == "binary" else b""
+
+
+def decode_json(data: dict) -> dict:
+    """Normalize a parsed JSONL object of any schema version"""
+    if data.get("v") == 2:
+        return {
+            "msg_id": data["id"],
+            "chat_id": data["chat"],
+            "ts": data["ts"],
+            "sender_id": data.get("from"),
+            "sender_username": data.get("user"),
+            "reply_to": data.get("re"),
+            "text": data.get("text", ""),
+            "entities": expand_entities(data.get("ent", [])),
+            "media_type": data.get("media"),
+            "media_file_id": data.get("fid"),
+        }
+    return {
+        "msg_id": data.get("msg_id"),
+        "chat_id": data.get("chat_id"),
+        "ts": parse_date(data["date"]) if data.get("date") else None,
+        "sender_id": data.get("sender_id"),
+        "sender_username": data.get("sender_username"),
+        "reply_to": data.get("reply_to"),
+        "text": data.get("text") or "",
+        "entities": data.get("entities") or [],
+        "media_type": data.get("media_type"),
+        "media_file_id": data.get("media_file_id"),
+    }
+
+
+def decode_line(line) -> dict:
+    return decode_json(json.loads(line))
+
+
+def decode_frame(payload) -> dict:
+    """Decode one binary frame payload (without its length prefix and suffix)"""
+    (flags, msg_id, chat_id, ts, sender_id, reply_to, media,
+     username_len, text_len, media_id_len, entity_count) = HEAD.unpack_from(payload, 0)
+    pos = HEAD.size
+    username = bytes(payload[pos:pos + username_len]).decode("utf-8")
+    pos += username_len
+    text = bytes(payload[pos:pos + text_len]).decode("utf-8")
+    pos += text_len
+    media_id = bytes(payload[pos:pos + media_id_len]).decode("utf-8")
+    pos += media_id_len
+
+    entities = []
+    for _ in range(entity_count):
+        number, offset, length = ENTITY.unpack_from(payload, pos)
+        pos += ENTITY.size
+        name = ENTITY_TYPES[number & ~HAS_EXTRA]
+        entity = {"type": name, "offset": offset, "length": length}
+        if number & HAS_EXTRA or name in URL_ENTITIES:
+            field, kind = ENTITY_EXTRAS[name]
+            if kind == "str":
+                (size,) = LENGTH.unpack_from(payload, pos)
+                pos += LENGTH.size
+                entity[field] = bytes(payload[pos:pos + size]).decode("utf-8")
+                pos += size
+            elif kind == "int":
+                (entity[field],) = INT_EXTRA.unpack_from(payload, pos)
+                pos += INT_EXTRA.size
+            else:
+                entity[field] = True
+        entities.append(entity)
+
+    return {
+        "msg_id": msg_id,
+        "chat_id": chat_id,
+        "ts": ts,
+        "sender_id": sender_id if flags & HAS_SENDER else None,
+        "sender_username": username if flags & HAS_USERNAME else None,
+        "reply_to": reply_to if flags & HAS_REPLY else None,
+        "text": text,
+        "entities": entities,
+        "media_type": MEDIA_TYPES[media],
+        "media_file_id": media_id if flags & HAS_MEDIA_ID else None,
+    }
+
+
+def detect_format(path: Path) -> Optional[str]:
+    """Format of an existing export, or None if it is missing or empty"""
+    try:
+        with open(path, "rb") as f:
+            start = f.read(len(MAGIC))
+            if not start:
+                return None
+            if start == MAGIC:
+                return "binary"
+            line = start + f.readline()
+    except OSError:
+        return None
+    try:
+        return "compact" if json.loads(line).get("v") == 2 else "jsonl"
+    except ValueError:
+        return "jsonl"
@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import json
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+from telethon.errors import FloodWaitError
+
+from . import metrics
+from .cli import dump_messages, get_last_message_id, parse_chat_url
+from .peers import ACCESS_ERRORS, PeerCache, resolve_chat
+from .records import DEFAULT_FORMAT
+
+# Polling bounds for followed chats
+MIN_INTERVAL = 300        # Never poll a chat more than every 5 minutes
+MAX_INTERVAL = 6 * 3600   # Even dead chats get checked every 6 hours
+TARGET_PER_POLL = 50      # Aim for roughly this many new messages per poll
+RATE_SMOOTHING = 0.3      # Weight of the latest observation in the message rate
+DEFAULT_BUDGET = 240      # Polls per hour across all chats
+
+
+def update_rate(rate: Optional[float], count: int, elapsed: float, smoothing: float = RATE_SMOOTHING) -> float:
+    """Exponentially smoothed message rate (messages/second)"""
+    observed = count / elapsed if elapsed > 0 else 0.0
+    if rate is None:
+        return observed
+    return smoothing * observed + (1 - smoothing) * rate
+
+
+def next_interval(rate: Optional[float], min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL) -> float:
+    """Seconds until the next poll: busy chats often, quiet chats rarely"""
+    if not rate:
+        return max_interval
+    return min(max_interval, max(min_interval, TARGET_PER_POLL / rate))
+
+
+class RequestBudget:
+    """Token bucket limiting how many polls run per hour across all chats"""
+
+    def __init__(self, per_hour: int):
+        self.capacity = max(1, per_hour)
+        self.tokens = float(self.capacity)
+        self.refill = per_hour / 3600
+        self.updated = time.monotonic()
+
+    async def take(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.refill)
+
+
+def load_config(path: Path) -> dict:
+    """Read a follow config: {"chats": [{"chat_url": ..., "out": ...}], ...}"""
+    config = json.loads(path.read_text())
+    if not config.get("chats"):
+        raise click.ClickException(f"No chats listed in {path}")
+    for chat in config["chats"]:
+        if "chat_url" not in chat or "out" not in chat:
+            raise click.ClickException("Each chat needs a 'chat_url' and an 'out' file")
+    return config
+
+
+class FollowScheduler:
+    """Follows many chats from one client, polling each by its activity.
+
+    Per-chat cursors and message rates are saved to the state file after
+    every poll, so restarts pick up where they left off.
+    """
+
+    def __init__(self, client, chats: List[dict], state_file: Path, budget: int = DEFAULT_BUDGET,
+                 min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL, peers: Optional[PeerCache] = None):
+        self.client = client
+        self.peers = peers
+        self.chats = {chat["chat_url"]: chat for chat in chats}
+        self.state_file = state_file
+        self.budget = RequestBudget(budget)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.entities: Dict[str, object] = {}
+        self.state: Dict[str, dict] = json.loads(state_file.read_text()) if state_file.exists() else {}
+
+    def save_state(self):
+        tmp = self.state_file.with_name(self.state_file.name + ".tmp")
+        tmp.write_text(json.dumps(self.state, indent=2))
+        tmp.replace(self.state_file)
+
+    async def poll(self, chat_url: str) -> float:
+        """Fetch new messages for one chat and return the delay until its next poll"""
+        chat = self.chats[chat_url]
+        state = self.state.setdefault(chat_url, {"cursor": None, "rate": None, "last_poll": None})
+        output_file = Path(chat["out"])
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+
+        if chat_url not in self.entities:
+            self.entities[chat_url] = await resolve_chat(self.client, parse_chat_url(chat_url), self.peers)
+        entity = self.entities[chat_url]
+
+        cursor = state["cursor"] or get_last_message_id(output_file)
+        if cursor is None and not chat.get("backfill"):
+            # Start following from the newest message instead of exporting history
+            latest = await self.client.get_messages(entity, limit=1)
+            cursor = latest[0].id if latest else 0
+
+        started = time.time()
+        count = await dump_messages(self.client, entity, output_file, min_id=cursor or None, reverse=True,
+                                    record_format=chat.get("format", DEFAULT_FORMAT))
+
+        if count:
+            state["cursor"] = get_last_message_id(output_file)
+        elif cursor:
+            state["cursor"] = cursor
+        if state["last_poll"]:
+            state["rate"] = update_rate(state["rate"], count, started - state["last_poll"])
+        state["last_poll"] = started
+
+        interval = next_interval(state["rate"], self.min_interval, self.max_interval)
+        state["next_poll"] = started + interval
+        self.save_state()
+
+        click.echo(f"[{chat_url}] {count} new messages, next poll in {interval / 60:.0f}m", err=True)
+        return interval
+
+    async def run(self):
+        """Poll chats forever, earliest due first"""
+        now = time.time()
+        queue = [(self.state.get(url, {}).get("next_poll") or now, url) for url in self.chats]
+        heapq.heapify(queue)
+
+        while queue:
+            due, chat_url = heapq.heappop(queue)
+            wait = due - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.budget.take()
+
+            try:
+                interval = await self.poll(chat_url)
+            except FloodWaitError as e:
+                click.echo(f"Rate limited. Pausing all chats for {e.seconds} seconds...", err=True)
+                metrics.record_flood_wait(e.seconds)
+                await asyncio.sleep(e.seconds)
+                interval = self.min_interval
+            except ACCESS_ERRORS as e:
+                # Resolve the chat again next time, in case a cached peer went stale
+                self.entities.pop(chat_url, None)
+                if self.peers is not None:
+                    self.peers.invalidate(parse_chat_url(chat_url))
+                click.echo(f"[{chat_url}] Cannot access chat: {e}", err=True)
+                interval = self.max_interval
+            except Exception as e:
+                click.echo(f"[{chat_url}] Sync error: {e}", err=True)
+                interval = self.max_interval
+
+            # Jitter keeps polls from lining up into predictable bursts
+            heapq.heappush(queue, (time.time() + interval + random.uniform(0, 30), chat_url))
+            metrics.REGISTRY.flush()
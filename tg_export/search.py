@@ -0,0 +1,242 @@
+"""Full-text search over an export through a persistent inverted index.
+
+The index lives next to the archive in <archive>.idx.sqlite: one row per
+record (byte offset, msg_id, ts, sender) plus token -> offset postings.
+Exports only ever grow at the end, so an update indexes the bytes added
+since the last one; a rewritten file is indexed again from scratch.
+Queries never scan the archive, they read the matching records by offset.
+Edits and deletions from `reconcile` are applied to the affected records.
+"""
+import calendar
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import click
+
+from .changes import DELETE, EDIT, changes_path, read_changes
+from .clean_export import CLEAN_FIELDS, clean_messages, format_clean_line, new_stats
+from .reader import ExportReader
+
+INDEX_SUFFIX = ".idx.sqlite"
+INDEX_VERSION = "1"
+INDEX_FIELDS = ('msg_id', 'ts', 'sender_id', 'sender_username', 'text')
+# Bytes at the start of the archive remembered to notice a rewritten file
+HEAD_BYTES = 64
+# Rows buffered between inserts while indexing
+INSERT_BATCH = 10000
+TOKEN = re.compile(r"\w+")
+DATE_FORMATS = ['%Y-%m-%d', '%Y-%m-%d %H:%M']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS messages (offset INTEGER PRIMARY KEY, msg_id INTEGER, ts INTEGER, sender_id INTEGER, username TEXT);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts);
+CREATE INDEX IF NOT EXISTS messages_username ON messages (username, ts);
+CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender_id, ts);
+CREATE INDEX IF NOT EXISTS messages_msg_id ON messages (msg_id);
+CREATE TABLE IF NOT EXISTS postings (token TEXT, offset INTEGER, PRIMARY KEY (token, offset)) WITHOUT ROWID;
+"""
+
+
+def tokenize(text: str) -> Set[str]:
+    return set(TOKEN.findall(text.casefold()))
+
+
+def index_path(archive: Path) -> Path:
+    archive = Path(archive)
+    return archive.with_name(archive.name + INDEX_SUFFIX)
+
+
+def epoch(date: Optional[datetime]) -> Optional[int]:
+    """Epoch seconds of a naive UTC datetime"""
+    return calendar.timegm(date.timetuple()) if date else None
+
+
+class SearchIndex:
+    """The inverted index of one export file"""
+
+    def __init__(self, archive: Path):
+        self.archive = Path(archive)
+        self.path = index_path(self.archive)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+        if self._meta("version") not in (None, INDEX_VERSION):
+            self.reset()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, **values):
+        self.db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                            [(key, str(value)) for key, value in values.items()])
+
+    def reset(self):
+        with self.db:
+            self.db.execute("DELETE FROM messages")
+            self.db.execute("DELETE FROM postings")
+            self.db.execute("DELETE FROM meta")
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def _is_stale(self, reader: ExportReader) -> bool:
+        """Whether the archive was rewritten rather than appended to since the last update"""
+        head = self._meta("head")
+        if head is None:
+            return False
+        indexed = int(self._meta("end"))
+        changes = changes_path(self.archive)
+        changes_size = changes.stat().st_size if changes.exists() else 0
+        return (self._meta("format") != reader.format or indexed > reader.size
+                or bytes(reader.data[:len(head) // 2]).hex() != head
+                or int(self._meta("changes_end") or 0) > changes_size)
+
+    def update(self) -> int:
+        """Index records added to the archive since the last update; returns how many"""
+        with ExportReader(self.archive) as reader:
+            if self._is_stale(reader):
+                self.reset()
+            indexed = int(self._meta("end") or reader.start)
+            end = reader.complete_end()
+
+            count = 0
+            messages, postings = [], []
+            with self.db:
+                for offset, raw in reader.records(indexed):
+                    if offset >= end:
+                        break
+                    data = reader.current(raw, INDEX_FIELDS)
+                    if data is None:
+                        continue
+                    username = data['sender_username'].casefold() if data['sender_username'] else None
+                    messages.append((offset, data['msg_id'], data['ts'], data['sender_id'], username))
+                    postings.extend((token, offset) for token in tokenize(data['text']))
+                    count += 1
+                    if len(messages) >= INSERT_BATCH:
+                        self._insert(messages, postings)
+                        messages, postings = [], []
+                self._insert(messages, postings)
+                self._set_meta(version=INDEX_VERSION, format=reader.format, end=end,
+                               head=bytes(reader.data[:min(HEAD_BYTES, end)]).hex())
+                self._apply_changes(reader)
+        return count
+
+    def _apply_changes(self, reader: ExportReader):
+        """Reindex the messages edited or deleted since the last update"""
+        applied = int(self._meta("changes_end") or 0)
+        changes = list(read_changes(self.archive))
+        if not changes or changes[-1][0] <= applied:
+            return
+        changed = {change["id"] for end, change in changes if end > applied}
+        # A message may be indexed under its archived text or any earlier edit
+        seen = {msg_id: set() for msg_id in changed}
+        latest = {}
+        for end, change in changes:
+            if change["id"] in changed:
+                latest[change["id"]] = change
+                if change["op"] == EDIT:
+                    seen[change["id"]] |= tokenize(change["text"])
+
+        for msg_id in changed:
+            for (offset,) in self.db.execute("SELECT offset FROM messages WHERE msg_id = ?", (msg_id,)).fetchall():
+                tokens = seen[msg_id] | tokenize(reader.fields(reader.record_at(offset), ('text',))['text'])
+                self.db.executemany("DELETE FROM postings WHERE token = ? AND offset = ?", [(token, offset) for token in tokens])
+                if latest[msg_id]["op"] == DELETE:
+                    self.db.execute("DELETE FROM messages WHERE offset = ?", (offset,))
+                else:
+                    self.db.executemany("INSERT OR IGNORE INTO postings VALUES (?, ?)",
+                                        [(token, offset) for token in tokenize(latest[msg_id]["text"])])
+        self._set_meta(changes_end=changes[-1][0])
+
+    def _insert(self, messages: list, postings: list):
+        self.db.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)", messages)
+        self.db.executemany("INSERT OR IGNORE INTO postings VALUES (?, ?)", postings)
+
+    def offsets_by_id(self, low: int, high: int) -> Dict[int, int]:
+        """msg_id -> offset for the indexed records with ids in [low, high]"""
+        return dict(self.db.execute("SELECT msg_id, offset FROM messages WHERE msg_id BETWEEN ? AND ?", (low, high)))
+
+    def search(self, words: Iterable[str] = (), user: Optional[str] = None, since: Optional[int] = None,
+               until: Optional[int] = None, limit: int = 50) -> List[int]:
+        """Offsets of the newest records containing every word, optionally by user and in [since, until)"""
+        return [offset for ts, offset in self.page(words, user, since, until, limit)]
+
+    def page(self, words: Iterable[str] = (), user: Optional[str] = None, since: Optional[int] = None,
+             until: Optional[int] = None, limit: int = 50, before: Optional[Tuple[int, int]] = None) -> List[Tuple[int, int]]:
+        """(ts, offset) of matching records, newest first, starting after the (ts, offset) before"""
+        clauses, params = [], []
+        tokens = sorted(set().union(*(tokenize(word) for word in words)))
+        if tokens:
+            clauses.append("offset IN (" + " INTERSECT ".join(["SELECT offset FROM postings WHERE token = ?"] * len(tokens)) + ")")
+            params += tokens
+        if user:
+            user = user.lstrip('@')
+            if user.startswith("user_") and user[5:].isdigit():
+                clauses.append("sender_id = ?")
+                params.append(int(user[5:]))
+            else:
+                clauses.append("username = ?")
+                params.append(user.casefold())
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        if before is not None:
+            clauses.append("(ts < ? OR (ts = ? AND offset < ?))")
+            params += [before[0], before[0], before[1]]
+
+        sql = "SELECT ts, offset FROM messages"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC, offset DESC LIMIT ?"
+        return self.db.execute(sql, params + [limit]).fetchall()
+
+
+def result_lines(reader: ExportReader, offsets: Iterable[int]):
+    """Clean chat log lines for the records at offsets"""
+    rows = ((None, data) for data in (reader.current(reader.record_at(offset), CLEAN_FIELDS) for offset in offsets)
+            if data is not None)
+    for msg in clean_messages(rows, new_stats(), filter_bots=False):
+        yield format_clean_line(msg)
+
+
+@click.command()
+@click.argument('archive', type=click.Path(exists=True, dir_okay=False))
+@click.argument('words', nargs=-1)
+@click.option('--user', help='Only messages from this username (or user_<id>)')
+@click.option('--since', type=click.DateTime(formats=DATE_FORMATS), help='Only messages from this date on (UTC)')
+@click.option('--until', type=click.DateTime(formats=DATE_FORMATS), help='Only messages before this date (UTC)')
+@click.option('--limit', type=int, default=50, show_default=True, help='Show at most this many (newest) matches')
+@click.option('--reindex', is_flag=True, help='Rebuild the index from scratch')
+def search(archive: str, words, user: Optional[str], since: Optional[datetime], until: Optional[datetime], limit: int, reindex: bool):
+    """Search an export by keyword, user and date range"""
+    archive_file = Path(archive)
+    with SearchIndex(archive_file) as index:
+        if reindex:
+            index.reset()
+        added = index.update()
+        if added:
+            click.echo(f"Indexed {added} new messages ({index.path.name})", err=True)
+
+        offsets = index.search(words, user, epoch(since), epoch(until), limit)
+
+    with ExportReader(archive_file) as reader:
+        for line in result_lines(reader, reversed(offsets)):
+            click.echo(line)
+    click.echo(f"{len(offsets)} matches", err=True)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+from .peers import PeerCache, resolve_chat
+
+DEFAULT_SESSION = Path(".session")
+SESSIONS_DIR = Path("sessions")
+# Pool name of DEFAULT_SESSION; never a file under SESSIONS_DIR
+DEFAULT_NAME = "default"
+
+
+def named_session_path(name: str) -> Path:
+    """Path of a named session created with 'tg_export login --session NAME'"""
+    return SESSIONS_DIR / f"{name}.session"
+
+
+def available_sessions() -> List[str]:
+    """List logged-in sessions usable in a pool ('default' is the plain .session file)"""
+    names = []
+    if DEFAULT_SESSION.exists():
+        names.append(DEFAULT_NAME)
+    if SESSIONS_DIR.is_dir():
+        # sessions/default.session would be opened as .session, so it is not listed
+        names.extend(sorted(p.stem for p in SESSIONS_DIR.glob("*.session") if p.stem != DEFAULT_NAME))
+    return names
+
+
+def session_path(name: Optional[str]) -> Path:
+    """Resolve a session name to its file"""
+    if not name or name == DEFAULT_NAME:
+        return DEFAULT_SESSION
+    return named_session_path(name)
+
+
+def split_id_range(low: int, high: int, shards: int) -> List[Tuple[int, int]]:
+    """Split the message id range (low, high] into contiguous shards"""
+    if high <= low:
+        return []
+    shards = max(1, min(shards, high - low))
+    step = (high - low) / shards
+    bounds = [low + round(step * i) for i in range(shards)] + [high]
+    return [(bounds[i], bounds[i + 1]) for i in range(shards) if bounds[i] < bounds[i + 1]]
+
+
+class SessionPool:
+    """Rotates work across several logged-in Telegram clients.
+
+    A session hit by a FloodWaitError is taken out of rotation until its
+    wait expires, so the other accounts keep working in the meantime.
+    """
+
+    def __init__(self, clients: Dict[str, object], peers: Optional[Dict[str, PeerCache]] = None):
+        self.clients = clients
+        self.names = list(clients)
+        self.peers = peers or {}
+        self.entities: Dict[Tuple[str, object], object] = {}
+        self._resolved = set()  # (session, chat) looked up over the network this run
+        self._busy = set()
+        self._blocked_until: Dict[str, float] = {}
+        self._next = 0
+        self._released = asyncio.Event()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _available(self, now: float) -> Optional[str]:
+        for i in range(len(self.names)):
+            name = self.names[(self._next + i) % len(self.names)]
+            if name not in self._busy and self._blocked_until.get(name, 0) <= now:
+                self._next = (self._next + i + 1) % len(self.names)
+                return name
+        return None
+
+    async def acquire(self) -> Tuple[str, object]:
+        """Wait for a session that is neither busy nor flood-waited"""
+        while True:
+            now = time.monotonic()
+            name = self._available(now)
+            if name:
+                self._busy.add(name)
+                return name, self.clients[name]
+
+            waits = [until - now for n, until in self._blocked_until.items()
+                     if n not in self._busy and until > now]
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), timeout=min(waits) if waits else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, name: str):
+        self._busy.discard(name)
+        self._released.set()
+
+    def flood_wait(self, name: str, seconds: float):
+        """Take a session out of rotation for the given number of seconds"""
+        metrics.record_flood_wait(seconds)
+        self._blocked_until[name] = time.monotonic() + seconds
+
+    def blocked(self, name: str) -> float:
+        """Seconds left before a flood-waited session is usable again"""
+        return max(0.0, self._blocked_until.get(name, 0) - time.monotonic())
+
+    async def get_entity(self, name: str, identifier):
+        """Resolve a chat for one session (access hashes differ per account)"""
+        key = (name, identifier)
+        if key not in self.entities:
+            peers = self.peers.get(name)
+            if peers is None or identifier not in peers:
+                self._resolved.add(key)
+            self.entities[key] = await resolve_chat(self.clients[name], identifier, peers)
+        return self.entities[key]
+
+    def forget_entity(self, name: str, identifier) -> bool:
+        """Drop a session's resolved chat; returns whether it came from the peer cache"""
+        key = (name, identifier)
+        self.entities.pop(key, None)
+        peers = self.peers.get(name)
+        if peers is None or key in self._resolved:
+            return False
+        return peers.invalidate(identifier)
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.disconnect()
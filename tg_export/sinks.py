@@ -0,0 +1,169 @@
+"""Destinations for dumped records.
+
+dump_messages hands each batch of encoded records to a sink from its
+writer thread, so a slow sink (a full pipe, a busy webhook) blocks that
+thread and backpressure reaches the fetcher through the dump's bounded
+queues. Every sink remembers the newest message id it delivered, which
+is the cursor for the next incremental dump.
+"""
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import List, Optional
+
+from . import records
+
+# Webhook batches are posted once they reach either bound
+WEBHOOK_BATCH = 500                # records
+WEBHOOK_BATCH_BYTES = 1024 * 1024
+WEBHOOK_BATCH_SECONDS = 5.0
+WEBHOOK_RETRIES = 5
+WEBHOOK_BACKOFF = 0.5              # seconds, doubled after every failed attempt
+WEBHOOK_TIMEOUT = 30.0
+
+
+def _newest(last_id: Optional[int], batch: List[dict]) -> Optional[int]:
+    newest = max(record["msg_id"] for record in batch)
+    return newest if last_id is None else max(last_id, newest)
+
+
+def close_stdout():
+    """Point stdout at devnull once its reader has gone, so the exit-time flush does not fail again"""
+    try:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+    except (OSError, ValueError):
+        # Not a real file descriptor (e.g. captured in tests)
+        pass
+
+
+class FileSink:
+    """Records appended to (or written over) an export file"""
+
+    def __init__(self, path: Path, append: bool = False, record_format: str = records.DEFAULT_FORMAT):
+        if append:
+            record_format = records.detect_format(path) or record_format
+        self.record_format = record_format
+        self.file = open(path, 'ab' if append else 'wb')
+        self.start = self.file.tell()
+        if self.start == 0:
+            self.file.write(records.header(record_format))
+        self.last_id = None
+
+    @property
+    def bytes_written(self) -> int:
+        return self.file.tell() - self.start
+
+    def write(self, batch: List[dict], data: bytes):
+        self.file.write(data)
+        self.last_id = _newest(self.last_id, batch)
+
+    def close(self):
+        self.file.close()
+
+
+class StreamSink:
+    """Records written to a binary stream such as stdout, flushed every batch"""
+
+    def __init__(self, stream, record_format: str = records.DEFAULT_FORMAT):
+        self.stream = stream
+        self.record_format = record_format
+        self.bytes_written = 0
+        self.last_id = None
+
+    def write(self, batch: List[dict], data: bytes):
+        if self.bytes_written == 0:
+            data = records.header(self.record_format) + data
+        self.stream.write(data)
+        self.stream.flush()
+        self.bytes_written += len(data)
+        self.last_id = _newest(self.last_id, batch)
+
+    def close(self):
+        try:
+            self.stream.flush()
+        except BrokenPipeError:
+            pass
+
+
+class WebhookSink:
+    """Records POSTed as NDJSON in batches bounded by count, bytes and age.
+
+    The age bound is checked as records arrive; close() posts whatever is
+    left. Failed posts (connection errors, 429 and 5xx responses) are
+    retried with exponential backoff, honouring Retry-After.
+    """
+
+    def __init__(self, url: str, record_format: str = records.DEFAULT_FORMAT, batch_size: int = WEBHOOK_BATCH,
+                 batch_bytes: int = WEBHOOK_BATCH_BYTES, batch_seconds: float = WEBHOOK_BATCH_SECONDS,
+                 retries: int = WEBHOOK_RETRIES, backoff: float = WEBHOOK_BACKOFF, timeout: float = WEBHOOK_TIMEOUT):
+        if record_format == "binary":
+            raise ValueError("Webhooks receive NDJSON; use the jsonl or compact format")
+        self.url = url
+        self.record_format = record_format
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.batch_seconds = batch_seconds
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bytes_written = 0
+        self.batches = 0
+        self.last_id = None
+        self._buffer = []
+        self._buffered = 0
+        self._buffered_bytes = 0
+        self._buffered_last_id = None
+        self._started = 0.0
+
+    def write(self, batch: List[dict], data: bytes):
+        if not self._buffer:
+            self._started = time.monotonic()
+        self._buffer.append(data)
+        self._buffered += len(batch)
+        self._buffered_bytes += len(data)
+        self._buffered_last_id = _newest(self._buffered_last_id, batch)
+        if (self._buffered >= self.batch_size or self._buffered_bytes >= self.batch_bytes
+                or time.monotonic() - self._started >= self.batch_seconds):
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        body = b"".join(self._buffer)
+        self._post(body)
+        self.bytes_written += len(body)
+        self.batches += 1
+        self.last_id = self._buffered_last_id if self.last_id is None else max(self.last_id, self._buffered_last_id)
+        self._buffer = []
+        self._buffered = 0
+        self._buffered_bytes = 0
+
+    def _post(self, body: bytes):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            request = urllib.request.Request(self.url, data=body, method="POST",
+                                             headers={"Content-Type": "application/x-ndjson"})
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout):
+                    return
+            except urllib.error.HTTPError as e:
+                if e.code != 429 and e.code < 500:
+                    raise
+                if attempt == self.retries:
+                    raise
+                retry_after = e.headers.get("Retry-After", "")
+                wait = float(retry_after) if retry_after.isdigit() else delay
+            except OSError:
+                # Connection refused, reset or timed out (URLError is an OSError)
+                if attempt == self.retries:
+                    raise
+                wait = delay
+            time.sleep(wait)
+            delay *= 2
+
+    def close(self):
+        self.flush()
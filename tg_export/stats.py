@@ -0,0 +1,147 @@
+"""Activity analytics for an export in one streaming pass.
+
+ChatStats holds only counters (per user, per UTC hour, bots), so memory
+does not grow with the archive, and partial results from byte ranges of
+the file merge into the same totals a single pass would give. Large
+exports are split into ranges counted in a process pool.
+"""
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+
+import click
+
+from .clean_export import is_bot_message
+from .reader import ExportReader
+from .threads import display_name
+
+STATS_FIELDS = ('ts', 'sender_id', 'sender_username', 'text')
+# Exports smaller than this are counted in-process
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+DEFAULT_TOP = 10
+
+
+class ChatStats:
+    """Mergeable activity counts for all or part of an export"""
+
+    def __init__(self):
+        self.total = 0
+        self.bots = 0
+        self.users = Counter()
+        self.hours = [0] * 24
+        self.first_ts = None
+        self.last_ts = None
+
+    def add(self, data: dict):
+        self.total += 1
+        if is_bot_message(data['sender_username'], data['text']):
+            self.bots += 1
+        self.users[display_name(data)] += 1
+        ts = data['ts']
+        if ts is not None:
+            self.hours[ts // 3600 % 24] += 1
+            if self.first_ts is None or ts < self.first_ts:
+                self.first_ts = ts
+            if self.last_ts is None or ts > self.last_ts:
+                self.last_ts = ts
+
+    def merge(self, other: "ChatStats") -> "ChatStats":
+        self.total += other.total
+        self.bots += other.bots
+        self.users.update(other.users)
+        self.hours = [a + b for a, b in zip(self.hours, other.hours)]
+        for ts in (other.first_ts, other.last_ts):
+            if ts is not None:
+                self.first_ts = ts if self.first_ts is None else min(self.first_ts, ts)
+                self.last_ts = ts if self.last_ts is None else max(self.last_ts, ts)
+        return self
+
+    def to_dict(self, top: int = DEFAULT_TOP) -> dict:
+        return {
+            'total': self.total,
+            'bots': self.bots,
+            'bot_share': round(self.bots / self.total, 4) if self.total else 0.0,
+            'users': len(self.users),
+            'first': _utc(self.first_ts),
+            'last': _utc(self.last_ts),
+            'top_posters': [{'user': user, 'messages': count} for user, count in self.users.most_common(top)],
+            'per_hour': {f"{hour:02d}": count for hour, count in enumerate(self.hours)},
+        }
+
+    def write_csv(self, out, top: int = DEFAULT_TOP):
+        """Write metric,key,value rows"""
+        writer = csv.writer(out)
+        writer.writerow(['metric', 'key', 'value'])
+        summary = self.to_dict(top)
+        for key in ('total', 'bots', 'bot_share', 'users', 'first', 'last'):
+            writer.writerow([key, '', summary[key]])
+        for poster in summary['top_posters']:
+            writer.writerow(['messages_by_user', poster['user'], poster['messages']])
+        for hour, count in summary['per_hour'].items():
+            writer.writerow(['messages_by_hour', hour, count])
+
+
+def _utc(ts: Optional[int]) -> Optional[str]:
+    return time.strftime('%Y-%m-%d %H:%M', time.gmtime(ts)) if ts is not None else None
+
+
+def count_range(path: Path, start: Optional[int] = None, end: Optional[int] = None) -> ChatStats:
+    """Stats for the records starting in [start, end) of an export (default: all)"""
+    stats = ChatStats()
+    with ExportReader(path) as reader:
+        end = reader.end if end is None else end
+        for offset, raw in reader.records(start):
+            if offset >= end:
+                break
+            data = reader.current(raw, STATS_FIELDS)
+            if data is not None:
+                stats.add(data)
+    return stats
+
+
+def _count_job(job: Tuple[Path, int, int]) -> ChatStats:
+    return count_range(*job)
+
+
+def export_stats(path: Path, workers: int = 1) -> ChatStats:
+    """Stats for a whole export, counting byte ranges in parallel when it is large"""
+    with ExportReader(path) as reader:
+        ranges = reader.split(workers) if workers > 1 and reader.size >= PARALLEL_MIN_BYTES else []
+    if len(ranges) <= 1:
+        return count_range(path)
+
+    stats = ChatStats()
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        for part in pool.map(_count_job, [(path, start, end) for start, end in ranges]):
+            stats.merge(part)
+    return stats
+
+
+@click.command()
+@click.argument('archive', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'output_format', type=click.Choice(['json', 'csv']), default='json', help='Output format')
+@click.option('--out', '-o', type=click.Path(dir_okay=False), help='Output file (default: stdout)')
+@click.option('--top', type=int, default=DEFAULT_TOP, show_default=True, help='Number of top posters to list')
+@click.option('--jobs', '-j', type=int, default=os.cpu_count() or 1, show_default=True, help='Byte ranges counted in parallel')
+def stats(archive: str, output_format: str, out: Optional[str], top: int, jobs: int):
+    """Top posters, messages per hour and bot share for an export"""
+    chat_stats = export_stats(Path(archive), jobs)
+
+    f = open(out, 'w', encoding='utf-8', newline='') if out else sys.stdout
+    try:
+        if output_format == 'csv':
+            chat_stats.write_csv(f, top)
+        else:
+            f.write(json.dumps(chat_stats.to_dict(top), ensure_ascii=False, indent=2) + '\n')
+    finally:
+        if out:
+            f.close()
+
+    if out:
+        click.echo(f"📁 Stats saved to: {out}", err=True)
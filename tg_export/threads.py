@@ -0,0 +1,153 @@
+"""Reply-thread context for clean output.
+
+A reply only carries its parent's id, which tells a reader of the .txt
+nothing. The thread stage keeps msg_id -> (user, text) for a bounded
+window of records around the one being written, so parents are found
+whether the export is newest first or oldest first. Parents outside the
+window come from a per-chat cache that `dump --with-parents` fills with
+batched lookups.
+"""
+from collections import deque
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Set, Tuple
+
+from .reader import ExportReader
+
+# Records kept on each side of the one being written
+THREAD_WINDOW = 2000
+# Quoted parent text is cut to this many characters
+SNIPPET_CHARS = 80
+# Enough raw text to fill a snippet after cleaning, without holding whole messages
+PARENT_TEXT_CHARS = 4 * SNIPPET_CHARS
+PARENT_CACHE_DIR = Path(".cache/parents")
+PARENT_FIELDS = ('msg_id', 'sender_id', 'sender_username', 'text')
+
+
+def display_name(data: dict) -> str:
+    return data['sender_username'] or f"user_{data['sender_id'] or 'unknown'}"
+
+
+def snippet(text: str, limit: int = SNIPPET_CHARS) -> str:
+    """Shorten text to a one-line quote, cutting at a word boundary"""
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0] or text[:limit]
+    return cut + "…"
+
+
+def parent_cache_path(chat_id: int, cache_dir: Path = PARENT_CACHE_DIR) -> Path:
+    return Path(cache_dir) / f"{chat_id}.jsonl"
+
+
+def export_chat_id(path: Path) -> Optional[int]:
+    """Chat id of an export, from its first record"""
+    with ExportReader(path) as reader:
+        first = reader.first()
+        return reader.fields(first, ('chat_id',))['chat_id'] if first is not None else None
+
+
+class ParentIndex:
+    """msg_id -> (user, text) for the most recently added records"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries = {}
+        self._order = deque()
+
+    def __contains__(self, msg_id: int) -> bool:
+        return msg_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, msg_id: int, user: str, text: str):
+        if msg_id in self._entries:
+            return
+        self._entries[msg_id] = (user, text[:PARENT_TEXT_CHARS])
+        self._order.append(msg_id)
+        if len(self._order) > self.size:
+            del self._entries[self._order.popleft()]
+
+    def get(self, msg_id: int) -> Optional[Tuple[str, str]]:
+        return self._entries.get(msg_id)
+
+
+class ParentCache:
+    """Parents fetched from Telegram for one chat, stored as a JSONL export.
+
+    Deleted parents are stored with empty text, so they are not fetched again.
+    """
+
+    def __init__(self, path: Optional[Path]):
+        self.path = Path(path) if path is not None else None
+        self._reader = None
+        self._offsets = {}
+        if self.path is not None and self.path.exists():
+            self._reader = ExportReader(self.path)
+            for offset, raw in self._reader:
+                self._offsets[self._reader.fields(raw, ('msg_id',))['msg_id']] = offset
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, msg_id: int) -> bool:
+        return msg_id in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get(self, msg_id: int) -> Optional[Tuple[str, str]]:
+        if msg_id not in self._offsets:
+            return None
+        data = self._reader.current(self._reader.record_at(self._offsets[msg_id]), PARENT_FIELDS)
+        if data is None:
+            return None
+        return display_name(data), data['text'][:PARENT_TEXT_CHARS]
+
+
+def _attach(row, index: ParentIndex, cache: Optional[ParentCache]):
+    chat, data = row
+    reply_to = data.get('reply_to')
+    if reply_to:
+        parent = index.get(reply_to) or (cache.get(reply_to) if cache is not None else None)
+        if parent is not None:
+            data['parent'] = parent
+    return row
+
+
+def thread_rows(rows: Iterable, cache: Optional[ParentCache] = None, window: int = THREAD_WINDOW) -> Iterator:
+    """Add each reply's parent as data['parent'] = (user, text) to (chat, data) rows.
+
+    Rows are delayed by `window` so parents up to that many records ahead
+    (newest-first exports) or behind (oldest-first) are in the index.
+    """
+    index = ParentIndex(2 * window + 1)
+    pending = deque()
+    for row in rows:
+        data = row[1]
+        index.add(data['msg_id'], display_name(data), data['text'])
+        pending.append(row)
+        if len(pending) > window:
+            yield _attach(pending.popleft(), index, cache)
+    while pending:
+        yield _attach(pending.popleft(), index, cache)
+
+
+def missing_parents(path: Path, window: int = THREAD_WINDOW) -> Set[int]:
+    """Ids of parents the thread stage cannot find within an export"""
+    fields = PARENT_FIELDS + ('reply_to',)
+    missing = set()
+    with ExportReader(path) as reader:
+        rows = ((None, data) for data in (reader.current(raw, fields) for offset, raw in reader) if data is not None)
+        for chat, data in thread_rows(rows, window=window):
+            if data['reply_to'] and 'parent' not in data:
+                missing.add(data['reply_to'])
+    return missing